@@ -0,0 +1,86 @@
+"""Cliente HTTP de la app de Streamlit para el servicio de inferencia (backend/main.py).
+
+Una sola instancia por proceso (`st.cache_resource`): las conexiones se
+reutilizan (keep-alive) entre análisis y cada solicitud tiene tiempos de
+espera acotados. Este módulo no importa TensorFlow.
+"""
+import base64
+import time
+
+import httpx
+
+
+class BackendError(Exception):
+    """Error del servicio. `status_code` es None si no hubo respuesta
+    (conexión rechazada, tiempo agotado); con None o 5xx conviene usar el
+    modelo local, con 4xx el problema es la imagen."""
+
+    def __init__(self, detail, status_code=None):
+        super().__init__(detail)
+        self.detail = detail
+        self.status_code = status_code
+
+    @property
+    def unavailable(self):
+        return self.status_code is None or self.status_code >= 500
+
+
+class InferenceClient:
+    def __init__(self, base_url, timeout=30.0, connect_timeout=3.0, max_connections=4, retry_after=30.0):
+        self.base_url = base_url.rstrip("/")
+        self.client = httpx.Client(
+            base_url=self.base_url,
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        )
+        # Tras un fallo de conexión no se vuelve a intentar durante `retry_after`
+        # segundos: cada análisis iría directo al modelo local sin esperar el timeout
+        self.retry_after = retry_after
+        self._down_until = 0.0
+        # Se desactiva si el backend no ofrece explicaciones (motor tflite o remote)
+        self.explain_supported = True
+
+    def _post(self, path, image_bytes, params=None):
+        if time.monotonic() < self._down_until:
+            raise BackendError(f"{self.base_url} no disponible")
+
+        content_type = "image/png" if image_bytes.startswith(b"\x89PNG") else "image/jpeg"
+        try:
+            response = self.client.post(path, files={"file": ("imagen", image_bytes, content_type)}, params=params)
+        except httpx.HTTPError as e:
+            self._down_until = time.monotonic() + self.retry_after
+            raise BackendError(f"No se pudo contactar {self.base_url}: {e}") from e
+
+        if response.status_code >= 400:
+            # Servicio saturado: no volver a intentar hasta lo que indique Retry-After
+            retry_after = response.headers.get("Retry-After", "")
+            if response.status_code == 503 and retry_after.isdigit():
+                self._down_until = time.monotonic() + int(retry_after)
+            try:
+                detail = response.json().get("detail", response.text)
+            except ValueError:
+                detail = response.text
+            raise BackendError(detail, response.status_code)
+        return response.json()
+
+    def predict(self, image_bytes):
+        """Resultado de /predict: {"is_cacao", "class_name", "confidence", "timestamp"}"""
+        return self._post("/predict", image_bytes)["prediction"]
+
+    def explain(self, image_bytes, mode="gradcam"):
+        """(predicción, superposición JPEG); la superposición es None si el
+        backend no ofrece /explain"""
+        if self.explain_supported:
+            try:
+                data = self._post("/explain", image_bytes, params={"mode": mode})
+            except BackendError as e:
+                if e.status_code != 501:
+                    raise
+                self.explain_supported = False
+            else:
+                overlay = base64.b64decode(data["overlay"].split(",", 1)[1])
+                return data["prediction"], overlay
+        return self.predict(image_bytes), None
+
+    def close(self):
+        self.client.close()
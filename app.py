@@ -1,11 +1,17 @@
 import streamlit as st
-import tensorflow as tf
 import numpy as np
-from PIL import Image
-import cv2 
-import matplotlib.pyplot as plt
+import hashlib
 import time
 import json
+import os
+import sys
+
+# Reutilizar los módulos del backend (inferencia compilada, preprocesamiento y explicaciones)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+# TensorFlow, inference y explain se importan solo si se usa el modelo local
+from api_client import BackendError, InferenceClient
+from preprocessing import make_thumbnail
 
 # -----------------
 # 1. Configuración de la Página
@@ -146,6 +152,18 @@ st.markdown("""
 
 UMBRAL_CONFIANZA_NO_CACO = 70.0
 MODEL_PATH = "cacao_resnet101_classifier3.keras"
+METODOS_EXPLICACION = {
+    "Grad-CAM (rápido)": "gradcam",
+    "Gradiente de entrada": "saliency"
+}
+
+# Con BACKEND_URL la app es un cliente del servicio FastAPI (un solo proceso
+# con el modelo para ambas interfaces); el modelo local solo se carga si el
+# servicio no responde y BACKEND_FALLBACK=1
+BACKEND_URL = os.getenv("BACKEND_URL", "")
+BACKEND_TIMEOUT = float(os.getenv("BACKEND_TIMEOUT", "30"))
+BACKEND_CONNECT_TIMEOUT = float(os.getenv("BACKEND_CONNECT_TIMEOUT", "3"))
+BACKEND_FALLBACK = os.getenv("BACKEND_FALLBACK", "1") == "1"
 
 try:
     with open('class_names.json', 'r') as f:
@@ -160,91 +178,59 @@ except FileNotFoundError:
 
 @st.cache_resource
 def load_model(path):
+    import tensorflow as tf
+    from inference import CompiledModel
     try:
-        model = tf.keras.models.load_model(path)
+        model = CompiledModel(tf.keras.models.load_model(path))
+        # Trazar la pasada con saliency al cargar y no en el primer análisis
+        model.warmup(saliency=True)
         return model
     except Exception as e:
         st.error(f"Error al cargar el modelo. Verifique la ruta y el formato. Error: {e}")
         st.stop()
 
-def preprocess_image_for_prediction_resnet(image_array, target_size=(224, 224)):
-    img_resized = Image.fromarray(image_array.astype(np.uint8)).resize(target_size)
-    img_array_resized = np.asarray(img_resized, dtype=np.float32)
-    img_preprocessed = tf.keras.applications.resnet_v2.preprocess_input(np.expand_dims(img_array_resized, axis=0))
-    return img_preprocessed
-
-def extract_numerical_features_for_prediction(image_stream):
-    file_bytes = np.asarray(bytearray(image_stream.read()), dtype=np.uint8)
-    img_bgr = cv2.imdecode(file_bytes, cv2.IMREAD_COLOR)
-
-    if img_bgr is None:
-        return np.array([0.0, 0.0, 0.0], dtype=np.float32)
-
-    gray = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY)
-    _, black_mask = cv2.threshold(gray, 30, 255, cv2.THRESH_BINARY_INV)
-    percentage_black = (np.sum(black_mask > 0) / np.prod(img_bgr.shape[:2])) * 100
-
-    num_labels, _, stats, _ = cv2.connectedComponentsWithStats(black_mask, 8, cv2.CV_32S)
-    large_black_spots_count = sum(1 for i in range(1, num_labels) if stats[i, cv2.CC_STAT_AREA] > 100)
-
-    hsv = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2HSV)
-    lower_green = np.array([35, 40, 40])
-    upper_green = np.array([85, 255, 255])
-    green_mask = cv2.inRange(hsv, lower_green, upper_green)
-
-    mean_green_value = np.mean(hsv[:, :, 2][green_mask > 0]) if np.sum(green_mask > 0) > 0 else 0
-
-    max_percentage_black = 100.0
-    max_spots = 20
-    max_green_value = 255.0
-
-    scaled_percentage_black = percentage_black / max_percentage_black
-    scaled_large_black_spots_count = min(large_black_spots_count / max_spots, 1.0)
-    scaled_mean_green_value = mean_green_value / max_green_value
-
-    return np.array([scaled_percentage_black, scaled_large_black_spots_count, scaled_mean_green_value], dtype=np.float32)
-
-def get_prediction_info(model, image_path, preprocess_img_fn, extract_features_fn, confidence_threshold):
-    original_img_pil = Image.open(image_path).convert('RGB')
-    original_img_array = np.asarray(original_img_pil)
-
-    preprocessed_img_for_resnet = preprocess_img_fn(original_img_array)
-    img_tensor = tf.Variable(preprocessed_img_for_resnet, dtype=tf.float32)
-
-    image_path.seek(0)
-    numerical_features = extract_features_fn(image_path)
-    numerical_features_batch = np.expand_dims(numerical_features, axis=0)
-    numerical_features_tensor = tf.convert_to_tensor(numerical_features_batch, dtype=tf.float32)
-
-    with tf.GradientTape() as tape:
-        tape.watch(img_tensor)
-        predictions = model([img_tensor, numerical_features_tensor])
-        predicted_class_idx = tf.argmax(predictions[0])
-        predicted_class_score = predictions[0, predicted_class_idx]
-    
-    gradients = tape.gradient(predicted_class_score, img_tensor)
-    gradients = gradients[0].numpy()
-    saliency_map = np.sum(np.abs(gradients), axis=-1)
-    saliency_map = np.maximum(saliency_map, 0)
-    if np.max(saliency_map) > 0:
-        saliency_map /= np.max(saliency_map)
+@st.cache_resource
+def load_explainer(path):
+    from explain import Explainer
+    explainer = Explainer(load_model(path), max_side=512)
+    explainer.warmup()
+    return explainer
 
-    saliency_map_colored = cv2.applyColorMap(np.uint8(255 * saliency_map), cv2.COLORMAP_JET)
-    saliency_map_colored = cv2.cvtColor(saliency_map_colored, cv2.COLOR_BGR2RGB)
-    saliency_map_resized = cv2.resize(saliency_map_colored, (original_img_array.shape[1], original_img_array.shape[0]))
-    overlayed_image = cv2.addWeighted(original_img_array.astype(np.uint8), 0.6, saliency_map_resized, 0.4, 0)
-    
-    confidence = predictions[0, predicted_class_idx].numpy() * 100
-    predicted_class_name_raw = class_names[predicted_class_idx.numpy()]
+@st.cache_resource
+def load_client(url):
+    return InferenceClient(url, timeout=BACKEND_TIMEOUT, connect_timeout=BACKEND_CONNECT_TIMEOUT)
+
+def analyze_image(image_bytes, mode):
+    """(clase, confianza %, superposición JPEG o None) desde el servicio o el modelo local"""
+    if BACKEND_URL:
+        try:
+            prediction, overlay_jpeg = load_client(BACKEND_URL).explain(image_bytes, mode)
+            return prediction["class_name"], prediction["confidence"], overlay_jpeg
+        except BackendError as e:
+            # Un 4xx es un problema de la imagen: el modelo local respondería lo mismo
+            if not (e.unavailable and BACKEND_FALLBACK):
+                raise
+            print(f"Backend no disponible ({e.detail}); usando el modelo local")
+
+    predictions, overlay_jpeg = load_explainer(MODEL_PATH).explain(image_bytes, mode)
+    predicted_class_idx = int(np.argmax(predictions))
+    return class_names[predicted_class_idx], float(predictions[predicted_class_idx] * 100), overlay_jpeg
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def get_prediction_info(image_bytes, mode, confidence_threshold):
+    # Memoizado por contenido: al volver a mostrar una imagen ya analizada
+    # (cambio de pestaña, cualquier widget) no se vuelve a ejecutar el modelo.
+    # La superposición se devuelve como JPEG y se muestra tal cual con st.image
+    predicted_class_name_raw, confidence, overlay_jpeg = analyze_image(image_bytes, mode)
     
-    if confidence < UMBRAL_CONFIANZA_NO_CACO:
+    if confidence < confidence_threshold:
         final_prediction_text = f"NO ES UNA MAZORCA DE CACAO. (Confianza: {confidence:.2f}%)"
         display_title_text = "NO MAZORCA"
     else:
         final_prediction_text = f"Es una mazorca de cacao: {predicted_class_name_raw} (Confianza: {confidence:.2f}%)"
         display_title_text = f"{predicted_class_name_raw}"
     
-    return overlayed_image, final_prediction_text, display_title_text
+    return overlay_jpeg, final_prediction_text, display_title_text, confidence
 
 # -----------------
 # 4. Diseño de la Interfaz y Lógica Principal
@@ -258,10 +244,15 @@ if 'uploaded_file' not in st.session_state:
 if 'history' not in st.session_state:
     st.session_state.history = []
 
-def add_to_history(image, prediction, confidence):
-    """Agrega una imagen analizada al historial"""
+def add_to_history(image_bytes, prediction, confidence):
+    """Agrega una imagen analizada al historial (una miniatura, no el archivo subido)"""
+    image_hash = hashlib.sha256(image_bytes).hexdigest()
+    # Cada rerun vuelve a mostrar el resultado: no repetir la última entrada
+    if st.session_state.history and st.session_state.history[0]['hash'] == image_hash:
+        return
     history_item = {
-        'image': image,
+        'hash': image_hash,
+        'image': make_thumbnail(image_bytes, 256, 80),
         'prediction': prediction,
         'confidence': confidence,
         'timestamp': time.strftime("%Y-%m-%d %H:%M:%S")
@@ -275,6 +266,9 @@ with st.sidebar:
     st.header("Sube tu imagen")
     temp_uploaded_file = st.file_uploader("Elige una imagen de una mazorca...", type=["jpg", "png", "jpeg"])
     
+    metodo_explicacion = st.radio("Mapa de atención", list(METODOS_EXPLICACION))
+    st.caption(f"Inferencia: {BACKEND_URL if BACKEND_URL else 'modelo local'}")
+
     if temp_uploaded_file:
         st.session_state.uploaded_file = temp_uploaded_file
         if st.button("Analizar Imagen"):
@@ -337,27 +331,21 @@ with tab1:
                     <h3 style='text-align: center; color: #2c3e50;'>📸 Imagen Analizada</h3>
                 </div>
             """, unsafe_allow_html=True)
-            image = Image.open(st.session_state.uploaded_file)
-            st.image(image, use_column_width=True)
+            # Los bytes subidos se envían tal cual, sin decodificar en cada rerun
+            st.image(st.session_state.uploaded_file.getvalue(), use_column_width=True)
 
         with col2:
             with st.spinner("🔄 Procesando imagen..."):
-                time.sleep(1)
                 try:
-                    overlayed_img, final_pred_text, display_title = get_prediction_info(
-                        load_model(MODEL_PATH),
-                        st.session_state.uploaded_file,
-                        preprocess_image_for_prediction_resnet,
-                        extract_numerical_features_for_prediction,
+                    image_bytes = st.session_state.uploaded_file.getvalue()
+                    overlay_jpeg, final_pred_text, display_title, confidence = get_prediction_info(
+                        image_bytes,
+                        METODOS_EXPLICACION[metodo_explicacion],
                         UMBRAL_CONFIANZA_NO_CACO
                     )
                     
-                    # Extraer el porcentaje de confianza
-                    confidence_str = final_pred_text.split("Confianza: ")[1].rstrip("%)").strip()
-                    confidence = float(confidence_str)
-                    
                     # Agregar al historial
-                    add_to_history(st.session_state.uploaded_file, display_title, confidence)
+                    add_to_history(image_bytes, display_title, confidence)
                     
                     # Mostrar resultados
                     st.markdown("""
@@ -387,11 +375,13 @@ with tab1:
                             <h4 style='text-align: center; color: #2c3e50;'>🎯 Áreas de Interés</h4>
                         </div>
                     """, unsafe_allow_html=True)
-                    fig_sal, ax_sal = plt.subplots(figsize=(4, 4))
-                    ax_sal.imshow(overlayed_img)
-                    ax_sal.set_title(f'Análisis: {display_title}', color='#333')
-                    ax_sal.axis('off')
-                    st.pyplot(fig_sal)
+                    if overlay_jpeg is not None:
+                        st.image(overlay_jpeg, caption=f"Análisis: {display_title}", use_column_width=True)
+                    else:
+                        st.info("El servicio de inferencia no ofrece mapas de atención con su motor actual.")
+
+                except BackendError as e:
+                    st.error(f"❌ Error en el análisis: {e.detail}")
 
                 except Exception as e:
                     st.error(f"❌ Error en el análisis: {e}")
@@ -0,0 +1,216 @@
+import asyncio
+import math
+from collections import OrderedDict, defaultdict, deque
+
+from fastapi import HTTPException
+
+
+class Overloaded(Exception):
+    """La solicitud no se admite; `retry_after` en segundos para el cliente"""
+
+    def __init__(self, reason, detail, retry_after):
+        super().__init__(detail)
+        self.reason = reason
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Control de admisión para las rutas de inferencia.
+
+    Como máximo `max_in_flight` solicitudes se atienden a la vez (y cada
+    cliente ocupa como máximo `max_in_flight_per_client`, para que siempre
+    quede lugar para otros). Las demás esperan en una cola por cliente
+    acotada (`max_queue` en total, `max_queue_per_client` por cliente) y,
+    al liberarse un lugar, pasa el cliente en espera con menos solicitudes
+    en curso (empates por turno), de modo que quien sube cientos de fotos
+    no deja esperando a quien sube una. Si la cola está llena o la espera
+    pasa `queue_timeout` segundos, se rechaza con `Overloaded`.
+    """
+
+    def __init__(self, max_in_flight=16, max_in_flight_per_client=None, max_queue=64,
+                 max_queue_per_client=16, queue_timeout=30.0):
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.max_in_flight_per_client = max(1, int(max_in_flight_per_client or self.max_in_flight))
+        self.max_queue = max(0, int(max_queue))
+        self.max_queue_per_client = max(0, int(max_queue_per_client))
+        self.queue_timeout = float(queue_timeout)
+
+        self.in_flight = 0
+        self.queued = 0
+        self._active = defaultdict(int)
+        self._waiting = OrderedDict()
+        self._service_seconds = None
+
+        self.admitted = 0
+        self.shed = defaultdict(int)
+
+    def retry_after(self):
+        """Segundos estimados hasta que se libere lugar (media móvil de la
+        duración de cada solicitud por las que esperan delante)"""
+        service = self._service_seconds or 1.0
+        return min(60, max(1, math.ceil(service * (self.queued + 1) / self.max_in_flight)))
+
+    def _shed(self, reason, detail):
+        self.shed[reason] += 1
+        return Overloaded(reason, detail, self.retry_after())
+
+    def _dispatch(self):
+        """Asigna los lugares libres a los clientes en espera"""
+        while self.in_flight < self.max_in_flight:
+            eligible = [
+                client for client in self._waiting
+                if self._active[client] < self.max_in_flight_per_client
+            ]
+            if not eligible:
+                return
+            # min() conserva el primero entre iguales: el que lleva más turnos sin pasar
+            client = min(eligible, key=lambda c: self._active[c])
+            waiters = self._waiting[client]
+            future = waiters.popleft()
+            self.queued -= 1
+            if waiters:
+                self._waiting.move_to_end(client)
+            else:
+                del self._waiting[client]
+            if future.done():
+                continue
+
+            self.in_flight += 1
+            self._active[client] += 1
+            self.admitted += 1
+            future.set_result(None)
+
+    def _remove(self, client, future):
+        waiters = self._waiting.get(client)
+        if waiters is not None and future in waiters:
+            waiters.remove(future)
+            self.queued -= 1
+            if not waiters:
+                del self._waiting[client]
+
+    async def acquire(self, client):
+        """Espera un lugar para `client` o lanza Overloaded"""
+        future = asyncio.get_running_loop().create_future()
+        self._waiting.setdefault(client, deque()).append(future)
+        self.queued += 1
+        self._dispatch()
+        if future.done():
+            return
+
+        if self.queued > self.max_queue:
+            self._remove(client, future)
+            raise self._shed("queue_full", "El servicio está saturado. Intente nuevamente en unos segundos.")
+        if len(self._waiting[client]) > self.max_queue_per_client:
+            self._remove(client, future)
+            raise self._shed("client_queue_full", "Demasiadas solicitudes en espera desde este cliente.")
+
+        try:
+            await asyncio.wait_for(future, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._remove(client, future)
+            raise self._shed("timeout", "El servicio está saturado. Intente nuevamente en unos segundos.")
+        except asyncio.CancelledError:
+            # El cliente se desconectó: si ya tenía lugar se devuelve
+            if future.done() and not future.cancelled():
+                self.release(client)
+            else:
+                self._remove(client, future)
+            raise
+
+    def release(self, client, seconds=None):
+        self.in_flight -= 1
+        self._active[client] -= 1
+        if self._active[client] <= 0:
+            del self._active[client]
+        if seconds is not None:
+            if self._service_seconds is None:
+                self._service_seconds = seconds
+            else:
+                self._service_seconds = 0.8 * self._service_seconds + 0.2 * seconds
+        self._dispatch()
+
+    def stats(self):
+        return {
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "clients_waiting": len(self._waiting),
+            "max_in_flight": self.max_in_flight,
+            "max_in_flight_per_client": self.max_in_flight_per_client,
+            "max_queue": self.max_queue,
+            "max_queue_per_client": self.max_queue_per_client,
+            "queue_timeout": self.queue_timeout,
+            "admitted": self.admitted,
+            "shed": dict(self.shed),
+            "service_seconds": self._service_seconds
+        }
+
+
+class AdmissionMiddleware:
+    """Middleware ASGI que pasa por el control de admisión las rutas indicadas.
+
+    El lugar se pide cuando llega el final del cuerpo (igual que el límite de
+    subidas, desde `receive`), así una subida lenta por una mala conexión en
+    el campo no ocupa un lugar de inferencia mientras transfiere. Se devuelve
+    al terminar la respuesta (en /predict/batch, al terminar el stream). Si
+    no se admite se responde 503 con Retry-After.
+
+    El cliente es la entrada número `trusted_proxies` contando desde la
+    derecha de `client_header` (X-Forwarded-For: cada proxy agrega a la
+    derecha la dirección que se le conectó; lo que está más a la izquierda
+    lo puede escribir el propio cliente). Con 0, o si la cabecera tiene menos
+    entradas, se usa la dirección de la conexión (la de uvicorn
+    --proxy-headers si está activo).
+    """
+
+    def __init__(self, app, controller, paths, client_header="x-forwarded-for", trusted_proxies=1,
+                 on_shed=None):
+        self.app = app
+        self.controller = controller
+        self.paths = set(paths)
+        self.client_header = client_header.lower().encode() if client_header else None
+        self.trusted_proxies = max(0, int(trusted_proxies))
+        self.on_shed = on_shed
+
+    def client_id(self, scope):
+        if self.client_header and self.trusted_proxies:
+            entries = []
+            for name, value in scope["headers"]:
+                if name == self.client_header:
+                    entries += [e.strip() for e in value.decode("latin-1").split(",") if e.strip()]
+            if len(entries) >= self.trusted_proxies:
+                return entries[-self.trusted_proxies]
+        return scope["client"][0] if scope.get("client") else "desconocido"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("path") not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        client = self.client_id(scope)
+        admitted_at = None
+        loop = asyncio.get_running_loop()
+
+        async def admitted_receive():
+            nonlocal admitted_at
+            message = await receive()
+            if message["type"] == "http.request" and not message.get("more_body", False) \
+                    and admitted_at is None:
+                try:
+                    await self.controller.acquire(client)
+                except Overloaded as e:
+                    if self.on_shed is not None:
+                        self.on_shed(e.reason)
+                    raise HTTPException(
+                        status_code=503,
+                        detail=e.detail,
+                        headers={"Retry-After": str(e.retry_after)}
+                    )
+                admitted_at = loop.time()
+            return message
+
+        try:
+            await self.app(scope, admitted_receive, send)
+        finally:
+            if admitted_at is not None:
+                self.controller.release(client, loop.time() - admitted_at)
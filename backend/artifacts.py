@@ -0,0 +1,127 @@
+"""Caché local del modelo en un formato de carga rápida.
+
+El .keras es un zip con la configuración y los pesos en HDF5; en cada
+arranque `tf.keras.models.load_model` extrae el HDF5 y lo lee variable por
+variable. La primera vez se guarda aparte la configuración y todos los pesos
+en un solo archivo plano (sin comprimir, cada arreglo alineado a 64 bytes)
+con su índice; los arranques siguientes reconstruyen las capas desde la
+configuración y asignan cada peso directamente desde el archivo mapeado en
+memoria (np.memmap), sin zip ni HDF5.
+
+El directorio de cada artefacto lleva el SHA-256 del .keras (y la versión de
+TensorFlow): al cambiar el modelo se crea uno nuevo y se borran los anteriores.
+"""
+import hashlib
+import json
+import math
+import os
+import shutil
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from cache import file_sha256
+
+ARTIFACT_VERSION = 1
+METADATA_FILE = "artifact.json"
+CONFIG_FILE = "config.json"
+WEIGHTS_FILE = "weights.bin"
+ALIGNMENT = 64
+
+
+def artifact_name(source_hash):
+    variant = f"{ARTIFACT_VERSION}:{tf.__version__}"
+    return f"{source_hash[:16]}-{hashlib.sha256(variant.encode()).hexdigest()[:8]}"
+
+
+def export_artifact(model, path, source_hash):
+    """Guarda configuración, pesos planos e índice (se escribe aparte y se renombra al final)"""
+    tmp_path = path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    with open(os.path.join(tmp_path, CONFIG_FILE), "w") as f:
+        f.write(model.to_json())
+
+    index = []
+    offset = 0
+    with open(os.path.join(tmp_path, WEIGHTS_FILE), "wb") as f:
+        for variable in model.weights:
+            array = np.ascontiguousarray(variable.numpy())
+            padding = -offset % ALIGNMENT
+            f.write(b"\0" * padding)
+            offset += padding
+            index.append({
+                "path": variable.path,
+                "offset": offset,
+                "shape": list(array.shape),
+                "dtype": str(array.dtype)
+            })
+            f.write(array.tobytes())
+            offset += array.nbytes
+
+    with open(os.path.join(tmp_path, METADATA_FILE), "w") as f:
+        json.dump({
+            "source_sha256": source_hash,
+            "tensorflow": tf.__version__,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "weights": index
+        }, f)
+    os.replace(tmp_path, path)
+
+
+def load_artifact(path):
+    """Modelo Keras reconstruido desde el artefacto"""
+    with open(os.path.join(path, METADATA_FILE)) as f:
+        index = json.load(f)["weights"]
+    with open(os.path.join(path, CONFIG_FILE)) as f:
+        model = tf.keras.models.model_from_json(f.read())
+
+    variables = model.weights
+    if [variable.path for variable in variables] != [entry["path"] for entry in index]:
+        raise ValueError("Los pesos del artefacto no corresponden a la arquitectura del modelo")
+
+    weights = np.memmap(os.path.join(path, WEIGHTS_FILE), mode="r")
+    for variable, entry in zip(variables, index):
+        count = math.prod(entry["shape"])
+        variable.assign(
+            np.frombuffer(weights, dtype=entry["dtype"], count=count, offset=entry["offset"]).reshape(entry["shape"])
+        )
+    return model
+
+
+def load_cached_model(model_path, cache_dir):
+    """(modelo Keras, detalle para /health) desde la caché; si aún no existe,
+    carga el .keras y crea el artefacto para los siguientes arranques"""
+    start = time.perf_counter()
+    source_hash = file_sha256(model_path)
+    name = artifact_name(source_hash)
+    path = os.path.join(cache_dir, name)
+    info = {"path": path, "hit": False, "hash_seconds": time.perf_counter() - start}
+
+    if os.path.isdir(path):
+        try:
+            model = load_artifact(path)
+            info["hit"] = True
+            return model, info
+        except Exception as e:
+            print(f"Artefacto del modelo inválido, se vuelve a crear: {str(e)}")
+            shutil.rmtree(path, ignore_errors=True)
+
+    model = tf.keras.models.load_model(model_path)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        start = time.perf_counter()
+        export_artifact(model, path, source_hash)
+        info["export_seconds"] = time.perf_counter() - start
+        print(f"Artefacto del modelo guardado en {path}")
+        # Solo se conserva el artefacto actual (y nada que no sea un artefacto se toca)
+        for entry in os.listdir(cache_dir):
+            if entry != name and os.path.isfile(os.path.join(cache_dir, entry, METADATA_FILE)):
+                shutil.rmtree(os.path.join(cache_dir, entry), ignore_errors=True)
+    except Exception as e:
+        print(f"No se pudo guardar el artefacto del modelo: {str(e)}")
+        shutil.rmtree(path + ".tmp", ignore_errors=True)
+        info["error"] = str(e)
+    return model, info
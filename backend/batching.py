@@ -0,0 +1,84 @@
+import asyncio
+
+import numpy as np
+
+
+class MicroBatcher:
+    """Agrupa solicitudes concurrentes en un único lote para el modelo.
+
+    Cada llamada a `submit` encola sus filas (imágenes y características) y
+    espera su propio resultado. Un único bucle en segundo plano junta lo que
+    llegue durante `max_wait_ms` (o hasta `max_batch_size` filas) y ejecuta
+    una sola pasada del modelo para todo el lote. Si se indica `executor`,
+    el modelo se ejecuta en él para no bloquear el event loop.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=8, max_wait_ms=10.0, executor=None):
+        self.predict_fn = predict_fn
+        self.executor = executor
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue = None
+        self._worker = None
+
+    def _ensure_worker(self):
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+
+    async def submit(self, images, features):
+        """Encola un lote pequeño y devuelve sus probabilidades (N, clases)"""
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((images, features, future))
+        return await future
+
+    async def _collect(self):
+        """Espera la primera solicitud y junta las que lleguen dentro de la ventana"""
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        rows = len(batch[0][0])
+        deadline = loop.time() + self.max_wait
+
+        while rows < self.max_batch_size:
+            try:
+                item = self._queue.get_nowait()
+            except asyncio.QueueEmpty:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            batch.append(item)
+            rows += len(item[0])
+
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            pending = [item for item in batch if not item[2].cancelled()]
+            if not pending:
+                continue
+
+            try:
+                images = np.concatenate([item[0] for item in pending], axis=0)
+                features = np.concatenate([item[1] for item in pending], axis=0)
+                probabilities = await asyncio.get_running_loop().run_in_executor(
+                    self.executor, self.predict_fn, images, features
+                )
+            except Exception as e:
+                for _, _, future in pending:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            # Devolver a cada llamador únicamente sus filas
+            start = 0
+            for item_images, _, future in pending:
+                end = start + len(item_images)
+                if not future.done():
+                    future.set_result(probabilities[start:end])
+                start = end
@@ -0,0 +1,176 @@
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+# Costo aproximado de un nodo de OrderedDict más la tupla (valor, expiración)
+_ENTRY_OVERHEAD = 160
+
+
+# Hashes ya calculados por (ruta, tamaño, fecha de modificación)
+_file_digests = {}
+_file_digests_lock = threading.Lock()
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    """SHA-256 del archivo. Se recuerda mientras no cambien su tamaño ni su
+    fecha de modificación: el modelo se lee una sola vez al arrancar aunque lo
+    pidan el espacio de la caché y el artefacto, y un modelo reemplazado se
+    vuelve a hashear en la siguiente recarga"""
+    stat = os.stat(path)
+    key = (os.path.realpath(path), stat.st_size, stat.st_mtime_ns)
+    with _file_digests_lock:
+        if key in _file_digests:
+            return _file_digests[key]
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    with _file_digests_lock:
+        _file_digests[key] = digest.hexdigest()
+    return _file_digests[key]
+
+
+class PredictionCache:
+    """Caché LRU + TTL de predicciones indexada por el hash del archivo subido.
+
+    Se limita por número de entradas y, opcionalmente, por bytes estimados.
+    Con `db_path` las entradas también se guardan en SQLite para sobrevivir
+    a reinicios; una entrada que solo está en disco se promueve a memoria
+    la primera vez que se consulta.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=None, ttl_seconds=3600, db_path=None, namespace=""):
+        self.max_entries = max(0, int(max_entries))
+        self.max_bytes = int(max_bytes) if max_bytes else None
+        self.ttl = float(ttl_seconds)
+        self.namespace = namespace.encode()
+        self.db_path = db_path or None
+
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._db = None
+        if self.db_path and self.enabled:
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS predictions "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.execute("DELETE FROM predictions WHERE expires_at < ?", (time.time(),))
+            self._db.commit()
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    @property
+    def persistent(self):
+        """True si get/set pueden tocar el disco (conviene llamarlos fuera del event loop)"""
+        return self._db is not None
+
+    def key(self, contents):
+        """Hash del contenido (separado por motor/modelo para no mezclar resultados)"""
+        return hashlib.sha256(self.namespace + contents).hexdigest()
+
+    @staticmethod
+    def _entry_size(key, value):
+        return sys.getsizeof(key) + sys.getsizeof(value) + sum(sys.getsizeof(v) for v in value) + _ENTRY_OVERHEAD
+
+    def get(self, key):
+        """Devuelve el valor guardado o None si no existe o expiró"""
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at >= time.time():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._remove(key)
+
+            value = self._load_from_disk(key)
+            if value is None:
+                self.misses += 1
+                return None
+
+            self.disk_hits += 1
+            self._store(key, value[0], value[1])
+            return value[0]
+
+    def set(self, key, value):
+        """Guarda una lista de probabilidades para el hash dado"""
+        if not self.enabled:
+            return
+        value = tuple(float(v) for v in value)
+        expires_at = time.time() + self.ttl
+
+        with self._lock:
+            self._store(key, value, expires_at)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO predictions (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(value), expires_at)
+                )
+                self._db.commit()
+
+    def _store(self, key, value, expires_at):
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (value, expires_at)
+        self._bytes += self._entry_size(key, value)
+
+        while len(self._entries) > self.max_entries or \
+                (self.max_bytes is not None and self._bytes > self.max_bytes and len(self._entries) > 1):
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key):
+        value, _ = self._entries.pop(key)
+        self._bytes -= self._entry_size(key, value)
+
+    def _load_from_disk(self, key):
+        if self._db is None:
+            return None
+        row = self._db.execute(
+            "SELECT value, expires_at FROM predictions WHERE key = ? AND expires_at >= ?",
+            (key, time.time())
+        ).fetchone()
+        if row is None:
+            return None
+        return tuple(json.loads(row[0])), row[1]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            entries = len(self._entries)
+            return {
+                "enabled": self.enabled,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": entries,
+                "max_entries": self.max_entries,
+                "memory_bytes": self._bytes,
+                "bytes_per_entry": self._bytes / entries if entries else 0,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+                "disk_path": self.db_path
+            }
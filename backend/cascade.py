@@ -0,0 +1,198 @@
+import threading
+
+import numpy as np
+
+# Este módulo no depende de TensorFlow: la primera etapa es una regresión
+# softmax en NumPy y la segunda cualquier motor de inference.py
+
+
+def cascade_inputs(images, features):
+    """Entradas de la primera etapa (N, 9): las tres características manuales
+    más la media y la desviación de cada canal de la imagen 224x224 ya
+    preprocesada (casi gratis: el tensor ya existe)."""
+    images = np.asarray(images, dtype=np.float32)
+    return np.concatenate([
+        np.asarray(features, dtype=np.float32),
+        images.mean(axis=(1, 2)),
+        images.std(axis=(1, 2))
+    ], axis=1)
+
+
+class FeatureClassifier:
+    """Clasificador rápido de la primera etapa: regresión softmax sobre `cascade_inputs`.
+
+    `gate` es otro FeatureClassifier de dos clases (índice 1 = el modelo
+    completo dice "no es cacao") e `input_range` el mínimo y el máximo de
+    cada entrada en las fotos de cacao del entrenamiento; ambos se arman con
+    `fit_gate` y sirven para saber cuándo la primera etapa no puede decidir
+    `is_cacao` por su cuenta (ver `first_stage_answers`).
+    """
+
+    def __init__(self, weights, bias, mean, scale, class_names=None, gate=None, input_range=None):
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.bias = np.asarray(bias, dtype=np.float32)
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.scale = np.asarray(scale, dtype=np.float32)
+        self.class_names = list(class_names) if class_names is not None else None
+        self.gate = gate
+        self.input_range = tuple(np.asarray(r, dtype=np.float32) for r in input_range) \
+            if input_range is not None else None
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path, allow_pickle=False)
+        class_names = [str(name) for name in data["class_names"]] if "class_names" in data else []
+        gate = input_range = None
+        if "gate_weights" in data:
+            gate = cls(data["gate_weights"], data["gate_bias"], data["gate_mean"], data["gate_scale"])
+            input_range = (data["input_min"], data["input_max"])
+        return cls(data["weights"], data["bias"], data["mean"], data["scale"], class_names or None,
+                   gate, input_range)
+
+    def save(self, path):
+        arrays = {}
+        if self.gate is not None:
+            arrays = {
+                "gate_weights": self.gate.weights,
+                "gate_bias": self.gate.bias,
+                "gate_mean": self.gate.mean,
+                "gate_scale": self.gate.scale,
+                "input_min": self.input_range[0],
+                "input_max": self.input_range[1]
+            }
+        np.savez(
+            path,
+            weights=self.weights,
+            bias=self.bias,
+            mean=self.mean,
+            scale=self.scale,
+            class_names=np.array(self.class_names or []),
+            **arrays
+        )
+
+    def fit_gate(self, inputs, full_is_cacao):
+        """Entrena la compuerta con la decisión `is_cacao` del modelo completo
+        (conviene incluir fotos que no son de cacao) y guarda el rango de las
+        entradas de las fotos que el modelo completo acepta como cacao"""
+        inputs = np.asarray(inputs, dtype=np.float64)
+        full_is_cacao = np.asarray(full_is_cacao, dtype=bool)
+        self.gate = FeatureClassifier.fit(inputs, (~full_is_cacao).astype(int), 2)
+        accepted = inputs[full_is_cacao] if full_is_cacao.any() else inputs
+        self.input_range = (accepted.min(axis=0).astype(np.float32), accepted.max(axis=0).astype(np.float32))
+        return self
+
+    def predict_proba(self, inputs):
+        logits = ((inputs - self.mean) / self.scale) @ self.weights + self.bias
+        logits -= logits.max(axis=1, keepdims=True)
+        exp = np.exp(logits)
+        return exp / exp.sum(axis=1, keepdims=True)
+
+    @classmethod
+    def fit(cls, inputs, labels, num_classes, class_names=None, epochs=500, learning_rate=0.5, l2=1e-3):
+        """Entrena con descenso de gradiente por lotes completos (pocos miles de filas)"""
+        inputs = np.asarray(inputs, dtype=np.float64)
+        mean = inputs.mean(axis=0)
+        scale = inputs.std(axis=0) + 1e-6
+        x = (inputs - mean) / scale
+        targets = np.eye(num_classes)[np.asarray(labels)]
+
+        weights = np.zeros((x.shape[1], num_classes))
+        bias = np.zeros(num_classes)
+        for _ in range(epochs):
+            logits = x @ weights + bias
+            logits -= logits.max(axis=1, keepdims=True)
+            probs = np.exp(logits)
+            probs /= probs.sum(axis=1, keepdims=True)
+            error = (probs - targets) / len(x)
+            weights -= learning_rate * (x.T @ error + l2 * weights)
+            bias -= learning_rate * error.sum(axis=0)
+        return cls(weights, bias, mean, scale, class_names)
+
+
+def first_stage_answers(first_stage, inputs, probabilities, threshold, cacao_threshold):
+    """Máscara de las imágenes que la primera etapa puede responder sola.
+
+    La confianza debe llegar a `threshold` y a `cacao_threshold` (el umbral
+    de "no es cacao" del servicio, como fracción): por debajo la respuesta
+    sería "no es cacao", que solo puede dar el modelo completo. Además la
+    entrada debe estar dentro del rango visto en el entrenamiento y la
+    compuerta debe estimar un riesgo menor que 1 - `threshold` de que el
+    modelo completo diga "no es cacao": la primera etapa solo conoce fotos
+    de mazorcas y su confianza no detecta otras fotos. Sin compuerta
+    (primera etapa entrenada antes de que existiera) se escala todo.
+    """
+    if first_stage.gate is None:
+        return np.zeros(len(inputs), dtype=bool)
+    confidence = probabilities.max(axis=1)
+    low, high = first_stage.input_range
+    in_range = np.all((inputs >= low) & (inputs <= high), axis=1)
+    risk = first_stage.gate.predict_proba(inputs)[:, 1]
+    return (confidence >= max(threshold, cacao_threshold)) & in_range & (risk < 1.0 - threshold)
+
+
+class CascadeEngine:
+    """Motor en cascada: la primera etapa responde si su confianza llega al
+    umbral y su decisión `is_cacao` no puede diferir de la del modelo
+    completo (`first_stage_answers`); el resto del lote pasa al motor completo.
+
+    Tiene la misma interfaz que los motores de inference.py; `model` y
+    `predict_with_saliency` son los del motor completo (para /explain).
+    """
+
+    name = "cascade"
+
+    def __init__(self, first_stage, engine, threshold=0.9, cacao_threshold=0.7):
+        self.first_stage = first_stage
+        self.engine = engine
+        self.threshold = float(threshold)
+        self.cacao_threshold = float(cacao_threshold)
+        self.model = engine.model
+        self._lock = threading.Lock()
+        self.images = 0
+        self.escalated = 0
+
+    def __call__(self, images, features):
+        images = np.asarray(images, dtype=np.float32)
+        features = np.asarray(features, dtype=np.float32)
+        inputs = cascade_inputs(images, features)
+        probabilities = self.first_stage.predict_proba(inputs)
+        answered = first_stage_answers(
+            self.first_stage, inputs, probabilities, self.threshold, self.cacao_threshold
+        )
+        uncertain = np.flatnonzero(~answered)
+
+        if len(uncertain):
+            probabilities[uncertain] = self.engine(images[uncertain], features[uncertain])
+
+        with self._lock:
+            self.images += len(images)
+            self.escalated += len(uncertain)
+        return probabilities
+
+    def first_stage_answer(self, images, features):
+        """Probabilidades (N, clases) de la primera etapa con NaN en las filas
+        que escalaría, sin llamar al motor completo ni contar en `stats`"""
+        inputs = cascade_inputs(images, features)
+        probabilities = self.first_stage.predict_proba(inputs)
+        answered = first_stage_answers(
+            self.first_stage, inputs, probabilities, self.threshold, self.cacao_threshold
+        )
+        probabilities[~answered] = np.nan
+        return probabilities
+
+    def predict_with_saliency(self, images, features):
+        return self.engine.predict_with_saliency(images, features)
+
+    def warmup(self):
+        self.engine.warmup()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "threshold": self.threshold,
+                "cacao_threshold": self.cacao_threshold,
+                "gate": self.first_stage.gate is not None,
+                "images": self.images,
+                "escalated": self.escalated,
+                "escalation_rate": self.escalated / self.images if self.images else 0.0
+            }
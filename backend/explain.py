@@ -0,0 +1,200 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+import tensorflow as tf
+
+from inference import FEATURES_SPEC, IMAGE_SPEC
+from preprocessing import MAX_IMAGE_PIXELS, decode_image, extract_features, to_model_input
+
+EXPLAIN_MODES = ("gradcam", "saliency")
+
+
+def find_last_conv_layer(model):
+    """Última capa con salida espacial (N, H, W, C): el último bloque convolucional.
+
+    Si la red base (ResNet101) está anidada como un submodelo, la capa se
+    busca dentro de ese submodelo.
+    """
+    for layer in reversed(model.layers):
+        if isinstance(layer, tf.keras.Model):
+            try:
+                return find_last_conv_layer(layer)
+            except ValueError:
+                continue
+        try:
+            shape = layer.output.shape
+        except (AttributeError, ValueError):
+            continue
+        if len(shape) == 4:
+            return layer
+    raise ValueError("El modelo no tiene capas convolucionales para Grad-CAM")
+
+
+def find_layer(model, name):
+    """Capa por nombre, también dentro de las redes base anidadas"""
+    for layer in model.layers:
+        if layer.name == name:
+            return layer
+        if isinstance(layer, tf.keras.Model):
+            try:
+                return find_layer(layer, name)
+            except ValueError:
+                pass
+    raise ValueError(f"El modelo no tiene la capa {name}")
+
+
+def _contains(model, layer):
+    return any(
+        inner is layer or (isinstance(inner, tf.keras.Model) and _contains(inner, layer))
+        for inner in model.layers
+    )
+
+
+def build_gradcam_model(model, layer):
+    """Función inputs -> (activaciones de `layer`, salida del modelo) en una sola pasada.
+
+    Si `layer` está dentro de una red base anidada (`x = base(imagen)`), su
+    salida no está conectada a las entradas del modelo exterior: se arma la
+    red base desde su propia entrada hasta [capa, salida de la base] y la
+    cabeza (lo que sigue a la base) se vuelve a aplicar sobre esa salida.
+    """
+    if any(inner is layer for inner in model.layers):
+        grad_model = tf.keras.Model(model.inputs, [layer.output, model.output])
+        return lambda inputs: grad_model(inputs, training=False)
+
+    base = next(
+        inner for inner in model.layers
+        if isinstance(inner, tf.keras.Model) and _contains(inner, layer)
+    )
+    if len(base._inbound_nodes) != 1:
+        raise ValueError(f"La red base {base.name} se usa más de una vez en el modelo")
+    node = base._inbound_nodes[0]
+
+    base_forward = build_gradcam_model(base, layer)
+    # Del modelo exterior: entradas -> entrada de la base, y salida de la base -> salida
+    to_base = tf.keras.Model(model.inputs, list(node.input_tensors))
+    head = tf.keras.Model(list(node.output_tensors) + list(model.inputs), model.output)
+
+    def forward(inputs):
+        base_inputs = to_base(inputs, training=False)
+        activations, base_output = base_forward(base_inputs)
+        return activations, head([base_output] + list(inputs), training=False)
+
+    return forward
+
+
+class Explainer:
+    """Mapas de atención para una imagen, con caché por hash del archivo.
+
+    - "gradcam": una sola pasada hacia adelante devuelve las activaciones del
+      último bloque convolucional y la predicción; el gradiente solo recorre
+      la cabeza del modelo (de la salida a ese bloque), no toda la red.
+    - "saliency": gradiente de la clase ganadora respecto a la imagen de
+      entrada (el método original de app.py), más caro.
+
+    Las superposiciones se dibujan a una resolución acotada (`max_side`) y
+    se guardan como JPEG en una caché LRU de `cache_entries` elementos.
+    """
+
+    def __init__(self, compiled_model, layer_name=None, max_side=512, cache_entries=64,
+                 preprocess_max_side=1024, max_pixels=MAX_IMAGE_PIXELS):
+        self.compiled_model = compiled_model
+        model = compiled_model.model
+        layer = find_layer(model, layer_name) if layer_name else find_last_conv_layer(model)
+        self.layer_name = layer.name
+        self.max_side = max_side
+        self.preprocess_max_side = preprocess_max_side
+        self.max_pixels = max_pixels
+        self.cache_entries = cache_entries
+
+        self._grad_model = build_gradcam_model(model, layer)
+        self._gradcam = tf.function(self._gradcam_fn, input_signature=[IMAGE_SPEC, FEATURES_SPEC])
+
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _gradcam_fn(self, images, features):
+        with tf.GradientTape() as tape:
+            activations, predictions = self._grad_model([images, features])
+            top_scores = tf.reduce_max(predictions, axis=1)
+        gradients = tape.gradient(top_scores, activations)
+
+        # Peso de cada canal = gradiente medio; mapa = ReLU de la suma ponderada
+        weights = tf.reduce_mean(gradients, axis=[1, 2], keepdims=True)
+        cam = tf.nn.relu(tf.reduce_sum(activations * weights, axis=-1))
+        cam = tf.math.divide_no_nan(cam, tf.reduce_max(cam, axis=[1, 2], keepdims=True))
+        return predictions, cam
+
+    def warmup(self):
+        images = np.zeros((1,) + tuple(IMAGE_SPEC.shape[1:]), np.float32)
+        features = np.zeros((1,) + tuple(FEATURES_SPEC.shape[1:]), np.float32)
+        self._gradcam(images, features)
+
+    def explain(self, image_bytes, mode="gradcam"):
+        """Devuelve (probabilidades, superposición JPEG) para la imagen"""
+        if mode not in EXPLAIN_MODES:
+            raise ValueError(f"Modo de explicación desconocido: {mode}")
+
+        key = (hashlib.sha256(image_bytes).hexdigest(), mode)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return cached
+            self.misses += 1
+
+        image_array, area_scale = decode_image(image_bytes, self.preprocess_max_side, self.max_pixels)
+        images = to_model_input(image_array)
+        features = extract_features(image_array, area_scale)
+
+        if mode == "gradcam":
+            predictions, heatmap = self._gradcam(images, features)
+            predictions, heatmap = predictions.numpy()[0], heatmap.numpy()[0]
+        else:
+            predictions, gradients = self.compiled_model.predict_with_saliency(images, features)
+            predictions = predictions[0]
+            heatmap = np.sum(np.abs(gradients[0]), axis=-1)
+            if np.max(heatmap) > 0:
+                heatmap /= np.max(heatmap)
+
+        result = (predictions, render_overlay(image_array, heatmap, self.max_side))
+        with self._lock:
+            self._cache[key] = result
+            while len(self._cache) > self.cache_entries:
+                self._cache.popitem(last=False)
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {
+                "layer": self.layer_name,
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._cache),
+                "max_entries": self.cache_entries,
+                "memory_bytes": sum(len(jpeg) for _, jpeg in self._cache.values())
+            }
+
+
+def render_overlay(image_array, heatmap, max_side=512, quality=85):
+    """Mezcla el mapa de calor sobre la imagen a resolución acotada y la codifica en JPEG"""
+    height, width = image_array.shape[:2]
+    if max(height, width) > max_side:
+        ratio = max_side / max(height, width)
+        width, height = max(1, round(width * ratio)), max(1, round(height * ratio))
+        image_array = cv2.resize(image_array, (width, height), interpolation=cv2.INTER_AREA)
+
+    heatmap = cv2.resize(np.asarray(heatmap, np.float32), (width, height))
+    colored = cv2.applyColorMap(np.uint8(255 * np.clip(heatmap, 0, 1)), cv2.COLORMAP_JET)
+    overlay = cv2.addWeighted(cv2.cvtColor(image_array, cv2.COLOR_RGB2BGR), 0.6, colored, 0.4, 0)
+
+    ok, buffer = cv2.imencode(".jpg", overlay, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise RuntimeError("No se pudo codificar la superposición")
+    return buffer.tobytes()
@@ -0,0 +1,135 @@
+import cv2
+import numpy as np
+
+# Umbrales de las características manuales (iguales para todas las rutas)
+BLACK_THRESHOLD = 30
+MIN_SPOT_AREA = 100
+MAX_SPOTS = 20.0
+GREEN_LOWER = (35, 40, 40)
+GREEN_UPPER = (85, 255, 255)
+
+
+def _as_batch(images):
+    images = np.asarray(images)
+    if images.ndim == 3:
+        images = images[np.newaxis]
+    if images.ndim != 4 or images.shape[-1] != 3:
+        raise ValueError(f"Se esperaba un lote (N, H, W, 3) y se recibió {images.shape}")
+    return np.ascontiguousarray(images, dtype=np.uint8)
+
+
+def _count_large_spots(black_mask, min_area):
+    """Cuenta manchas grandes de todo el lote con un único etiquetado.
+
+    Las máscaras se apilan verticalmente separadas por una fila de ceros, de
+    modo que ninguna componente (conectividad 8) cruza de una imagen a otra;
+    la fila superior de cada componente indica a qué imagen pertenece.
+    """
+    n, h, w = black_mask.shape
+    stacked = np.zeros((n, h + 1, w), dtype=np.uint8)
+    stacked[:, :h] = black_mask
+    stacked = stacked.reshape(n * (h + 1), w)
+
+    # Las áreas no dependen del algoritmo; BBDT (Grana) es el más rápido en imágenes altas
+    _, _, stats, _ = cv2.connectedComponentsWithStatsWithAlgorithm(stacked, 8, cv2.CV_32S, cv2.CCL_GRANA)
+    stats = stats[1:]
+    owner = stats[:, cv2.CC_STAT_TOP] // (h + 1)
+    large = stats[:, cv2.CC_STAT_AREA] > min_area[owner]
+    return np.bincount(owner[large], minlength=n)
+
+
+def extract_features_batch(images, area_scale=1.0):
+    """Características (N, 3) de un lote RGB uint8 (N, H, W, 3).
+
+    Produce exactamente los mismos valores que procesar cada imagen por
+    separado: el umbral de negro, la máscara HSV y el filtrado por área se
+    calculan para todo el lote de una vez. `area_scale` puede ser un escalar
+    o un valor por imagen (ver preprocessing.decode_image).
+    """
+    images = _as_batch(images)
+    n, h, w, _ = images.shape
+    min_area = MIN_SPOT_AREA * np.broadcast_to(np.asarray(area_scale, dtype=np.float64), (n,))
+
+    # cvtColor trabaja píxel a píxel: el lote se procesa como una sola imagen alta
+    flat = images.reshape(n * h, w, 3)
+    gray = cv2.cvtColor(flat, cv2.COLOR_RGB2GRAY).reshape(n, h, w)
+    hsv = cv2.cvtColor(flat, cv2.COLOR_RGB2HSV)
+
+    # Características de manchas negras (equivale a THRESH_BINARY_INV con umbral 30)
+    black_mask = gray <= BLACK_THRESHOLD
+    percentage_black = (np.count_nonzero(black_mask.reshape(n, -1), axis=1) / (h * w)) * 100
+
+    # Conteo de manchas grandes
+    large_black_spots = _count_large_spots(black_mask.view(np.uint8), min_area)
+
+    # Características de color verde
+    green_mask = cv2.inRange(hsv, np.array(GREEN_LOWER), np.array(GREEN_UPPER))
+    green_values = cv2.bitwise_and(cv2.extractChannel(hsv, 2), green_mask)
+    green_count = np.count_nonzero(green_mask.reshape(n, -1), axis=1)
+    green_sum = green_values.reshape(n, -1).sum(axis=1, dtype=np.int64)
+    mean_green = np.divide(green_sum, green_count, out=np.zeros(n), where=green_count > 0)
+
+    # Normalizar características
+    scaled_black = percentage_black / 100.0
+    scaled_spots = np.minimum(large_black_spots / MAX_SPOTS, 1.0)
+    scaled_green = mean_green / 255.0
+
+    return np.stack([scaled_black, scaled_spots, scaled_green], axis=1).astype(np.float32)
+
+
+def extract_features_tf(images, area_scale=1.0):
+    """Variante en grafo de TensorFlow de `extract_features_batch`.
+
+    Gris y HSV replican la aritmética entera de 8 bits de OpenCV, por lo que
+    el resultado coincide con la versión NumPy; el etiquetado de componentes
+    no existe como operación de TF y se delega a OpenCV con
+    `tf.numpy_function`. Puede llamarse dentro de un `tf.function` junto al
+    modelo para calcular características y predicción en una sola llamada.
+    """
+    import tensorflow as tf
+
+    images = tf.convert_to_tensor(images)
+    pixels = tf.cast(images, tf.int32)
+    r, g, b = pixels[..., 0], pixels[..., 1], pixels[..., 2]
+    shape = tf.shape(pixels)
+    n = shape[0]
+    num_pixels = tf.cast(shape[1] * shape[2], tf.float64)
+
+    # Gris: coeficientes BT.601 en punto fijo (15 bits), como cv2.COLOR_RGB2GRAY
+    gray = tf.bitwise.right_shift(r * 9798 + g * 19235 + b * 3735 + (1 << 14), 15)
+    black_mask = gray <= BLACK_THRESHOLD
+    black_count = tf.reduce_sum(tf.cast(black_mask, tf.float64), axis=[1, 2])
+    percentage_black = (black_count / num_pixels) * 100
+
+    min_area = MIN_SPOT_AREA * tf.broadcast_to(tf.cast(area_scale, tf.float64), [n])
+    large_black_spots = tf.numpy_function(
+        lambda mask, area: _count_large_spots(mask.astype(np.uint8), area).astype(np.float64),
+        [black_mask, min_area],
+        tf.float64
+    )
+    large_black_spots = tf.reshape(large_black_spots, [n])
+
+    # HSV de 8 bits (H en 0-180) con las tablas de división de OpenCV
+    v = tf.maximum(tf.maximum(r, g), b)
+    diff = v - tf.minimum(tf.minimum(r, g), b)
+    steps = np.arange(256, dtype=np.float64)
+    sdiv = np.zeros(256, np.int64)
+    sdiv[1:] = np.round((255 << 12) / steps[1:])
+    hdiv = np.zeros(256, np.int64)
+    hdiv[1:] = np.round((180 << 12) / (6 * steps[1:]))
+    s = tf.bitwise.right_shift(diff * tf.gather(tf.constant(sdiv, tf.int32), v) + (1 << 11), 12)
+    h = tf.where(tf.equal(v, r), g - b, tf.where(tf.equal(v, g), b - r + 2 * diff, r - g + 4 * diff))
+    h = tf.bitwise.right_shift(h * tf.gather(tf.constant(hdiv, tf.int32), diff) + (1 << 11), 12)
+    h = tf.where(h < 0, h + 180, h)
+
+    green_mask = (h >= GREEN_LOWER[0]) & (h <= GREEN_UPPER[0]) & (s >= GREEN_LOWER[1]) & (v >= GREEN_LOWER[2])
+    green_count = tf.reduce_sum(tf.cast(green_mask, tf.float64), axis=[1, 2])
+    green_sum = tf.reduce_sum(tf.cast(tf.where(green_mask, v, 0), tf.float64), axis=[1, 2])
+    mean_green = tf.math.divide_no_nan(green_sum, green_count)
+
+    features = tf.stack([
+        percentage_black / 100.0,
+        tf.minimum(large_black_spots / MAX_SPOTS, 1.0),
+        mean_green / 255.0
+    ], axis=1)
+    return tf.cast(features, tf.float32)
@@ -0,0 +1,195 @@
+import queue
+import sqlite3
+import threading
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT NOT NULL,
+    class_name TEXT NOT NULL,
+    confidence REAL NOT NULL,
+    is_cacao INTEGER NOT NULL,
+    source TEXT NOT NULL,
+    thumbnail BLOB
+);
+CREATE INDEX IF NOT EXISTS history_timestamp ON history (timestamp);
+CREATE INDEX IF NOT EXISTS history_class_timestamp ON history (class_name, timestamp);
+"""
+
+_STOP = object()
+
+
+class HistoryStore:
+    """Historial de predicciones en SQLite con miniaturas JPEG.
+
+    `record` solo encola la miniatura ya hecha (en el pool de
+    preprocesamiento, desde la imagen decodificada para el modelo; nunca la
+    foto original) y el INSERT lo hace un hilo escritor, así guardar el
+    historial no suma latencia a /predict. Si la cola se
+    llena (disco lento) los registros nuevos se descartan y se cuentan.
+    Las consultas usan una conexión de lectura aparte (WAL permite leer
+    mientras se escribe).
+    """
+
+    def __init__(self, db_path, max_entries=100000, queue_size=1000):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+
+        writer = self._connect()
+        writer.executescript(_SCHEMA)
+        writer.commit()
+        self._reader = self._connect()
+        self._read_lock = threading.Lock()
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._write_loop, args=(writer,), name="history-writer", daemon=True)
+        self._thread.start()
+
+    def _connect(self):
+        db = sqlite3.connect(self.db_path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def record(self, thumbnail, prediction, source):
+        """Encola una predicción con su miniatura JPEG o None (no bloquea)"""
+        try:
+            self._queue.put_nowait((thumbnail, prediction, source))
+        except queue.Full:
+            self.dropped += 1
+
+    def _write_loop(self, db):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            # Agrupar en una transacción lo que se haya acumulado
+            items = [item]
+            while len(items) < 100:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    self._queue.put(_STOP)
+                    break
+                items.append(item)
+
+            try:
+                db.executemany(
+                    "INSERT INTO history (timestamp, class_name, confidence, is_cacao, source, thumbnail) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [self._row(*item) for item in items]
+                )
+                db.commit()
+                self.written += len(items)
+                if self.max_entries and self.written % 100 < len(items):
+                    self._prune(db)
+            except Exception as e:
+                self.errors += len(items)
+                print(f"Error al guardar el historial: {str(e)}")
+        db.close()
+
+    def _row(self, thumbnail, prediction, source):
+        return (
+            prediction["timestamp"],
+            prediction["class_name"],
+            prediction["confidence"],
+            int(prediction["is_cacao"]),
+            source,
+            thumbnail
+        )
+
+    def _prune(self, db):
+        db.execute(
+            "DELETE FROM history WHERE id <= (SELECT MAX(id) FROM history) - ?",
+            (self.max_entries,)
+        )
+        db.commit()
+
+    def page(self, limit=20, cursor=None, class_name=None):
+        """Predicciones más recientes primero; `cursor` es el id del último
+        elemento de la página anterior (paginación por clave, sin OFFSET)"""
+        conditions, params = [], []
+        if cursor is not None:
+            conditions.append("id < ?")
+            params.append(cursor)
+        if class_name:
+            conditions.append("class_name = ?")
+            params.append(class_name)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        with self._read_lock:
+            rows = self._reader.execute(
+                f"SELECT id, timestamp, class_name, confidence, is_cacao, source, thumbnail IS NOT NULL "
+                f"FROM history {where} ORDER BY id DESC LIMIT ?",
+                params + [limit + 1]
+            ).fetchall()
+
+        items = [
+            {
+                "id": row[0],
+                "timestamp": row[1],
+                "class_name": row[2],
+                "confidence": row[3],
+                "is_cacao": bool(row[4]),
+                "source": row[5],
+                "has_thumbnail": bool(row[6])
+            }
+            for row in rows[:limit]
+        ]
+        next_cursor = items[-1]["id"] if len(rows) > limit else None
+        return items, next_cursor
+
+    def thumbnail(self, entry_id):
+        with self._read_lock:
+            row = self._reader.execute("SELECT thumbnail FROM history WHERE id = ?", (entry_id,)).fetchone()
+        return row[0] if row else None
+
+    def aggregates(self, since=None, until=None):
+        """Conteo y confianza media por clase (con el índice de timestamp)"""
+        conditions, params = [], []
+        if since:
+            conditions.append("timestamp >= ?")
+            params.append(since)
+        if until:
+            conditions.append("timestamp < ?")
+            params.append(until)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        with self._read_lock:
+            rows = self._reader.execute(
+                f"SELECT class_name, COUNT(*), AVG(confidence), SUM(is_cacao), MIN(timestamp), MAX(timestamp) "
+                f"FROM history {where} GROUP BY class_name ORDER BY class_name",
+                params
+            ).fetchall()
+
+        return {
+            row[0]: {
+                "count": row[1],
+                "mean_confidence": row[2],
+                "cacao_count": row[3],
+                "first": row[4],
+                "last": row[5]
+            }
+            for row in rows
+        }
+
+    def stats(self):
+        return {
+            "db_path": self.db_path,
+            "written": self.written,
+            "queued": self._queue.qsize(),
+            "dropped": self.dropped,
+            "errors": self.errors
+        }
+
+    def close(self):
+        """Escribe lo pendiente y cierra las conexiones"""
+        self._queue.put(_STOP)
+        self._thread.join(timeout=10)
+        with self._read_lock:
+            self._reader.close()
@@ -0,0 +1,246 @@
+import threading
+
+import numpy as np
+import tensorflow as tf
+
+IMAGE_SIZE = 224
+NUM_FEATURES = 3
+
+IMAGE_SPEC = tf.TensorSpec((None, IMAGE_SIZE, IMAGE_SIZE, 3), tf.float32, name="image")
+FEATURES_SPEC = tf.TensorSpec((None, NUM_FEATURES), tf.float32, name="features")
+
+
+ENGINES = ("keras", "tflite")
+
+
+class CompiledModel:
+    """Motor "keras": el modelo Keras en funciones tf.function con firma fija.
+
+    Evita el costo de despacho de Python de las llamadas eager: la pasada
+    hacia adelante (y la de saliency para la app de Streamlit) se trazan una
+    sola vez para entradas (N, 224, 224, 3) y (N, 3). Con `jit_compile=True`
+    se compila con XLA; como XLA compila una versión por tamaño de lote, los
+    lotes se rellenan hasta el siguiente tamaño de `batch_buckets`.
+    """
+
+    name = "keras"
+
+    def __init__(self, model, jit_compile=False, batch_buckets=(1, 2, 4, 8, 16)):
+        self.model = model
+        self.jit_compile = jit_compile
+        self.batch_buckets = tuple(sorted(set(int(b) for b in batch_buckets if int(b) > 0)))
+
+        self._predict = tf.function(
+            self._forward,
+            input_signature=[IMAGE_SPEC, FEATURES_SPEC],
+            jit_compile=jit_compile
+        )
+        self._saliency = tf.function(
+            self._forward_with_gradients,
+            input_signature=[IMAGE_SPEC, FEATURES_SPEC],
+            jit_compile=jit_compile
+        )
+
+    def _forward(self, images, features):
+        return self.model([images, features], training=False)
+
+    def _forward_with_gradients(self, images, features):
+        with tf.GradientTape() as tape:
+            tape.watch(images)
+            predictions = self.model([images, features], training=False)
+            top_scores = tf.reduce_max(predictions, axis=1)
+        return predictions, tape.gradient(top_scores, images)
+
+    def _bucket_for(self, batch_size):
+        for bucket in self.batch_buckets:
+            if bucket >= batch_size:
+                return bucket
+        return batch_size
+
+    def _pad(self, images, features):
+        """Rellena el lote hasta su bucket para reutilizar el programa XLA ya compilado"""
+        images = np.asarray(images, dtype=np.float32)
+        features = np.asarray(features, dtype=np.float32)
+        batch_size = len(images)
+        if not self.jit_compile:
+            return images, features, batch_size
+
+        padding = self._bucket_for(batch_size) - batch_size
+        if padding:
+            images = np.concatenate([images, np.zeros((padding,) + images.shape[1:], np.float32)])
+            features = np.concatenate([features, np.zeros((padding,) + features.shape[1:], np.float32)])
+        return images, features, batch_size
+
+    def __call__(self, images, features):
+        """Probabilidades (N, clases) como arreglo de NumPy"""
+        images, features, batch_size = self._pad(images, features)
+        return self._predict(images, features).numpy()[:batch_size]
+
+    def predict_with_saliency(self, images, features):
+        """Probabilidades y gradiente de la clase ganadora respecto a la imagen"""
+        images, features, batch_size = self._pad(images, features)
+        predictions, gradients = self._saliency(images, features)
+        return predictions.numpy()[:batch_size], gradients.numpy()[:batch_size]
+
+    def warmup(self, saliency=False):
+        """Traza y compila los tamaños de lote habituales antes de recibir tráfico"""
+        sizes = self.batch_buckets if self.jit_compile else self.batch_buckets[:1]
+        for batch_size in sizes:
+            images = np.zeros((batch_size, IMAGE_SIZE, IMAGE_SIZE, 3), np.float32)
+            features = np.zeros((batch_size, NUM_FEATURES), np.float32)
+            self(images, features)
+            if saliency:
+                self.predict_with_saliency(images, features)
+
+
+class TFLiteEngine:
+    """Motor "tflite": modelo convertido (float16 o int8) ejecutado con el intérprete de TFLite.
+
+    El intérprete no es seguro entre hilos, así que las llamadas se
+    serializan con un candado. Los tensores de entrada se redimensionan
+    solo cuando cambia el tamaño del lote.
+    """
+
+    name = "tflite"
+
+    def __init__(self, model_path, num_threads=None):
+        self.model_path = model_path
+        self.model = None
+        self._lock = threading.Lock()
+        self._interpreter = _make_interpreter(model_path, num_threads)
+        self._interpreter.allocate_tensors()
+
+        # Identificar las entradas por su rango: (N, 224, 224, 3) y (N, 3)
+        inputs = self._interpreter.get_input_details()
+        self._image_input = next(d for d in inputs if len(d["shape"]) == 4)
+        self._features_input = next(d for d in inputs if len(d["shape"]) == 2)
+        self._output = self._interpreter.get_output_details()[0]
+        self._batch_size = None
+
+    def _resize(self, batch_size):
+        if batch_size == self._batch_size:
+            return
+        self._interpreter.resize_tensor_input(
+            self._image_input["index"], [batch_size, IMAGE_SIZE, IMAGE_SIZE, 3]
+        )
+        self._interpreter.resize_tensor_input(
+            self._features_input["index"], [batch_size, NUM_FEATURES]
+        )
+        self._interpreter.allocate_tensors()
+        self._batch_size = batch_size
+
+    def __call__(self, images, features):
+        """Probabilidades (N, clases) como arreglo de NumPy"""
+        images = np.asarray(images, dtype=np.float32)
+        features = np.asarray(features, dtype=np.float32)
+        with self._lock:
+            self._resize(len(images))
+            self._interpreter.set_tensor(self._image_input["index"], _quantize(images, self._image_input))
+            self._interpreter.set_tensor(self._features_input["index"], _quantize(features, self._features_input))
+            self._interpreter.invoke()
+            output = self._interpreter.get_tensor(self._output["index"])
+        return _dequantize(output, self._output)
+
+    def warmup(self, saliency=False):
+        self(
+            np.zeros((1, IMAGE_SIZE, IMAGE_SIZE, 3), np.float32),
+            np.zeros((1, NUM_FEATURES), np.float32)
+        )
+
+
+def _make_interpreter(model_path, num_threads):
+    # Preferir el runtime independiente de LiteRT si está instalado
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        Interpreter = tf.lite.Interpreter
+    return Interpreter(model_path=model_path, num_threads=num_threads)
+
+
+def _quantize(values, detail):
+    """Convierte a la representación entera del tensor si el modelo tiene E/S cuantizada"""
+    dtype = detail["dtype"]
+    if dtype == np.float32:
+        return values
+    scale, zero_point = detail["quantization"]
+    info = np.iinfo(dtype)
+    return np.clip(np.round(values / scale + zero_point), info.min, info.max).astype(dtype)
+
+
+def _dequantize(values, detail):
+    if values.dtype == np.float32:
+        return values
+    scale, zero_point = detail["quantization"]
+    return (values.astype(np.float32) - zero_point) * scale
+
+
+def load_engine(kind, model_path, tflite_path=None, jit_compile=False,
+                batch_buckets=(1, 2, 4, 8, 16), num_threads=None, artifact_cache=None):
+    """Crea el motor de inferencia indicado ("keras" o "tflite").
+
+    Con `artifact_cache` el modelo Keras se carga desde la caché de ese
+    directorio (ver artifacts.py), que se crea si aún no existe.
+    """
+    if kind == "keras":
+        artifact = None
+        if artifact_cache:
+            from artifacts import load_cached_model
+            model, artifact = load_cached_model(model_path, artifact_cache)
+        else:
+            model = tf.keras.models.load_model(model_path)
+        engine = CompiledModel(model, jit_compile=jit_compile, batch_buckets=batch_buckets)
+        engine.artifact = artifact
+        return engine
+    if kind == "tflite":
+        return TFLiteEngine(tflite_path, num_threads=num_threads)
+    raise ValueError(f"Motor de inferencia desconocido: {kind} (opciones: {', '.join(ENGINES)})")
+
+
+def clear_session():
+    """Libera el estado global de Keras (nombres de capas y grafos) después
+    de soltar las referencias al motor, para que sus pesos se puedan liberar"""
+    tf.keras.backend.clear_session()
+
+
+def convert_to_tflite(model, mode="float16", representative_data=None):
+    """Convierte el modelo Keras a TFLite cuantizado ("float16" o "int8").
+
+    Para "int8" se requiere `representative_data`: un iterable de pares
+    (imagen (1, 224, 224, 3), características (1, 3)) ya preprocesados que
+    se usa para calibrar los rangos de activación. Las entradas y salidas
+    del modelo resultante siguen siendo float32.
+    """
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+
+    if mode == "float16":
+        converter.target_spec.supported_types = [tf.float16]
+    elif mode == "int8":
+        if representative_data is None:
+            raise ValueError("La cuantización int8 requiere un conjunto de calibración")
+
+        # El convertidor ordena las entradas por nombre: se alimentan por nombre
+        image_name = next(i.name for i in model.inputs if len(i.shape) == 4)
+        features_name = next(i.name for i in model.inputs if len(i.shape) == 2)
+
+        def representative_dataset():
+            for image, features in representative_data:
+                yield {
+                    image_name: np.asarray(image, np.float32),
+                    features_name: np.asarray(features, np.float32)
+                }
+
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [
+            tf.lite.OpsSet.TFLITE_BUILTINS_INT8,
+            tf.lite.OpsSet.TFLITE_BUILTINS
+        ]
+    else:
+        raise ValueError(f"Modo de cuantización desconocido: {mode}")
+
+    return converter.convert()
+
+
+def parse_batch_buckets(value):
+    """Convierte "1,2,4,8" en (1, 2, 4, 8)"""
+    return tuple(int(part) for part in value.split(",") if part.strip())
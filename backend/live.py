@@ -0,0 +1,106 @@
+import asyncio
+import json
+import time
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+class ScanSession:
+    """Sesión de escaneo continuo por WebSocket (un cliente, una cámara).
+
+    La recepción y el procesamiento corren por separado: mientras se evalúa
+    un fotograma los que llegan reemplazan al pendiente (solo se guarda el
+    último), así un cliente nunca acumula trabajo y uno lento no retrasa a
+    los demás. Un fotograma casi igual al último evaluado (hash perceptual a
+    `dedup_distance` bits o menos) no pasa por el modelo y repite el
+    resultado anterior.
+    """
+
+    def __init__(self, websocket, score_fn, hash_fn, dedup_distance=4, max_frame_bytes=None, on_frame=None):
+        self.websocket = websocket
+        self.score_fn = score_fn
+        self.hash_fn = hash_fn
+        self.dedup_distance = dedup_distance
+        self.max_frame_bytes = max_frame_bytes
+        self.on_frame = on_frame or (lambda outcome: None)
+
+        self._pending = None
+        self._ready = asyncio.Event()
+        self._closed = False
+        self._next_id = 0
+        self._last_hash = None
+        self._last_prediction = None
+        self.scored = 0
+        self.duplicates = 0
+        self.dropped = 0
+        self.errors = 0
+
+    async def run(self):
+        receiver = asyncio.create_task(self._receive())
+        try:
+            while True:
+                await self._ready.wait()
+                self._ready.clear()
+                if self._pending is None:
+                    if self._closed:
+                        break
+                    continue
+                frame, self._pending = self._pending, None
+                await self._process(*frame)
+        finally:
+            receiver.cancel()
+
+    async def _receive(self):
+        try:
+            while True:
+                message = await self.websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                data = message.get("bytes")
+                if data is None:
+                    continue  # solo se aceptan fotogramas binarios
+                if self._pending is not None:
+                    self.dropped += 1
+                    self.on_frame("dropped")
+                self._pending = (self._next_id, data, time.perf_counter())
+                self._next_id += 1
+                self._ready.set()
+        finally:
+            self._closed = True
+            self._ready.set()
+
+    async def _process(self, frame_id, data, received_at):
+        result = {"frame": frame_id}
+        try:
+            if self.max_frame_bytes and len(data) > self.max_frame_bytes:
+                raise ValueError(f"Fotograma de {len(data)} bytes (máximo {self.max_frame_bytes})")
+
+            frame_hash = await self.hash_fn(data)
+            if self._last_hash is not None and \
+                    hamming_distance(frame_hash, self._last_hash) <= self.dedup_distance:
+                self.duplicates += 1
+                outcome = "duplicate"
+                result.update(success=True, duplicate=True, prediction=self._last_prediction)
+            else:
+                prediction = await self.score_fn(data)
+                self._last_hash, self._last_prediction = frame_hash, prediction
+                self.scored += 1
+                outcome = "scored"
+                result.update(success=True, duplicate=False, prediction=prediction)
+        except Exception as e:
+            self.errors += 1
+            outcome = "error"
+            result.update(success=False, error=getattr(e, "detail", None) or str(e))
+
+        self.on_frame(outcome)
+        result.update(
+            latency_ms=(time.perf_counter() - received_at) * 1000,
+            dropped=self.dropped,
+            duplicates=self.duplicates
+        )
+        try:
+            await self.websocket.send_text(json.dumps(result, ensure_ascii=False))
+        except Exception:
+            self._closed = True  # el cliente se desconectó mientras se evaluaba
@@ -1,57 +1,228 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, Header, HTTPException, Query, Request, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-import tensorflow as tf
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 import numpy as np
-from PIL import Image
-import cv2
+import asyncio
+import base64
+import hmac
 import io
 import json
-from typing import Optional
+import zipfile
+from typing import List, Optional
 import os
+import sys
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
 from datetime import datetime
 
+# Permitir importar los módulos del backend tanto con `uvicorn main:app`
+# (desde backend/) como con `uvicorn backend.main:app` (desde la raíz)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from admission import AdmissionController, AdmissionMiddleware
+from batching import MicroBatcher
+from cache import PredictionCache, file_sha256
+from cascade import CascadeEngine, FeatureClassifier
+from history import HistoryStore
+from live import ScanSession
+from metrics import CONTENT_TYPE, MetricsMiddleware, Registry
+from preprocessing import (
+    ImageProcessingError,
+    TENSOR_RECORD,
+    frame_hash,
+    make_thumbnail,
+    parse_tensor_payload,
+    prepare_batch_inputs,
+    prepare_inputs,
+    prepare_inputs_timed
+)
+from uploads import UploadLimitMiddleware, too_large_detail
+from workers import WorkerPool, process_memory, release_memory
+
+@asynccontextmanager
+async def lifespan(app):
+    """Inicia la carga del modelo en segundo plano al arrancar el servidor"""
+    if MODEL_PRELOAD:
+        start_model_loading()
+    watchdog = None
+    if INFERENCE_ENGINE != "remote" and (MODEL_IDLE_UNLOAD_SECONDS > 0 or MEMORY_MAX_RSS_MB > 0):
+        watchdog = asyncio.create_task(model_watchdog())
+    yield
+    if watchdog is not None:
+        watchdog.cancel()
+    # Terminar las miniaturas del historial pendientes antes de cerrar el pool
+    if history_tasks:
+        await asyncio.gather(*history_tasks, return_exceptions=True)
+    preprocess_pool.shutdown()
+    inference_pool.shutdown()
+    if history is not None:
+        history.close()
+
 app = FastAPI(
     title="AI Cacao API",
     description="API para la detección de moniliasis en mazorcas de cacao",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # La configuración de CORS se realiza después de crear todas las rutas
 
-# Cargar el modelo y las clases
-# Detectar entorno y configurar rutas
-if os.path.exists('/opt/render/project/src/cacao_resnet101_classifier3.keras'):
-    # Entorno Render
-    MODEL_PATH = '/opt/render/project/src/cacao_resnet101_classifier3.keras'
-    CLASS_NAMES_PATH = '/opt/render/project/src/class_names.json'
-elif os.path.exists(os.path.join(os.path.dirname(os.getcwd()), "cacao_resnet101_classifier3.keras")):
-    # Entorno local desde backend/
-    MODEL_PATH = os.path.join(os.path.dirname(os.getcwd()), "cacao_resnet101_classifier3.keras")
-    CLASS_NAMES_PATH = os.path.join(os.path.dirname(os.getcwd()), "class_names.json")
-else:
-    # Fallback: buscar en el directorio actual
-    MODEL_PATH = "cacao_resnet101_classifier3.keras"
-    CLASS_NAMES_PATH = "class_names.json"
+# Rutas del modelo y las clases: MODEL_PATH / CLASS_NAMES_PATH o, si no se
+# indican, el directorio actual (Render arranca desde la raíz del repositorio)
+# y luego la raíz del repositorio (arranque desde backend/)
+def find_data_file(env_name, filename):
+    if os.getenv(env_name):
+        return os.getenv(env_name)
+    root_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), filename)
+    return filename if os.path.exists(filename) or not os.path.exists(root_path) else root_path
+
+MODEL_PATH = find_data_file("MODEL_PATH", "cacao_resnet101_classifier3.keras")
+CLASS_NAMES_PATH = find_data_file("CLASS_NAMES_PATH", "class_names.json")
+
+# Caché del modelo en formato de carga rápida (por hash del .keras; vacío = desactivada)
+MODEL_CACHE_DIR = os.getenv("MODEL_CACHE_DIR", "model_cache")
 
 UMBRAL_CONFIANZA_NO_CACAO = 70.0
 
+# Carga del modelo al arrancar (0 = diferida hasta la primera predicción) y
+# espera máxima de una solicitud que llega mientras el modelo se carga
+MODEL_PRELOAD = os.getenv("MODEL_PRELOAD", "1") == "1"
+MODEL_LOAD_TIMEOUT = float(os.getenv("MODEL_LOAD_TIMEOUT", "60"))
+
+# Descarga del modelo (motores keras y tflite): segundos sin predicciones tras
+# los que se libera (0 = nunca) y techo de memoria residente en MB; por encima
+# se rechaza trabajo nuevo con 503 hasta poder descargarlo (0 = sin techo).
+# Se revisa cada MODEL_WATCHDOG_INTERVAL segundos; la siguiente solicitud
+# vuelve a cargar el modelo
+MODEL_IDLE_UNLOAD_SECONDS = float(os.getenv("MODEL_IDLE_UNLOAD_SECONDS", "0"))
+MEMORY_MAX_RSS_MB = float(os.getenv("MEMORY_MAX_RSS_MB", "0"))
+MODEL_WATCHDOG_INTERVAL = float(os.getenv("MODEL_WATCHDOG_INTERVAL", "10"))
+
+# Micro-batching: tamaño máximo del lote y espera máxima para completarlo
+PREDICT_BATCH_SIZE = int(os.getenv("PREDICT_BATCH_SIZE", "8"))
+PREDICT_BATCH_WAIT_MS = float(os.getenv("PREDICT_BATCH_WAIT_MS", "10"))
+
+# /predict/batch: imágenes por pasada del modelo y máximo de imágenes por solicitud
+BATCH_CHUNK_SIZE = int(os.getenv("BATCH_CHUNK_SIZE", "16"))
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "200"))
+
+# /predict/tensor: imágenes ya preprocesadas por solicitud
+TENSOR_MAX_ITEMS = int(os.getenv("TENSOR_MAX_ITEMS", "64"))
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+# Pools de trabajo: decodificación/OpenCV (hilos o procesos) e inferencia
+PREPROCESS_POOL = os.getenv("PREPROCESS_POOL", "thread")
+PREPROCESS_WORKERS = int(os.getenv("PREPROCESS_WORKERS", str(os.cpu_count() or 1)))
+PREPROCESS_MAX_CONCURRENCY = int(os.getenv("PREPROCESS_MAX_CONCURRENCY", str(2 * PREPROCESS_WORKERS)))
+INFERENCE_THREADS = int(os.getenv("INFERENCE_THREADS", "1"))
+
+# Lado mayor de la resolución de trabajo para decodificar y extraer características (0 = original)
+PREPROCESS_MAX_SIDE = int(os.getenv("PREPROCESS_MAX_SIDE", "1024"))
+
+# Límites de subida: bytes por imagen, bytes por solicitud de /predict/batch (subida y
+# zip descomprimido) y megapíxeles a decodificar (medidos tras la reducción JPEG; 0 = sin límite)
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(20 * 1024 * 1024)))
+BATCH_UPLOAD_MAX_BYTES = int(os.getenv("BATCH_UPLOAD_MAX_BYTES", str(256 * 1024 * 1024)))
+IMAGE_MAX_PIXELS = int(float(os.getenv("IMAGE_MAX_MEGAPIXELS", "40")) * 1_000_000)
+
+# Control de admisión de /predict, /predict/batch, /predict/tensor y /explain:
+# solicitudes en curso (total y por cliente), cola de espera (total y por
+# cliente) y segundos máximos en la cola; después se responde 503 con
+# Retry-After (ADMISSION_MAX_IN_FLIGHT=0 lo desactiva)
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", str(2 * PREDICT_BATCH_SIZE)))
+ADMISSION_MAX_IN_FLIGHT_PER_CLIENT = int(os.getenv(
+    "ADMISSION_MAX_IN_FLIGHT_PER_CLIENT", str(max(1, ADMISSION_MAX_IN_FLIGHT // 2))
+))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+ADMISSION_MAX_QUEUE_PER_CLIENT = int(os.getenv("ADMISSION_MAX_QUEUE_PER_CLIENT", "16"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "30"))
+# Cabecera con la dirección del cliente y cantidad de proxies de confianza que la
+# completan (Render: 1). Con 0 o sin cabecera se usa la dirección de la conexión
+ADMISSION_CLIENT_HEADER = os.getenv("ADMISSION_CLIENT_HEADER", "x-forwarded-for")
+ADMISSION_TRUSTED_PROXIES = int(os.getenv("ADMISSION_TRUSTED_PROXIES", "1"))
+
+# /ws/scan: sesiones de cámara simultáneas y bits de diferencia (de 64) por
+# debajo de los cuales un fotograma se considera repetido
+WS_MAX_CLIENTS = int(os.getenv("WS_MAX_CLIENTS", "32"))
+WS_DEDUP_DISTANCE = int(os.getenv("WS_DEDUP_DISTANCE", "4"))
+
+# Inferencia compilada: XLA opcional y tamaños de lote a precalentar
+INFERENCE_JIT = os.getenv("INFERENCE_JIT", "0") == "1"
+INFERENCE_WARMUP_BATCHES = os.getenv("INFERENCE_WARMUP_BATCHES", "1,2,4,8,16")
+
+# Hilos y precisión de TensorFlow (motor keras): se aplica el ajuste guardado en
+# INFERENCE_TUNING_PATH (vacío = valores por defecto); con INFERENCE_TUNE=1 se mide
+# al arrancar si falta o ya no corresponde al modelo/CPU (ver tuning.py)
+INFERENCE_TUNING_PATH = os.getenv("INFERENCE_TUNING_PATH", "inference_tuning.json")
+INFERENCE_TUNE = os.getenv("INFERENCE_TUNE", "0") == "1"
+INFERENCE_TUNE_BATCH_SIZE = int(os.getenv("INFERENCE_TUNE_BATCH_SIZE", str(PREDICT_BATCH_SIZE)))
+
+# Motor de inferencia: "keras" (modelo completo), "tflite" (cuantizado) o
+# "remote" (proceso de inferencia compartido, ver model_server.py)
+INFERENCE_ENGINE = os.getenv("INFERENCE_ENGINE", "keras")
+MODEL_SERVER_ADDRESS = os.getenv("MODEL_SERVER_ADDRESS", "127.0.0.1:8765")
+# Clave compartida con model_server.py: sin valor por defecto, el canal usa pickle
+MODEL_SERVER_AUTHKEY = os.getenv("MODEL_SERVER_AUTHKEY", "")
+if INFERENCE_ENGINE == "remote" and not MODEL_SERVER_AUTHKEY:
+    from model_server import AUTHKEY_MISSING
+    raise SystemExit(AUTHKEY_MISSING)
+TFLITE_MODEL_PATH = os.getenv("TFLITE_MODEL_PATH", os.path.splitext(MODEL_PATH)[0] + ".tflite")
+TFLITE_THREADS = int(os.getenv("TFLITE_THREADS", str(os.cpu_count() or 1)))
+
+# Cascada: clasificador rápido entrenado con tools/evaluate_cascade.py (vacío =
+# desactivada); el motor completo solo se usa si su confianza queda bajo el umbral
+CASCADE_MODEL_PATH = os.getenv("CASCADE_MODEL_PATH", "")
+CASCADE_THRESHOLD = float(os.getenv("CASCADE_THRESHOLD", "0.9"))
+
+# Caché de predicciones por hash del archivo (0 entradas la desactiva)
+PREDICTION_CACHE_ENTRIES = int(os.getenv("PREDICTION_CACHE_ENTRIES", "1024"))
+PREDICTION_CACHE_MAX_BYTES = int(os.getenv("PREDICTION_CACHE_MAX_BYTES", "0")) or None
+PREDICTION_CACHE_TTL = float(os.getenv("PREDICTION_CACHE_TTL", "86400"))
+PREDICTION_CACHE_DB = os.getenv("PREDICTION_CACHE_DB", "")
+
+# Historial de predicciones en SQLite con miniaturas (vacío = desactivado)
+HISTORY_DB = os.getenv("HISTORY_DB", "")
+HISTORY_THUMBNAIL_SIDE = int(os.getenv("HISTORY_THUMBNAIL_SIDE", "128"))
+HISTORY_MAX_ENTRIES = int(os.getenv("HISTORY_MAX_ENTRIES", "100000"))
+# Miniaturas que esperan armarse después de responder; con más se descartan
+HISTORY_MAX_PENDING = int(os.getenv("HISTORY_MAX_PENDING", "64"))
+# Token para consultar el historial (Authorization: Bearer <token>). Es
+# obligatorio: el historial reúne las fotos de todos los usuarios, así que
+# sin token no se activa
+HISTORY_TOKEN = os.getenv("HISTORY_TOKEN", "")
+if HISTORY_DB and not HISTORY_TOKEN:
+    print("Advertencia: HISTORY_DB sin HISTORY_TOKEN; el historial queda desactivado")
+
+# /explain: capa para Grad-CAM (vacío = último bloque convolucional),
+# resolución máxima de la superposición y tamaño de su caché
+EXPLAIN_LAYER = os.getenv("EXPLAIN_LAYER", "") or None
+EXPLAIN_MAX_SIDE = int(os.getenv("EXPLAIN_MAX_SIDE", "512"))
+EXPLAIN_CACHE_ENTRIES = int(os.getenv("EXPLAIN_CACHE_ENTRIES", "64"))
+
 print(f"MODEL_PATH: {MODEL_PATH}")
 print(f"CLASS_NAMES_PATH: {CLASS_NAMES_PATH}")
-print(f"Current working directory: {os.getcwd()}")
-print(f"Parent directory: {os.path.dirname(os.getcwd())}")
-
-# Listar archivos en el directorio actual y padre
-try:
-    print(f"Files in current directory: {os.listdir('.')}")
-    print(f"Files in parent directory: {os.listdir('..')}")
-except Exception as e:
-    print(f"Error listing directories: {e}")
 
 # Variables globales para el modelo y las clases
 model = None
+inference_engine = None
+explainer = None
+explainer_lock = threading.Lock()
 class_names = None
 model_loaded = False
+model_lock = threading.RLock()
+model_load_task = None
+model_load_error = None
+model_load_seconds = None
+inference_tuning = None
+model_artifact = None
+# Pasadas del modelo en curso: el modelo solo se descarga si no hay ninguna
+model_users = 0
+model_last_used = time.monotonic()
+model_unloaded = False
+memory_pressure = False
+model_lifecycle = {"unloads": {}, "reloads": 0, "last_unload": None, "last_reload_seconds": None}
+active_scans = 0
 
 def check_file_exists(file_path):
     exists = os.path.exists(file_path)
@@ -62,16 +233,37 @@ def check_file_exists(file_path):
     return exists
 
 def load_model_and_classes():
-    """Carga el modelo y clases de manera diferida (lazy loading)"""
-    global model, class_names, model_loaded
-    
-    if model_loaded:
-        return True  # Ya está cargado
+    """Carga el modelo y clases una sola vez, aunque se llame desde varios hilos"""
+    global model_load_error, model_load_seconds, model_last_used, model_unloaded
+
+    with model_lock:
+        if model_loaded:
+            return True  # Ya está cargado
+
+        start = time.perf_counter()
+        model_load_error = None
+        loaded = _load_model_and_classes()
+        if loaded:
+            model_load_seconds = time.perf_counter() - start
+            model_last_used = time.monotonic()
+            if model_unloaded:
+                model_unloaded = False
+                model_lifecycle["reloads"] += 1
+                model_lifecycle["last_reload_seconds"] = model_load_seconds
+                print(f"Modelo recargado en {model_load_seconds:.2f} s")
+        elif model_load_error is None:
+            model_load_error = "Archivos del modelo no disponibles"
+        return loaded
+
+def _load_model_and_classes():
+    global model, inference_engine, class_names, model_loaded, model_load_error, inference_tuning, model_artifact
     
     print("Cargando modelo y clases por primera vez...")
     
     # Verificar archivos
-    if not check_file_exists(CLASS_NAMES_PATH) or not check_file_exists(MODEL_PATH):
+    engine_path = TFLITE_MODEL_PATH if INFERENCE_ENGINE == "tflite" else MODEL_PATH
+    if not check_file_exists(CLASS_NAMES_PATH) or \
+            (INFERENCE_ENGINE != "remote" and not check_file_exists(engine_path)):
         print("Error: Archivos necesarios no encontrados")
         return False
     
@@ -83,82 +275,447 @@ def load_model_and_classes():
             print("Archivo de clases cargado exitosamente")
     except Exception as e:
         print(f"Error al cargar archivo de clases: {str(e)}")
+        model_load_error = str(e)
         return False
 
     # Cargar modelo
     try:
-        print("Cargando modelo de TensorFlow...")
-        model = tf.keras.models.load_model(MODEL_PATH)
+        print(f"Cargando modelo (motor: {INFERENCE_ENGINE})...")
+        if INFERENCE_ENGINE == "remote":
+            # Sin TensorFlow en este proceso: el modelo vive en model_server.py
+            from model_server import RemoteEngine
+            inference_engine = RemoteEngine(MODEL_SERVER_ADDRESS, MODEL_SERVER_AUTHKEY)
+        else:
+            # Los hilos de TensorFlow solo se configuran una vez por proceso: tras
+            # una descarga el ajuste aplicado en la primera carga sigue vigente
+            if INFERENCE_ENGINE == "keras" and INFERENCE_TUNING_PATH and not model_unloaded:
+                from tuning import configure
+                inference_tuning = configure(
+                    MODEL_PATH,
+                    INFERENCE_TUNING_PATH,
+                    batch_size=INFERENCE_TUNE_BATCH_SIZE,
+                    tune_if_missing=INFERENCE_TUNE,
+                    jit_compile=INFERENCE_JIT
+                )
+            from inference import load_engine, parse_batch_buckets
+            inference_engine = load_engine(
+                INFERENCE_ENGINE,
+                MODEL_PATH,
+                tflite_path=TFLITE_MODEL_PATH,
+                jit_compile=INFERENCE_JIT,
+                batch_buckets=parse_batch_buckets(INFERENCE_WARMUP_BATCHES),
+                num_threads=TFLITE_THREADS,
+                artifact_cache=MODEL_CACHE_DIR
+            )
+            model_artifact = getattr(inference_engine, "artifact", None)
+        if CASCADE_MODEL_PATH:
+            print(f"Cascada activa: {CASCADE_MODEL_PATH} (umbral {CASCADE_THRESHOLD})")
+            inference_engine = CascadeEngine(
+                FeatureClassifier.load(CASCADE_MODEL_PATH),
+                inference_engine,
+                threshold=CASCADE_THRESHOLD,
+                cacao_threshold=UMBRAL_CONFIANZA_NO_CACAO / 100
+            )
+            if inference_engine.first_stage.gate is None:
+                print("Advertencia: la primera etapa no tiene compuerta de \"no es cacao\"; "
+                      "todas las imágenes pasan al modelo completo (reentrenar con evaluate_cascade.py)")
+        # El modelo Keras solo está disponible con el motor "keras"
+        model = inference_engine.model
+        print("Precalentando el motor de inferencia...")
+        inference_engine.warmup()
         model_loaded = True
         print("Modelo cargado exitosamente")
         return True
     except Exception as e:
         print(f"Error al cargar el modelo: {str(e)}")
+        model_load_error = str(e)
         return False
 
-# NO cargar el modelo al inicio para ahorrar memoria
-print("API iniciada. El modelo se cargará en la primera predicción.")
+def start_model_loading():
+    """Inicia la carga compartida del modelo si no hay una en curso"""
+    global model_load_task
+    if model_load_task is None or (model_load_task.done() and not model_loaded):
+        loop = asyncio.get_running_loop()
+        model_load_task = loop.run_in_executor(inference_pool.executor, load_model_and_classes)
+    return model_load_task
+
+def model_state():
+    if model_loaded:
+        return "ready"
+    if model_load_task is not None and not model_load_task.done():
+        return "loading"
+    if model_load_error is not None:
+        return "error"
+    if model_unloaded:
+        return "unloaded"
+    return "idle"
 
-def preprocess_image(image_bytes):
-    """Preprocesa la imagen para el modelo"""
+@contextmanager
+def engine_in_use():
+    """Motor de inferencia para una pasada. Mientras dure no se descarga; si
+    se descargó después de require_model, se vuelve a cargar aquí mismo."""
+    global model_users, model_last_used
+    with model_lock:
+        if not model_loaded and not load_model_and_classes():
+            raise RuntimeError(model_load_error or "Archivos del modelo no disponibles")
+        model_users += 1
+        engine = inference_engine
     try:
-        # Convertir bytes a imagen
-        image = Image.open(io.BytesIO(image_bytes)).convert('RGB')
-        image_array = np.asarray(image)
-        
-        # Redimensionar
-        img_resized = cv2.resize(image_array, (224, 224))
-        img_array_resized = np.asarray(img_resized, dtype=np.float32)
-        
-        # Preprocesar para ResNet
-        img_preprocessed = tf.keras.applications.resnet_v2.preprocess_input(
-            np.expand_dims(img_array_resized, axis=0)
+        yield engine
+    finally:
+        with model_lock:
+            model_users -= 1
+            model_last_used = time.monotonic()
+
+def unload_model(reason):
+    """Libera el motor de inferencia si ninguna pasada lo está usando y
+    devuelve la memoria liberada (None si no se descargó)"""
+    global model, inference_engine, explainer, model_loaded, model_unloaded
+
+    with model_lock:
+        if not model_loaded or model_users > 0:
+            return None
+        start = time.perf_counter()
+        rss_before = process_memory()["rss_bytes"]
+        model_loaded = False
+        model_unloaded = True
+        model = inference_engine = explainer = None
+        from inference import clear_session
+        clear_session()
+        release_memory()
+        rss_after = process_memory()["rss_bytes"]
+
+    detail = {
+        "reason": reason,
+        "timestamp": datetime.now().isoformat(),
+        "seconds": time.perf_counter() - start,
+        "rss_before_bytes": rss_before,
+        "rss_after_bytes": rss_after,
+        "released_bytes": rss_before - rss_after if rss_before is not None and rss_after is not None else None
+    }
+    unloads = model_lifecycle["unloads"]
+    unloads[reason] = unloads.get(reason, 0) + 1
+    model_lifecycle["last_unload"] = detail
+    model_unloads_total.inc(reason=reason)
+    released = detail["released_bytes"]
+    print(f"Modelo descargado ({reason}): "
+          f"{released / 1e6 if released is not None else 0:.0f} MB devueltos al sistema")
+    return detail
+
+async def model_watchdog():
+    """Descarga el modelo tras MODEL_IDLE_UNLOAD_SECONDS sin uso o si la
+    memoria residente pasa MEMORY_MAX_RSS_MB"""
+    global memory_pressure
+    while True:
+        await asyncio.sleep(1 if memory_pressure else MODEL_WATCHDOG_INTERVAL)
+        rss = process_memory()["rss_bytes"]
+        if MEMORY_MAX_RSS_MB > 0 and rss is not None and rss > MEMORY_MAX_RSS_MB * 1024 * 1024:
+            if not memory_pressure:
+                print(f"Memoria residente {rss / 1e6:.0f} MB sobre el techo de {MEMORY_MAX_RSS_MB:.0f} MB")
+            # No se admite trabajo nuevo hasta que terminen las pasadas en curso
+            memory_pressure = True
+            if not model_loaded or await asyncio.to_thread(unload_model, "memory") is not None:
+                memory_pressure = False
+            continue
+        memory_pressure = False
+
+        idle = time.monotonic() - model_last_used
+        busy = admission is not None and admission.in_flight > 0
+        if model_loaded and MODEL_IDLE_UNLOAD_SECONDS > 0 and idle >= MODEL_IDLE_UNLOAD_SECONDS and not busy:
+            await asyncio.to_thread(unload_model, "idle")
+
+if MODEL_PRELOAD:
+    print("API iniciada. El modelo se cargará en segundo plano.")
+else:
+    print("API iniciada. El modelo se cargará en la primera predicción.")
+
+def get_explainer():
+    """Crea el explicador la primera vez que se usa (traza su propio grafo)"""
+    global explainer
+    with explainer_lock:
+        if explainer is None:
+            from explain import Explainer
+            explainer = Explainer(
+                inference_engine,
+                layer_name=EXPLAIN_LAYER,
+                max_side=EXPLAIN_MAX_SIDE,
+                cache_entries=EXPLAIN_CACHE_ENTRIES,
+                preprocess_max_side=PREPROCESS_MAX_SIDE,
+                max_pixels=IMAGE_MAX_PIXELS
+            )
+        return explainer
+
+def explain_contents(contents, mode):
+    """(probabilidades del modelo completo, superposición, probabilidades con
+    que habría respondido la primera etapa de la cascada o None)"""
+    with engine_in_use() as engine:
+        probabilities, overlay = get_explainer().explain(contents, mode)
+        first_stage = None
+        if isinstance(engine, CascadeEngine):
+            images, features = prepare_inputs(contents, PREPROCESS_MAX_SIDE, IMAGE_MAX_PIXELS)
+            first_stage = engine.first_stage_answer(images, features)[0]
+            if np.isnan(first_stage).any():
+                first_stage = None
+        return probabilities, overlay, first_stage
+
+def run_model(images, features):
+    """Ejecuta el modelo sobre un lote completo y devuelve las probabilidades"""
+    start = time.perf_counter()
+    with engine_in_use() as engine:
+        probabilities = engine(images, features)
+    inference_batch_seconds.observe(time.perf_counter() - start)
+    inference_batch_size.observe(len(images))
+    return probabilities
+
+def build_prediction(probabilities, count=True):
+    """Convierte las probabilidades de una imagen en el resultado de la API
+    (`count=False` no la suma a las predicciones de /metrics)"""
+    predicted_class_idx = int(np.argmax(probabilities))
+    confidence = float(probabilities[predicted_class_idx] * 100)
+    predicted_class = class_names[predicted_class_idx]
+
+    # Determinar resultado
+    is_cacao = confidence >= UMBRAL_CONFIANZA_NO_CACAO
+    if count:
+        predictions_total.inc(class_name=predicted_class)
+
+    return {
+        "is_cacao": is_cacao,
+        "class_name": predicted_class,
+        "confidence": confidence,
+        "timestamp": datetime.now().isoformat()
+    }
+
+# El trabajo de CPU corre fuera del event loop para que /health y el resto
+# de solicitudes sigan respondiendo mientras se procesa una imagen lenta
+preprocess_pool = WorkerPool(
+    "preprocess",
+    PREPROCESS_WORKERS,
+    max_concurrency=PREPROCESS_MAX_CONCURRENCY,
+    use_processes=PREPROCESS_POOL == "process"
+)
+inference_pool = WorkerPool("inference", INFERENCE_THREADS)
+
+# Agrupa las predicciones concurrentes en una sola pasada del modelo
+batcher = MicroBatcher(
+    run_model,
+    max_batch_size=PREDICT_BATCH_SIZE,
+    max_wait_ms=PREDICT_BATCH_WAIT_MS,
+    executor=inference_pool.executor
+)
+
+# Acota la memoria y la latencia cuando llegan muchas subidas a la vez
+admission = AdmissionController(
+    max_in_flight=ADMISSION_MAX_IN_FLIGHT,
+    max_in_flight_per_client=ADMISSION_MAX_IN_FLIGHT_PER_CLIENT,
+    max_queue=ADMISSION_MAX_QUEUE,
+    max_queue_per_client=ADMISSION_MAX_QUEUE_PER_CLIENT,
+    queue_timeout=ADMISSION_QUEUE_TIMEOUT
+) if ADMISSION_MAX_IN_FLIGHT > 0 else None
+
+def prediction_cache_namespace():
+    """Separa las entradas de la caché por motor, contenido del modelo (SHA-256,
+    no el nombre del archivo: un modelo reentrenado con el mismo nombre no debe
+    devolver resultados viejos, tampoco desde PREDICTION_CACHE_DB), cascada y
+    ajustes de preprocesamiento que cambian la entrada del modelo"""
+    def fingerprint(path):
+        return file_sha256(path) if os.path.exists(path) else os.path.basename(path)
+
+    model_file = TFLITE_MODEL_PATH if INFERENCE_ENGINE == "tflite" else MODEL_PATH
+    namespace = (
+        f"{INFERENCE_ENGINE}:{fingerprint(model_file)}:"
+        f"max_side={PREPROCESS_MAX_SIDE}:max_pixels={IMAGE_MAX_PIXELS}:"
+    )
+    if CASCADE_MODEL_PATH:
+        namespace += f"cascade={fingerprint(CASCADE_MODEL_PATH)}:{CASCADE_THRESHOLD}:"
+    return namespace
+
+# Las fotos reenviadas (reintentos, historial del frontend) no vuelven a pasar por el modelo
+cache_namespace = prediction_cache_namespace() if PREDICTION_CACHE_ENTRIES > 0 else ""
+prediction_cache = PredictionCache(
+    max_entries=PREDICTION_CACHE_ENTRIES,
+    max_bytes=PREDICTION_CACHE_MAX_BYTES,
+    ttl_seconds=PREDICTION_CACHE_TTL,
+    db_path=PREDICTION_CACHE_DB,
+    namespace=cache_namespace
+)
+
+# Las escrituras del historial ocurren en un hilo aparte, fuera de /predict
+history = HistoryStore(HISTORY_DB, max_entries=HISTORY_MAX_ENTRIES) if HISTORY_DB and HISTORY_TOKEN else None
+# Tareas de historial en curso (se guarda la referencia para que no se recolecten)
+history_tasks = set()
+
+# Métricas en formato Prometheus (/metrics). Registrar una observación cuesta
+# una búsqueda binaria y un candado, del orden de un microsegundo
+metrics = Registry()
+stage_seconds = metrics.histogram(
+    "monilia_predict_stage_seconds", "Duración de cada etapa de /predict", ["stage"]
+)
+inference_batch_seconds = metrics.histogram(
+    "monilia_inference_batch_seconds", "Duración de cada pasada del modelo"
+)
+inference_batch_size = metrics.histogram(
+    "monilia_inference_batch_size", "Imágenes por pasada del modelo", buckets=(1, 2, 4, 8, 16, 32, 64)
+)
+predictions_total = metrics.counter(
+    "monilia_predictions_total", "Predicciones devueltas por clase", ["class_name"]
+)
+http_requests_total = metrics.counter(
+    "monilia_http_requests_total", "Solicitudes HTTP atendidas", ["endpoint", "status_code"]
+)
+http_errors_total = metrics.counter(
+    "monilia_http_request_errors_total", "Solicitudes HTTP con estado >= 400", ["endpoint", "status_code"]
+)
+http_request_seconds = metrics.histogram(
+    "monilia_http_request_seconds", "Duración de las solicitudes HTTP", ["endpoint"]
+)
+http_in_flight = metrics.gauge(
+    "monilia_http_requests_in_flight", "Solicitudes HTTP en curso"
+)
+metrics.gauge(
+    "monilia_preprocess_in_flight", "Tareas en el pool de preprocesamiento",
+    function=lambda: preprocess_pool.in_flight
+)
+metrics.gauge(
+    "monilia_inference_queue_length", "Solicitudes esperando lote en el micro-batcher",
+    function=lambda: batcher._queue.qsize() if batcher._queue is not None else 0
+)
+admission_shed_total = metrics.counter(
+    "monilia_admission_shed_total", "Solicitudes rechazadas con 503 por el control de admisión", ["reason"]
+)
+metrics.gauge(
+    "monilia_admission_in_flight", "Solicitudes admitidas en curso",
+    function=lambda: admission.in_flight if admission is not None else 0
+)
+metrics.gauge(
+    "monilia_admission_queue_length", "Solicitudes esperando admisión",
+    function=lambda: admission.queued if admission is not None else 0
+)
+model_unloads_total = metrics.counter(
+    "monilia_model_unloads_total", "Descargas del modelo por motivo", ["reason"]
+)
+scan_frames_total = metrics.counter(
+    "monilia_scan_frames_total", "Fotogramas de /ws/scan por resultado", ["outcome"]
+)
+metrics.gauge("monilia_scan_sessions", "Sesiones de /ws/scan abiertas", function=lambda: active_scans)
+metrics.gauge("monilia_model_loaded", "1 si el modelo está cargado", function=lambda: int(model_loaded))
+metrics.gauge(
+    "monilia_model_load_seconds", "Duración de la última carga del modelo",
+    function=lambda: model_load_seconds
+)
+metrics.counter("monilia_prediction_cache_hits_total", "Aciertos de la caché de predicciones",
+                function=lambda: prediction_cache.hits + prediction_cache.disk_hits)
+metrics.counter("monilia_prediction_cache_misses_total", "Fallos de la caché de predicciones",
+                function=lambda: prediction_cache.misses)
+metrics.gauge("process_resident_memory_bytes", "Memoria residente del proceso",
+              function=lambda: process_memory()["rss_bytes"])
+metrics.gauge("process_peak_resident_memory_bytes", "Pico de memoria residente del proceso",
+              function=lambda: process_memory()["peak_rss_bytes"])
+
+# Las subidas se cortan mientras llegan, antes de guardarse completas
+app.add_middleware(
+    UploadLimitMiddleware,
+    limits={
+        "/predict": UPLOAD_MAX_BYTES,
+        "/explain": UPLOAD_MAX_BYTES,
+        "/predict/batch": BATCH_UPLOAD_MAX_BYTES,
+        "/predict/tensor": TENSOR_MAX_ITEMS * TENSOR_RECORD.itemsize
+    }
+)
+
+if admission is not None:
+    app.add_middleware(
+        AdmissionMiddleware,
+        controller=admission,
+        paths=("/predict", "/predict/batch", "/predict/tensor", "/explain"),
+        client_header=ADMISSION_CLIENT_HEADER,
+        trusted_proxies=ADMISSION_TRUSTED_PROXIES,
+        on_shed=lambda reason: admission_shed_total.inc(reason=reason)
+    )
+
+app.add_middleware(
+    MetricsMiddleware,
+    requests=http_requests_total,
+    errors=http_errors_total,
+    duration=http_request_seconds,
+    in_flight=http_in_flight
+)
+
+async def prepare_upload(contents):
+    """Decodifica y extrae características en el pool de preprocesamiento"""
+    try:
+        img_preprocessed, numerical_features, timings = await preprocess_pool.run(
+            prepare_inputs_timed, contents, PREPROCESS_MAX_SIDE, IMAGE_MAX_PIXELS
         )
-        
-        return img_preprocessed, image_array
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Error al procesar la imagen: {str(e)}")
+    except ImageProcessingError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    for stage, seconds in timings.items():
+        stage_seconds.observe(seconds, stage=stage)
+    return img_preprocessed, numerical_features
 
-def extract_features(image_array):
-    """Extrae características numéricas de la imagen"""
+async def _record_history(contents, prediction, source):
     try:
-        # Convertir a BGR para OpenCV
-        img_bgr = cv2.cvtColor(image_array, cv2.COLOR_RGB2BGR)
-        
-        # Características de manchas negras
-        gray = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY)
-        _, black_mask = cv2.threshold(gray, 30, 255, cv2.THRESH_BINARY_INV)
-        percentage_black = (np.sum(black_mask > 0) / np.prod(img_bgr.shape[:2])) * 100
-
-        # Conteo de manchas grandes
-        num_labels, _, stats, _ = cv2.connectedComponentsWithStats(black_mask, 8, cv2.CV_32S)
-        large_black_spots = sum(1 for i in range(1, num_labels) if stats[i, cv2.CC_STAT_AREA] > 100)
-
-        # Características de color verde
-        hsv = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2HSV)
-        green_mask = cv2.inRange(hsv, np.array([35, 40, 40]), np.array([85, 255, 255]))
-        mean_green = np.mean(hsv[:, :, 2][green_mask > 0]) if np.sum(green_mask > 0) > 0 else 0
-
-        # Normalizar características
-        scaled_black = percentage_black / 100.0
-        scaled_spots = min(large_black_spots / 20.0, 1.0)
-        scaled_green = mean_green / 255.0
-
-        return np.array([[scaled_black, scaled_spots, scaled_green]], dtype=np.float32)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error al extraer características: {str(e)}")
+        thumbnail = await preprocess_pool.run(make_thumbnail, contents, HISTORY_THUMBNAIL_SIDE)
+    except Exception:
+        thumbnail = None
+    history.record(thumbnail, prediction, source)
+
+def record_history(contents, prediction, source):
+    """Guarda la predicción en el historial sin que la solicitud la espere: la
+    miniatura se arma en el pool de preprocesamiento en una tarea aparte que
+    corre después de responder. Si ya hay HISTORY_MAX_PENDING esperando, el
+    registro se descarta (y se cuenta) como cuando se llena la cola del historial"""
+    if history is None:
+        return
+    if len(history_tasks) >= HISTORY_MAX_PENDING:
+        history.dropped += 1
+        return
+    task = asyncio.get_running_loop().create_task(_record_history(contents, prediction, source))
+    history_tasks.add(task)
+    task.add_done_callback(history_tasks.discard)
+
+async def cache_get(key):
+    """Consulta la caché; si tiene copia en SQLite, fuera del event loop"""
+    if prediction_cache.persistent:
+        return await asyncio.to_thread(prediction_cache.get, key)
+    return prediction_cache.get(key)
+
+async def cache_set(key, probabilities):
+    if prediction_cache.persistent:
+        await asyncio.to_thread(prediction_cache.set, key, probabilities)
+    else:
+        prediction_cache.set(key, probabilities)
+
+async def require_model():
+    """Espera la carga compartida del modelo (con tiempo límite) o responde 503"""
+    global model_last_used
+    if memory_pressure:
+        raise HTTPException(
+            status_code=503,
+            detail="El servidor está liberando memoria. Intente nuevamente en unos segundos.",
+            headers={"Retry-After": "5"}
+        )
+    model_last_used = time.monotonic()
+    if model_loaded:
+        return
+
+    try:
+        loaded = await asyncio.wait_for(asyncio.shield(start_model_loading()), MODEL_LOAD_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=503,
+            detail="El modelo se está cargando. Intente nuevamente en unos segundos.",
+            headers={"Retry-After": "5"}
+        )
+    if not loaded:
+        raise HTTPException(
+            status_code=503, 
+            detail="Error al cargar el modelo. Intente nuevamente."
+        )
 
 @app.post("/predict")
 async def predict_image(file: UploadFile = File(...)):
     """Endpoint para predicción de imágenes"""
-    # Cargar modelo si no está cargado aún
-    if not model_loaded:
-        if not load_model_and_classes():
-            raise HTTPException(
-                status_code=503, 
-                detail="Error al cargar el modelo. Intente nuevamente."
-            )
-
     if not file.content_type.startswith("image/"):
         raise HTTPException(
             status_code=400, 
@@ -167,50 +724,398 @@ async def predict_image(file: UploadFile = File(...)):
     
     try:
         # Leer imagen
+        start = time.perf_counter()
         contents = await file.read()
-        img_preprocessed, original_image = preprocess_image(contents)
-        
-        # Extraer características
-        numerical_features = extract_features(original_image)
-        
-        # Realizar predicción
-        predictions = model([
-            tf.convert_to_tensor(img_preprocessed), 
-            tf.convert_to_tensor(numerical_features)
-        ])
-        
-        # Procesar resultados
-        predicted_class_idx = tf.argmax(predictions[0]).numpy()
-        confidence = float(predictions[0][predicted_class_idx] * 100)
-        predicted_class = class_names[predicted_class_idx]
-        
-        # Determinar resultado
-        is_cacao = confidence >= UMBRAL_CONFIANZA_NO_CACAO
+        stage_seconds.observe(time.perf_counter() - start, stage="read")
+
+        start = time.perf_counter()
+        cache_key = prediction_cache.key(contents)
+        probabilities = await cache_get(cache_key)
+        stage_seconds.observe(time.perf_counter() - start, stage="cache")
+
+        # El modelo solo hace falta si la caché no tiene la respuesta (las
+        # clases se leen con la primera carga)
+        if probabilities is None or class_names is None:
+            await require_model()
+
+        if probabilities is None:
+            img_preprocessed, numerical_features = await prepare_upload(contents)
+            
+            # Realizar predicción (agrupada con otras solicitudes concurrentes);
+            # incluye la espera hasta completar el lote
+            start = time.perf_counter()
+            predictions = await batcher.submit(img_preprocessed, numerical_features)
+            stage_seconds.observe(time.perf_counter() - start, stage="inference")
+            probabilities = predictions[0]
+            await cache_set(cache_key, probabilities)
         
-        return JSONResponse({
+        start = time.perf_counter()
+        prediction = build_prediction(np.asarray(probabilities))
+        response = JSONResponse({
             "success": True,
-            "prediction": {
-                "is_cacao": is_cacao,
-                "class_name": predicted_class,
-                "confidence": confidence,
-                "timestamp": datetime.now().isoformat()
-            }
+            "prediction": prediction
         })
+        stage_seconds.observe(time.perf_counter() - start, stage="serialization")
+
+        record_history(contents, prediction, "predict")
+        return response
         
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error en la predicción: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+def read_batch_uploads(uploads):
+    """Devuelve la lista (nombre, bytes) de las imágenes enviadas o del zip.
+
+    Los zip se revisan antes de extraer nada: cantidad de imágenes y tamaño
+    descomprimido de cada una y del total (BATCH_UPLOAD_MAX_BYTES), así la
+    memoria de la solicitud queda acotada aunque el zip comprima mucho.
+    """
+    items = []
+    total_bytes = 0
+
+    def check_total(extra_files, extra_bytes, name):
+        if len(items) + extra_files > BATCH_MAX_FILES:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Se permiten como máximo {BATCH_MAX_FILES} imágenes por solicitud"
+            )
+        if total_bytes + extra_bytes > BATCH_UPLOAD_MAX_BYTES:
+            raise HTTPException(
+                status_code=413,
+                detail=f"{name}: las imágenes descomprimidas superan el límite de "
+                       f"{BATCH_UPLOAD_MAX_BYTES / (1024 * 1024):.0f} MB por solicitud"
+            )
+
+    for upload in uploads:
+        name = upload.filename or ""
+        contents = upload.file.read()
+
+        if upload.content_type in ("application/zip", "application/x-zip-compressed") \
+                or name.lower().endswith(".zip"):
+            try:
+                with zipfile.ZipFile(io.BytesIO(contents)) as archive:
+                    entries = [
+                        info for info in archive.infolist()
+                        if not info.is_dir()
+                        and not info.filename.startswith("__MACOSX/")
+                        and info.filename.lower().endswith(IMAGE_EXTENSIONS)
+                    ]
+                    # El tamaño descomprimido se conoce antes de extraer (y zipfile
+                    # no entrega más bytes que los declarados)
+                    for info in entries:
+                        if info.file_size > UPLOAD_MAX_BYTES:
+                            raise HTTPException(
+                                status_code=413,
+                                detail=f"{info.filename}: {too_large_detail(UPLOAD_MAX_BYTES)}"
+                            )
+                    check_total(len(entries), sum(info.file_size for info in entries), name)
+                    for info in entries:
+                        items.append((info.filename, archive.read(info)))
+                        total_bytes += info.file_size
+            except zipfile.BadZipFile:
+                raise HTTPException(status_code=400, detail=f"Archivo zip inválido: {name}")
+        elif upload.content_type and upload.content_type.startswith("image/"):
+            if len(contents) > UPLOAD_MAX_BYTES:
+                raise HTTPException(status_code=413, detail=f"{name}: {too_large_detail(UPLOAD_MAX_BYTES)}")
+            check_total(1, len(contents), name)
+            items.append((name, contents))
+            total_bytes += len(contents)
+        else:
+            raise HTTPException(status_code=400, detail=f"El archivo debe ser una imagen o un zip: {name}")
+
+    if not items:
+        raise HTTPException(status_code=400, detail="No se encontraron imágenes en la solicitud")
+    return items
+
+async def stream_batch_predictions(items):
+    """Genera una línea JSON por imagen a medida que termina cada bloque"""
+    for start in range(0, len(items), BATCH_CHUNK_SIZE):
+        chunk = items[start:start + BATCH_CHUNK_SIZE]
+        lines = [None] * len(chunk)
+        images, features, positions = [], [], []
+
+        # Preprocesar el bloque repartido entre los trabajadores del pool;
+        # cada parte calcula las características por lotes
+        part_size = max(1, -(-len(chunk) // preprocess_pool.workers))
+        parts = await asyncio.gather(*(
+            preprocess_pool.run(
+                prepare_batch_inputs,
+                [contents for _, contents in chunk[i:i + part_size]],
+                PREPROCESS_MAX_SIDE,
+                IMAGE_MAX_PIXELS
+            )
+            for i in range(0, len(chunk), part_size)
+        ))
+        results = [result for part in parts for result in part]
+        for offset, result in enumerate(results):
+            if isinstance(result, ImageProcessingError):
+                lines[offset] = {"success": False, "error": result.detail}
+            else:
+                images.append(result[0])
+                features.append(result[1])
+                positions.append(offset)
+
+        if images:
+            try:
+                predictions = await batcher.submit(
+                    np.concatenate(images, axis=0),
+                    np.concatenate(features, axis=0)
+                )
+                for row, offset in enumerate(positions):
+                    prediction = build_prediction(predictions[row])
+                    lines[offset] = {"success": True, "prediction": prediction}
+                    record_history(chunk[offset][1], prediction, "batch")
+            except Exception as e:
+                print(f"Error en la predicción por lotes: {str(e)}")
+                for offset in positions:
+                    lines[offset] = {"success": False, "error": str(e)}
+
+        for offset, line in enumerate(lines):
+            line = {"index": start + offset, "filename": chunk[offset][0], **line}
+            yield json.dumps(line, ensure_ascii=False) + "\n"
+
+@app.post("/predict/batch")
+async def predict_batch(files: List[UploadFile] = File(...)):
+    """Predicción de varias imágenes (o un zip) con resultados en NDJSON"""
+    await require_model()
+
+    # Leer todo antes de responder: los archivos se cierran al iniciar el stream.
+    # La lectura y la descompresión del zip corren en un hilo, fuera del event loop
+    items = await asyncio.to_thread(read_batch_uploads, files)
+
+    return StreamingResponse(
+        stream_batch_predictions(items),
+        media_type="application/x-ndjson"
+    )
+
+@app.post("/predict/tensor")
+async def predict_tensor(request: Request):
+    """Predicción a partir de entradas preprocesadas en el dispositivo: el
+    cuerpo (application/octet-stream) son registros de 224x224x3 píxeles
+    uint8 más las tres características float32 (ver TENSOR_RECORD)"""
+    await require_model()
+
+    payload = await request.body()
+    try:
+        images, features = parse_tensor_payload(payload, TENSOR_MAX_ITEMS)
+    except ImageProcessingError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+    try:
+        start = time.perf_counter()
+        probabilities = await batcher.submit(images, features)
+        stage_seconds.observe(time.perf_counter() - start, stage="inference")
     except Exception as e:
         print(f"Error en la predicción: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+    predictions = [build_prediction(row) for row in np.asarray(probabilities)]
+    if history is not None:
+        for prediction in predictions:
+            history.record(None, prediction, "tensor")
+    return JSONResponse({
+        "success": True,
+        "predictions": predictions
+    })
+
+@app.post("/explain")
+async def explain_image(file: UploadFile = File(...), mode: str = Query("gradcam")):
+    """Predicción con mapa de atención (Grad-CAM o gradiente de entrada)"""
+    await require_model()
+
+    if model is None:
+        raise HTTPException(
+            status_code=501,
+            detail=f"Las explicaciones requieren el motor keras (motor actual: {INFERENCE_ENGINE})"
+        )
+    if mode not in ("gradcam", "saliency"):
+        raise HTTPException(status_code=400, detail="El modo debe ser 'gradcam' o 'saliency'")
+    if not file.content_type.startswith("image/"):
+        raise HTTPException(status_code=400, detail="El archivo debe ser una imagen")
+
+    contents = await file.read()
+    try:
+        probabilities, overlay, first_stage = await inference_pool.run(explain_contents, contents, mode)
+    except ImageProcessingError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except Exception as e:
+        print(f"Error en la explicación: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    # El mapa siempre explica el modelo completo ("served_by"). Con la cascada
+    # activa, /predict pudo responder con la primera etapa: "cascade" indica si
+    # lo habría hecho y con qué clase, que puede no ser la explicada
+    cascade = None
+    if CASCADE_MODEL_PATH:
+        cascade = {
+            "answered": first_stage is not None,
+            "prediction": build_prediction(first_stage, count=False) if first_stage is not None else None
+        }
+    return JSONResponse({
+        "success": True,
+        "mode": mode,
+        "prediction": build_prediction(probabilities),
+        "served_by": "full",
+        "cascade": cascade,
+        "overlay": "data:image/jpeg;base64," + base64.b64encode(overlay).decode("ascii")
+    })
+
+async def score_frame(contents):
+    """Predicción de un fotograma de /ws/scan (agrupada con el resto de solicitudes)"""
+    img_preprocessed, numerical_features = await prepare_upload(contents)
+    predictions = await batcher.submit(img_preprocessed, numerical_features)
+    return build_prediction(predictions[0])
+
+async def hash_frame(contents):
+    try:
+        return await preprocess_pool.run(frame_hash, contents)
+    except ImageProcessingError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+@app.websocket("/ws/scan")
+async def scan_stream(websocket: WebSocket):
+    """Escaneo continuo: recibe fotogramas JPEG binarios y responde un JSON
+    por fotograma evaluado (los que llegan mientras se evalúa se descartan)"""
+    global active_scans
+
+    if active_scans >= WS_MAX_CLIENTS:
+        await websocket.close(code=1013, reason="Demasiadas sesiones de escaneo")
+        return
+    await websocket.accept()
+    active_scans += 1
+    try:
+        try:
+            await require_model()
+        except HTTPException as e:
+            await websocket.send_json({"success": False, "error": e.detail})
+            await websocket.close(code=1013)
+            return
+
+        session = ScanSession(
+            websocket,
+            score_frame,
+            hash_frame,
+            dedup_distance=WS_DEDUP_DISTANCE,
+            max_frame_bytes=UPLOAD_MAX_BYTES,
+            on_frame=lambda outcome: scan_frames_total.inc(outcome=outcome)
+        )
+        await session.run()
+    finally:
+        active_scans -= 1
+
+def require_history(authorization):
+    if history is None:
+        raise HTTPException(status_code=404, detail="El historial está desactivado (HISTORY_DB y HISTORY_TOKEN)")
+    if not hmac.compare_digest(authorization or "", f"Bearer {HISTORY_TOKEN}"):
+        raise HTTPException(
+            status_code=401,
+            detail="Se requiere el token del historial",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+    return history
+
+@app.get("/history")
+async def get_history(
+    limit: int = Query(20, ge=1, le=200),
+    cursor: Optional[int] = None,
+    class_name: Optional[str] = None,
+    authorization: Optional[str] = Header(None)
+):
+    """Predicciones guardadas, de la más reciente a la más antigua.
+    Para la página siguiente se envía `cursor=next_cursor`."""
+    store = require_history(authorization)
+    items, next_cursor = await asyncio.to_thread(store.page, limit, cursor, class_name)
+    for item in items:
+        item["imageUrl"] = f"/history/{item['id']}/thumbnail" if item.pop("has_thumbnail") else None
+    return {"items": items, "next_cursor": next_cursor}
+
+@app.get("/history/stats")
+async def get_history_stats(
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    authorization: Optional[str] = Header(None)
+):
+    """Conteo y confianza media por clase (filtro opcional por timestamp ISO)"""
+    store = require_history(authorization)
+    return {"classes": await asyncio.to_thread(store.aggregates, since, until)}
+
+@app.get("/history/{entry_id}/thumbnail")
+async def get_history_thumbnail(entry_id: int, authorization: Optional[str] = Header(None)):
+    store = require_history(authorization)
+    thumbnail = await asyncio.to_thread(store.thumbnail, entry_id)
+    if thumbnail is None:
+        raise HTTPException(status_code=404, detail="Miniatura no encontrada")
+    return Response(thumbnail, media_type="image/jpeg", headers={"Cache-Control": "private, max-age=86400"})
+
+async def model_server_status():
+    """Estado y memoria del proceso de inferencia compartido (solo motor "remote")"""
+    if INFERENCE_ENGINE != "remote" or not model_loaded:
+        return None
+    try:
+        return await asyncio.wait_for(asyncio.to_thread(inference_engine.status), 2.0)
+    except Exception as e:
+        return {"error": str(e) or type(e).__name__}
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Métricas en formato de texto de Prometheus"""
+    return Response(metrics.render(), media_type=CONTENT_TYPE)
+
+@app.get("/health/live")
+async def liveness_check():
+    """El proceso responde (aunque el modelo siga cargando)"""
+    return {"live": True}
+
+@app.get("/health/ready")
+async def readiness_check():
+    """200 cuando el modelo está cargado y precalentado (o descargado por
+    inactividad: la siguiente solicitud lo vuelve a cargar)"""
+    state = model_state()
+    if state not in ("ready", "unloaded"):
+        return JSONResponse(
+            {"ready": False, "model_state": state, "load_error": model_load_error},
+            status_code=503
+        )
+    return {"ready": True, "model_state": state}
+
 @app.get("/health")
 async def health_check():
     """Endpoint para verificar el estado de la API"""
     return {
-        "status": "ready",
+        "status": model_state(),
+        "live": True,
+        "ready": model_loaded,
         "model_loaded": model_loaded,
+        "model_load_seconds": model_load_seconds,
+        "model_load_error": model_load_error,
         "classes_loaded": class_names is not None,
         "model_path": MODEL_PATH,
+        "inference_engine": INFERENCE_ENGINE,
+        "inference_tuning": inference_tuning,
+        "model_artifact": model_artifact,
+        "cascade": inference_engine.stats() if isinstance(inference_engine, CascadeEngine) else None,
         "class_names_path": CLASS_NAMES_PATH,
-        "memory_optimized": True
+        "memory_optimized": INFERENCE_ENGINE != "remote" and (MODEL_IDLE_UNLOAD_SECONDS > 0 or MEMORY_MAX_RSS_MB > 0),
+        "model_lifecycle": dict(
+            model_lifecycle,
+            idle_seconds=time.monotonic() - model_last_used,
+            idle_unload_seconds=MODEL_IDLE_UNLOAD_SECONDS,
+            max_rss_bytes=int(MEMORY_MAX_RSS_MB * 1024 * 1024) or None,
+            memory_pressure=memory_pressure
+        ),
+        "admission": admission.stats() if admission is not None else None,
+        "cache": prediction_cache.stats(),
+        "explain_cache": explainer.stats() if explainer is not None else None,
+        "history": dict(history.stats(), pending=len(history_tasks)) if history is not None else None,
+        "workers": {
+            "preprocess": preprocess_pool.status(),
+            "inference": inference_pool.status()
+        },
+        "memory": process_memory(),
+        "model_server": await model_server_status()
     }
 
 from fastapi.middleware.cors import CORSMiddleware
@@ -227,6 +1132,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After"],
 )
 
 if __name__ == "__main__":
@@ -0,0 +1,301 @@
+"""Proceso de inferencia dedicado: una sola copia del modelo para varios workers HTTP.
+
+Con `uvicorn --workers N` cada worker cargaría su propia copia de ResNet101.
+En su lugar este proceso carga el modelo una vez y los workers (con
+INFERENCE_ENGINE=remote) le envían los tensores ya preprocesados por un
+socket local (`multiprocessing.connection`). Las solicitudes de todos los
+workers se agrupan en lotes antes de llamar al modelo.
+
+Uso (desde la raíz del repositorio):
+
+    export MODEL_SERVER_AUTHKEY=$(python -c 'import secrets; print(secrets.token_hex(32))')
+    python backend/model_server.py &
+    INFERENCE_ENGINE=remote uvicorn backend.main:app --workers 4 --host=0.0.0.0 --port=10000
+"""
+import argparse
+import os
+import queue
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener, answer_challenge, deliver_challenge
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from workers import process_memory
+
+# Dirección "host:puerto" (TCP local) o ruta de un socket Unix
+DEFAULT_ADDRESS = "127.0.0.1:8765"
+
+# Segundos para completar la autenticación de una conexión nueva
+HANDSHAKE_TIMEOUT = 5.0
+
+
+AUTHKEY_MISSING = (
+    "MODEL_SERVER_AUTHKEY no está definida. El canal con el servidor de inferencia "
+    "usa pickle: quien conozca la clave puede ejecutar código en el proceso. Definir "
+    "la misma clave secreta en el servidor y en los workers, por ejemplo "
+    "MODEL_SERVER_AUTHKEY=$(python -c 'import secrets; print(secrets.token_hex(32))')"
+)
+
+
+def parse_address(address):
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit():
+        return host or "127.0.0.1", int(port)
+    return address
+
+
+def default_model_path():
+    """Misma búsqueda del modelo que backend/main.py"""
+    if os.getenv("MODEL_PATH"):
+        return os.getenv("MODEL_PATH")
+    filename = "cacao_resnet101_classifier3.keras"
+    root_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), filename)
+    return filename if os.path.exists(filename) or not os.path.exists(root_path) else root_path
+
+
+class RemoteEngine:
+    """Motor "remote": delega la inferencia al proceso de model_server.py.
+
+    Tiene la misma interfaz que los motores de inference.py pero no importa
+    TensorFlow, así que cada worker HTTP ocupa solo la memoria de FastAPI y
+    el preprocesamiento. La conexión se reabre si el servidor se reinicia.
+    """
+
+    name = "remote"
+
+    def __init__(self, address=DEFAULT_ADDRESS, authkey=None):
+        if not authkey:
+            raise ValueError(AUTHKEY_MISSING)
+        self.address = parse_address(address)
+        self.authkey = authkey.encode()
+        self.model = None
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _request(self, message):
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._conn is None:
+                        self._conn = Client(self.address, authkey=self.authkey)
+                    self._conn.send(message)
+                    status, payload = self._conn.recv()
+                    break
+                except (EOFError, OSError):
+                    if self._conn is not None:
+                        self._conn.close()
+                        self._conn = None
+                    if attempt:
+                        raise
+        if status != "ok":
+            raise RuntimeError(f"Error en el servidor de inferencia: {payload}")
+        return payload
+
+    def __call__(self, images, features):
+        """Probabilidades (N, clases) como arreglo de NumPy"""
+        return self._request((
+            "predict",
+            np.asarray(images, dtype=np.float32),
+            np.asarray(features, dtype=np.float32)
+        ))
+
+    def warmup(self):
+        """Comprueba que el servidor responde (el modelo ya se precalentó allí)"""
+        self._request(("ping",))
+
+    def status(self):
+        return self._request(("status",))
+
+
+class ModelServer:
+    """Atiende a varios clientes y agrupa sus solicitudes en lotes para el motor"""
+
+    def __init__(self, engine, authkey, max_batch_size=16, max_wait_ms=5.0, tuning=None,
+                 handshake_timeout=HANDSHAKE_TIMEOUT):
+        self.engine = engine
+        self.authkey = authkey
+        self.handshake_timeout = handshake_timeout
+        self.tuning = tuning
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self.clients = 0
+        self.requests = 0
+        self.batches = 0
+        self.started_at = time.time()
+
+    def serve_forever(self, listener):
+        """`listener` sin authkey: la autenticación se hace en el hilo de cada
+        conexión (`_authenticate`), así un cliente que se detiene a mitad del
+        intercambio no bloquea a los demás"""
+        threading.Thread(target=self._batch_loop, name="model-batcher", daemon=True).start()
+        while True:
+            try:
+                conn = listener.accept()
+            except OSError as e:
+                print(f"Conexión rechazada: {e}")
+                continue
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _authenticate(self, conn):
+        """Intercambio de authkey de multiprocessing con tiempo límite total:
+        si no termina a tiempo se cierra el socket, lo que despierta la lectura"""
+        expired = threading.Event()
+
+        def expire():
+            expired.set()
+            try:
+                with socket.socket(fileno=os.dup(conn.fileno())) as sock:
+                    sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+        timer = threading.Timer(self.handshake_timeout, expire)
+        timer.start()
+        try:
+            deliver_challenge(conn, self.authkey)
+            answer_challenge(conn, self.authkey)
+        except (AuthenticationError, EOFError, OSError) as e:
+            print(f"Conexión rechazada: {'tiempo de autenticación agotado' if expired.is_set() else e}")
+            return False
+        finally:
+            timer.cancel()
+        return not expired.is_set()
+
+    def _handle(self, conn):
+        if not self._authenticate(conn):
+            conn.close()
+            return
+        self.clients += 1
+        try:
+            while True:
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    break
+
+                if message[0] == "predict":
+                    future = Future()
+                    self._queue.put((message[1], message[2], future))
+                    try:
+                        reply = ("ok", future.result())
+                    except Exception as e:
+                        reply = ("error", str(e))
+                elif message[0] == "status":
+                    reply = ("ok", self.status())
+                elif message[0] == "ping":
+                    reply = ("ok", None)
+                else:
+                    reply = ("error", f"Mensaje desconocido: {message[0]}")
+                conn.send(reply)
+        finally:
+            self.clients -= 1
+            conn.close()
+
+    def _batch_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            rows = len(batch[0][0])
+            deadline = time.monotonic() + self.max_wait
+            while rows < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(item)
+                rows += len(item[0])
+
+            try:
+                probabilities = self.engine(
+                    np.concatenate([images for images, _, _ in batch]),
+                    np.concatenate([features for _, features, _ in batch])
+                )
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            self.requests += len(batch)
+            self.batches += 1
+            offset = 0
+            for images, _, future in batch:
+                future.set_result(probabilities[offset:offset + len(images)])
+                offset += len(images)
+
+    def status(self):
+        return {
+            "engine": self.engine.name,
+            "tuning": self.tuning,
+            "clients": self.clients,
+            "requests": self.requests,
+            "batches": self.batches,
+            "queued": self._queue.qsize(),
+            "uptime_seconds": time.time() - self.started_at,
+            "memory": process_memory()
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--address", default=os.getenv("MODEL_SERVER_ADDRESS", DEFAULT_ADDRESS))
+    parser.add_argument("--engine", default=os.getenv("MODEL_SERVER_ENGINE", "keras"), choices=["keras", "tflite"])
+    parser.add_argument("--model", default=default_model_path())
+    parser.add_argument("--tflite-model", default=os.getenv("TFLITE_MODEL_PATH"))
+    parser.add_argument("--batch-size", type=int, default=int(os.getenv("PREDICT_BATCH_SIZE", "16")))
+    parser.add_argument("--wait-ms", type=float, default=float(os.getenv("PREDICT_BATCH_WAIT_MS", "5")))
+    args = parser.parse_args()
+
+    authkey = os.getenv("MODEL_SERVER_AUTHKEY", "")
+    if not authkey:
+        raise SystemExit(AUTHKEY_MISSING)
+
+    tuning = None
+    tuning_path = os.getenv("INFERENCE_TUNING_PATH", "inference_tuning.json")
+    if args.engine == "keras" and tuning_path:
+        from tuning import configure
+        tuning = configure(
+            args.model,
+            tuning_path,
+            batch_size=args.batch_size,
+            tune_if_missing=os.getenv("INFERENCE_TUNE", "0") == "1",
+            jit_compile=os.getenv("INFERENCE_JIT", "0") == "1"
+        )
+    from inference import load_engine, parse_batch_buckets
+
+    print(f"Cargando motor {args.engine} ({args.model})...")
+    start = time.perf_counter()
+    engine = load_engine(
+        args.engine,
+        args.model,
+        tflite_path=args.tflite_model or os.path.splitext(args.model)[0] + ".tflite",
+        jit_compile=os.getenv("INFERENCE_JIT", "0") == "1",
+        batch_buckets=parse_batch_buckets(os.getenv("INFERENCE_WARMUP_BATCHES", "1,2,4,8,16")),
+        num_threads=int(os.getenv("TFLITE_THREADS", str(os.cpu_count() or 1))),
+        artifact_cache=os.getenv("MODEL_CACHE_DIR", "model_cache")
+    )
+    engine.warmup()
+    print(f"Modelo listo en {time.perf_counter() - start:.1f} s; RSS {process_memory()['rss_bytes'] / 1e6:.0f} MB")
+
+    address = parse_address(args.address)
+    if isinstance(address, str) and os.path.exists(address):
+        os.unlink(address)
+    with Listener(address) as listener:
+        if isinstance(address, str):
+            # Socket Unix: solo el usuario del servicio puede conectarse
+            os.chmod(address, 0o600)
+        print(f"Servidor de inferencia escuchando en {args.address}")
+        ModelServer(engine, authkey.encode(), args.batch_size, args.wait_ms, tuning).serve_forever(listener)
+
+
+if __name__ == "__main__":
+    main()
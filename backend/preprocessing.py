@@ -0,0 +1,236 @@
+import io
+import math
+import time
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from features import extract_features_batch
+
+# Este módulo no depende de TensorFlow ni de FastAPI para poder ejecutarse
+# en procesos de trabajo livianos (ver workers.py) y desde app.py
+
+MODEL_INPUT_SIZE = (224, 224)
+
+# Lado mayor de la resolución de trabajo (0 = resolución original)
+WORKING_MAX_SIDE = 1024
+
+# Máximo de píxeles a decodificar (después de la reducción JPEG); protege de
+# imágenes "bomba" que ocupan pocos bytes pero muchos megapíxeles (0 = sin límite)
+MAX_IMAGE_PIXELS = 40_000_000
+
+
+# Registro binario de /predict/tensor (imagen ya redimensionada en el dispositivo):
+# 224x224x3 píxeles RGB uint8 seguidos de las tres características float32
+# little-endian; el cuerpo son N registros consecutivos (150540 bytes cada uno)
+TENSOR_RECORD = np.dtype([
+    ("image", np.uint8, (MODEL_INPUT_SIZE[1], MODEL_INPUT_SIZE[0], 3)),
+    ("features", "<f4", (3,))
+])
+
+
+class ImageProcessingError(Exception):
+    """Error de preprocesamiento con el código HTTP que debe devolver la API"""
+
+    def __init__(self, status_code, detail):
+        super().__init__(status_code, detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def resnet_v2_preprocess(images):
+    """Equivalente a tf.keras.applications.resnet_v2.preprocess_input (escala a [-1, 1])"""
+    images = np.asarray(images, dtype=np.float32)
+    images /= 127.5
+    images -= 1.0
+    return images
+
+
+def decode_image(image_bytes, max_side=WORKING_MAX_SIDE, max_pixels=MAX_IMAGE_PIXELS):
+    """Decodifica la imagen una sola vez a una resolución de trabajo acotada.
+
+    Los JPEG se reducen dentro del decodificador (modo draft, escalas 1/2,
+    1/4 y 1/8) sin llegar a decodificar la foto completa; el resto se ajusta
+    con INTER_AREA. Las dimensiones se leen de la cabecera antes de
+    decodificar: si lo que habría que decodificar supera `max_pixels` se
+    rechaza con 422. Devuelve el arreglo RGB y la relación entre el área de
+    trabajo y el área original, necesaria para escalar umbrales en píxeles.
+    """
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+    except Image.DecompressionBombError as e:
+        raise ImageProcessingError(422, f"Imagen demasiado grande: {str(e)}")
+    original_width, original_height = image.size
+
+    if max_side and max(image.size) > max_side:
+        ratio = max_side / max(image.size)
+        requested = (math.ceil(original_width * ratio), math.ceil(original_height * ratio))
+        # Solo tiene efecto en JPEG; elige la mayor reducción que no baje de `requested`
+        image.draft("RGB", requested)
+
+    # Tras draft, image.size es el tamaño que realmente se decodificará
+    if max_pixels and image.size[0] * image.size[1] > max_pixels:
+        raise ImageProcessingError(
+            422,
+            f"Imagen demasiado grande: {original_width}x{original_height} "
+            f"(máximo {max_pixels / 1e6:.0f} megapíxeles)"
+        )
+
+    image_array = np.asarray(image.convert("RGB"))
+
+    if max_side and max(image_array.shape[:2]) > max_side:
+        ratio = max_side / max(image_array.shape[:2])
+        size = (max(1, round(image_array.shape[1] * ratio)), max(1, round(image_array.shape[0] * ratio)))
+        image_array = cv2.resize(image_array, size, interpolation=cv2.INTER_AREA)
+
+    area_scale = (image_array.shape[0] * image_array.shape[1]) / (original_width * original_height)
+    return image_array, area_scale
+
+
+def make_thumbnail(image_bytes, max_side=128, quality=70):
+    """Miniatura JPEG (lado mayor `max_side`) para el historial"""
+    image = Image.open(io.BytesIO(image_bytes))
+    image.draft("RGB", (max_side, max_side))
+    image = image.convert("RGB")
+    image.thumbnail((max_side, max_side))
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+def frame_hash(image_bytes, hash_size=8):
+    """Hash perceptual (dHash) de 64 bits para detectar fotogramas casi iguales.
+
+    Se decodifica a muy baja resolución (draft de JPEG) y se compara cada
+    píxel gris con su vecino derecho; dos fotogramas de la misma escena
+    difieren en pocos bits (distancia de Hamming).
+    """
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+        image.draft("L", (hash_size * 8, hash_size * 8))
+        small = image.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR)
+    except Exception as e:
+        raise ImageProcessingError(400, f"Error al procesar la imagen: {str(e)}")
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = np.packbits((pixels[:, 1:] > pixels[:, :-1]).flatten())
+    return int.from_bytes(bits.tobytes(), "big")
+
+
+def to_model_input(image_array):
+    """Tensor (1, 224, 224, 3) listo para ResNetV2 a partir de un arreglo RGB"""
+    img_resized = cv2.resize(image_array, MODEL_INPUT_SIZE)
+    img_array_resized = np.asarray(img_resized, dtype=np.float32)
+    return resnet_v2_preprocess(np.expand_dims(img_array_resized, axis=0))
+
+
+def parse_tensor_payload(payload, max_items=64):
+    """Tensor (N, 224, 224, 3) y características (N, 3) de un cuerpo de /predict/tensor.
+
+    Los registros se leen sin copiar con np.frombuffer; la única copia es
+    la conversión a float32 de `resnet_v2_preprocess`. Se omite la
+    decodificación, el redimensionado y `extract_features`.
+    """
+    if not payload or len(payload) % TENSOR_RECORD.itemsize:
+        raise ImageProcessingError(
+            400,
+            f"El cuerpo debe contener registros de {TENSOR_RECORD.itemsize} bytes "
+            f"(224x224x3 uint8 + 3 float32), se recibieron {len(payload)} bytes"
+        )
+    records = np.frombuffer(payload, dtype=TENSOR_RECORD)
+    if len(records) > max_items:
+        raise ImageProcessingError(413, f"Máximo {max_items} imágenes por solicitud")
+
+    features = np.ascontiguousarray(records["features"], dtype=np.float32)
+    if not np.isfinite(features).all():
+        raise ImageProcessingError(422, "Las características deben ser números finitos")
+    return resnet_v2_preprocess(records["image"]), features
+
+
+def preprocess_image(image_bytes, max_side=WORKING_MAX_SIDE, max_pixels=MAX_IMAGE_PIXELS):
+    """Preprocesa la imagen para el modelo"""
+    try:
+        image_array, area_scale = decode_image(image_bytes, max_side, max_pixels)
+        return to_model_input(image_array), image_array, area_scale
+    except ImageProcessingError:
+        raise
+    except Exception as e:
+        raise ImageProcessingError(400, f"Error al procesar la imagen: {str(e)}")
+
+
+def extract_features(image_array, area_scale=1.0):
+    """Extrae características numéricas de la imagen.
+
+    `area_scale` es la relación de áreas devuelta por `decode_image`: el
+    umbral de manchas grandes (MIN_SPOT_AREA a resolución original) se
+    escala para que cuente lo mismo que a resolución original.
+    """
+    try:
+        return extract_features_batch(image_array[np.newaxis], area_scale)
+    except Exception as e:
+        raise ImageProcessingError(500, f"Error al extraer características: {str(e)}")
+
+
+def prepare_inputs(image_bytes, max_side=WORKING_MAX_SIDE, max_pixels=MAX_IMAGE_PIXELS):
+    """Decodifica la imagen y devuelve el tensor (1, 224, 224, 3) y las características (1, 3)"""
+    img_preprocessed, image_array, area_scale = preprocess_image(image_bytes, max_side, max_pixels)
+    numerical_features = extract_features(image_array, area_scale)
+    return img_preprocessed, numerical_features
+
+
+def prepare_inputs_timed(image_bytes, max_side=WORKING_MAX_SIDE, max_pixels=MAX_IMAGE_PIXELS):
+    """Como `prepare_inputs`, más la duración en segundos de cada etapa (para /metrics)"""
+    start = time.perf_counter()
+    try:
+        image_array, area_scale = decode_image(image_bytes, max_side, max_pixels)
+        decoded = time.perf_counter()
+        img_preprocessed = to_model_input(image_array)
+    except ImageProcessingError:
+        raise
+    except Exception as e:
+        raise ImageProcessingError(400, f"Error al procesar la imagen: {str(e)}")
+    resized = time.perf_counter()
+    numerical_features = extract_features(image_array, area_scale)
+    timings = {
+        "decode": decoded - start,
+        "resize": resized - decoded,
+        "extract_features": time.perf_counter() - resized
+    }
+    return img_preprocessed, numerical_features, timings
+
+
+def prepare_batch_inputs(images_bytes, max_side=WORKING_MAX_SIDE, max_pixels=MAX_IMAGE_PIXELS):
+    """Como `prepare_inputs` para varias imágenes a la vez.
+
+    Las imágenes con la misma resolución de trabajo (fotos de un mismo
+    teléfono) comparten una sola llamada a `extract_features_batch`. Devuelve
+    una lista alineada con la entrada con (tensor, características) o la
+    ImageProcessingError de esa imagen.
+    """
+    results = [None] * len(images_bytes)
+    groups = {}
+    for i, image_bytes in enumerate(images_bytes):
+        try:
+            img_preprocessed, image_array, area_scale = preprocess_image(image_bytes, max_side, max_pixels)
+        except ImageProcessingError as e:
+            results[i] = e
+            continue
+        results[i] = img_preprocessed
+        groups.setdefault(image_array.shape, []).append((i, image_array, area_scale))
+
+    for members in groups.values():
+        indices = [i for i, _, _ in members]
+        try:
+            features = extract_features_batch(
+                np.stack([image_array for _, image_array, _ in members]),
+                np.array([area_scale for _, _, area_scale in members])
+            )
+        except Exception as e:
+            error = ImageProcessingError(500, f"Error al extraer características: {str(e)}")
+            for i in indices:
+                results[i] = error
+            continue
+        for row, i in enumerate(indices):
+            results[i] = (results[i], features[row:row + 1])
+
+    return results
@@ -0,0 +1,105 @@
+"""Mide el arranque en frío del motor keras con y sin la caché del modelo.
+
+Cada ejecución corre en un proceso nuevo ("spawn") e informa la importación
+de TensorFlow, la carga del modelo, el tiempo hasta la primera predicción
+(desde el inicio del proceso hijo, con el precalentamiento incluido) y el
+pico de memoria residente. Se miden tres casos:
+
+- `sin_cache`: `tf.keras.models.load_model` sobre el .keras (como antes).
+- `exportacion`: primer arranque con la caché vacía (carga y crea el artefacto).
+- `con_cache`: arranques siguientes desde el artefacto (backend/artifacts.py).
+
+Uso (desde la raíz del repositorio):
+
+    python backend/tools/benchmark_cold_start.py --runs 3 --output arranque.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from workers import process_memory
+
+
+def cold_start(model_path, cache_dir):
+    """Se ejecuta en un proceso nuevo por medición"""
+    start = time.perf_counter()
+    from inference import IMAGE_SIZE, NUM_FEATURES, load_engine
+    imported = time.perf_counter()
+    rss_after_import = process_memory()["rss_bytes"]
+
+    engine = load_engine("keras", model_path, artifact_cache=cache_dir)
+    loaded = time.perf_counter()
+    engine.warmup()
+    engine(
+        np.random.default_rng(0).uniform(-1, 1, (1, IMAGE_SIZE, IMAGE_SIZE, 3)).astype(np.float32),
+        np.zeros((1, NUM_FEATURES), np.float32)
+    )
+    first_prediction = time.perf_counter()
+
+    memory = process_memory()
+    return {
+        "import_seconds": imported - start,
+        "load_seconds": loaded - imported,
+        "first_prediction_seconds": first_prediction - start,
+        "rss_after_import_bytes": rss_after_import,
+        "peak_rss_bytes": memory["peak_rss_bytes"],
+        "artifact": getattr(engine, "artifact", None)
+    }
+
+
+def run(model_path, cache_dir):
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(1, mp_context=context) as pool:
+        return pool.submit(cold_start, model_path, cache_dir).result()
+
+
+def summarize(name, samples):
+    summary = {
+        "runs": len(samples),
+        "first_prediction_seconds": float(np.median([s["first_prediction_seconds"] for s in samples])),
+        "load_seconds": float(np.median([s["load_seconds"] for s in samples])),
+        "import_seconds": float(np.median([s["import_seconds"] for s in samples])),
+        "peak_rss_bytes": int(np.max([s["peak_rss_bytes"] for s in samples])),
+        "samples": samples
+    }
+    print(f"{name:12s} primera predicción {summary['first_prediction_seconds']:6.2f} s  "
+          f"carga {summary['load_seconds']:6.2f} s  pico RSS {summary['peak_rss_bytes'] / 1e6:7.0f} MB")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="cacao_resnet101_classifier3.keras")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--output", help="Guardar los resultados en JSON")
+    args = parser.parse_args()
+
+    cache_dir = tempfile.mkdtemp(prefix="model_cache_")
+    try:
+        report = {
+            "model": args.model,
+            "model_bytes": os.path.getsize(args.model),
+            "sin_cache": summarize("sin_cache", [run(args.model, None) for _ in range(args.runs)]),
+            "exportacion": summarize("exportacion", [run(args.model, cache_dir)]),
+            "con_cache": summarize("con_cache", [run(args.model, cache_dir) for _ in range(args.runs)])
+        }
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Compara la latencia del modelo en modo eager contra CompiledModel.
+
+Mide las dos rutas de inferencia del proyecto:
+
+- backend/main.py: pasada hacia adelante `model([imagen, características])`.
+- app.py (`get_prediction_info`): pasada hacia adelante más el gradiente de
+  la clase ganadora respecto a la imagen (mapa de saliency).
+
+Uso (desde la raíz del repositorio):
+
+    python backend/tools/benchmark_inference.py --batch-sizes 1,4,8 --jit
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import tensorflow as tf
+
+from inference import CompiledModel, parse_batch_buckets
+
+
+def eager_forward(model, images, features):
+    return np.asarray(model([tf.convert_to_tensor(images), tf.convert_to_tensor(features)]))
+
+
+def eager_saliency(model, images, features):
+    # Igual que la versión original de get_prediction_info en app.py
+    img_tensor = tf.Variable(images, dtype=tf.float32)
+    with tf.GradientTape() as tape:
+        tape.watch(img_tensor)
+        predictions = model([img_tensor, tf.convert_to_tensor(features)])
+        predicted_class_idx = tf.argmax(predictions[0])
+        predicted_class_score = predictions[0, predicted_class_idx]
+    gradients = tape.gradient(predicted_class_score, img_tensor)
+    return predictions.numpy(), gradients.numpy()
+
+
+def time_call(fn, iterations, warmup):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {
+        "p50_ms": float(np.percentile(samples, 50)),
+        "p95_ms": float(np.percentile(samples, 95)),
+        "mean_ms": float(np.mean(samples))
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="cacao_resnet101_classifier3.keras")
+    parser.add_argument("--batch-sizes", default="1,4,8")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--jit", action="store_true", help="Compilar con XLA")
+    parser.add_argument("--output", help="Guardar el resultado en JSON")
+    args = parser.parse_args()
+
+    batch_sizes = parse_batch_buckets(args.batch_sizes)
+    model = tf.keras.models.load_model(args.model)
+    compiled = CompiledModel(model, jit_compile=args.jit, batch_buckets=batch_sizes)
+
+    start = time.perf_counter()
+    compiled.warmup(saliency=True)
+    warmup_s = time.perf_counter() - start
+
+    rng = np.random.default_rng(0)
+    results = {"model": args.model, "jit_compile": args.jit, "warmup_s": warmup_s, "runs": []}
+
+    for batch_size in batch_sizes:
+        images = rng.uniform(-1, 1, (batch_size, 224, 224, 3)).astype(np.float32)
+        features = rng.uniform(0, 1, (batch_size, 3)).astype(np.float32)
+
+        paths = {
+            "main.predict": (
+                lambda: eager_forward(model, images, features),
+                lambda: compiled(images, features)
+            ),
+            # app.py analiza una sola imagen a la vez
+            "app.get_prediction_info": (
+                lambda: eager_saliency(model, images[:1], features[:1]),
+                lambda: compiled.predict_with_saliency(images[:1], features[:1])
+            ) if batch_size == 1 else None
+        }
+
+        for path, fns in paths.items():
+            if fns is None:
+                continue
+            eager = time_call(fns[0], args.iterations, args.warmup)
+            fast = time_call(fns[1], args.iterations, args.warmup)
+            run = {
+                "path": path,
+                "batch_size": batch_size,
+                "eager": eager,
+                "compiled": fast,
+                "speedup_p50": eager["p50_ms"] / fast["p50_ms"] if fast["p50_ms"] else None
+            }
+            results["runs"].append(run)
+            print(f"{path:<26} lote={batch_size:<3} eager p50={eager['p50_ms']:8.2f} ms  "
+                  f"compilado p50={fast['p50_ms']:8.2f} ms  x{run['speedup_p50']:.2f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
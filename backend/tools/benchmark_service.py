@@ -0,0 +1,279 @@
+"""Benchmark reproducible de latencia y rendimiento del servicio de predicción.
+
+Genera fotos sintéticas de mazorcas (tools/synthetic.py) a varias
+resoluciones y mide:
+
+- Etapas, imagen por imagen y en proceso: decodificación, redimensionado a
+  224x224, `extract_features`, inferencia y serialización de la respuesta.
+- `/predict` de punta a punta con concurrencia fija, dentro del proceso
+  (transporte ASGI, sin red) y por HTTP local (uvicorn en un subproceso, o
+  un servidor ya levantado con `--url`).
+
+Para cada medición informa p50/p95/p99, imágenes/s y el pico de memoria
+residente (RSS). La caché de predicciones se desactiva para medir el costo
+real. El resultado se guarda en JSON junto con el commit para comparar.
+
+Requiere httpx (`pip install httpx`). Uso (desde la raíz del repositorio):
+
+    python backend/tools/benchmark_service.py --resolutions vga,5mp,12mp --concurrency 1,4,16 --output bench.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import httpx
+import numpy as np
+
+from features import extract_features_batch
+from preprocessing import decode_image, to_model_input
+from synthetic import RESOLUTIONS, encode_jpeg, synthetic_pod
+from workers import process_memory
+
+STAGES = ("decode", "resize", "extract_features", "inference", "serialization")
+
+
+def summarize(samples_ms, wall_s=None, images=None):
+    samples = np.asarray(samples_ms)
+    summary = {
+        "count": len(samples),
+        "p50_ms": float(np.percentile(samples, 50)),
+        "p95_ms": float(np.percentile(samples, 95)),
+        "p99_ms": float(np.percentile(samples, 99)),
+        "mean_ms": float(np.mean(samples))
+    }
+    if wall_s:
+        summary["images_per_s"] = (images or len(samples)) / wall_s
+    return summary
+
+
+def peak_rss_mb():
+    memory = process_memory()
+    return (memory["peak_rss_bytes"] or 0) / 1e6
+
+
+def timed(fn, inputs):
+    """Aplica fn a cada entrada; devuelve (resultados, tiempos en ms, segundos totales)"""
+    outputs, samples = [], []
+    start = time.perf_counter()
+    for item in inputs:
+        t0 = time.perf_counter()
+        outputs.append(fn(item))
+        samples.append((time.perf_counter() - t0) * 1000)
+    return outputs, samples, time.perf_counter() - start
+
+
+def benchmark_stages(main, images_bytes, max_side):
+    """Cada etapa recorre todas las imágenes antes de pasar a la siguiente,
+    así el crecimiento del pico de RSS se puede atribuir a cada etapa."""
+    results = {}
+    decoded, samples, wall = timed(lambda b: decode_image(b, max_side), images_bytes)
+    results["decode"] = dict(summarize(samples, wall), peak_rss_mb=peak_rss_mb())
+
+    tensors, samples, wall = timed(lambda d: to_model_input(d[0]), decoded)
+    results["resize"] = dict(summarize(samples, wall), peak_rss_mb=peak_rss_mb())
+
+    features, samples, wall = timed(lambda d: extract_features_batch(d[0][np.newaxis], d[1]), decoded)
+    results["extract_features"] = dict(summarize(samples, wall), peak_rss_mb=peak_rss_mb())
+
+    probabilities, samples, wall = timed(lambda pair: main.run_model(*pair), list(zip(tensors, features)))
+    results["inference"] = dict(summarize(samples, wall), peak_rss_mb=peak_rss_mb())
+
+    _, samples, wall = timed(
+        lambda p: json.dumps({"success": True, "prediction": main.build_prediction(p[0])}),
+        probabilities
+    )
+    results["serialization"] = dict(summarize(samples, wall), peak_rss_mb=peak_rss_mb())
+    return results
+
+
+async def drive(client, images_bytes, concurrency, requests):
+    """Envía `requests` solicitudes a /predict con `concurrency` en vuelo"""
+    semaphore = asyncio.Semaphore(concurrency)
+    samples, errors = [], 0
+
+    async def one(i):
+        nonlocal errors
+        async with semaphore:
+            data = images_bytes[i % len(images_bytes)]
+            t0 = time.perf_counter()
+            response = await client.post("/predict", files={"file": (f"pod_{i}.jpg", data, "image/jpeg")})
+            samples.append((time.perf_counter() - t0) * 1000)
+            if response.status_code != 200:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    wall = time.perf_counter() - start
+    return dict(summarize(samples, wall), concurrency=concurrency, errors=errors)
+
+
+async def benchmark_endpoint(client, images_bytes, concurrency_levels, requests, memory_fn):
+    await drive(client, images_bytes, 1, min(2, requests))  # calentamiento
+    runs = []
+    for concurrency in concurrency_levels:
+        run = await drive(client, images_bytes, concurrency, max(requests, concurrency))
+        run["peak_rss_mb"] = await memory_fn()
+        runs.append(run)
+        print(f"    concurrencia={concurrency:<3} p50={run['p50_ms']:8.1f} ms  p99={run['p99_ms']:8.1f} ms  "
+              f"{run['images_per_s']:6.1f} img/s  errores={run['errors']}")
+    return runs
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def wait_ready(client, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get("/health/ready")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.5)
+    raise SystemExit("El servidor no quedó listo a tiempo")
+
+
+async def run_http(url, datasets, concurrency_levels, requests, timeout):
+    server = None
+    if url is None:
+        port = free_port()
+        url = f"http://127.0.0.1:{port}"
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", BACKEND_DIR, "--port", str(port)],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+
+    async def server_memory():
+        health = (await client.get("/health")).json()
+        return ((health.get("memory") or {}).get("peak_rss_bytes") or 0) / 1e6
+
+    try:
+        async with httpx.AsyncClient(base_url=url, timeout=timeout) as client:
+            await wait_ready(client, timeout)
+            results = {}
+            for name, images_bytes in datasets.items():
+                print(f"  HTTP {url} / {name}")
+                results[name] = await benchmark_endpoint(client, images_bytes, concurrency_levels, requests, server_memory)
+            return results
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+
+async def run_in_process(main, datasets, concurrency_levels, requests, timeout):
+    async def local_memory():
+        return peak_rss_mb()
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.app.router.lifespan_context(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=timeout) as client:
+            results = {}
+            for name, images_bytes in datasets.items():
+                print(f"  En proceso / {name}")
+                results[name] = await benchmark_endpoint(client, images_bytes, concurrency_levels, requests, local_memory)
+            return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--resolutions", default="vga,5mp,12mp", help=f"Opciones: {', '.join(RESOLUTIONS)}")
+    parser.add_argument("--images", type=int, default=8, help="Fotos distintas por resolución")
+    parser.add_argument("--concurrency", default="1,4,16")
+    parser.add_argument("--requests", type=int, default=64, help="Solicitudes por nivel de concurrencia")
+    parser.add_argument("--modes", default="stages,inprocess,http")
+    parser.add_argument("--url", help="Servidor ya levantado para el modo http (si no, se inicia uvicorn)")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Guardar el resultado en JSON")
+    args = parser.parse_args()
+
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    concurrency_levels = [int(c) for c in args.concurrency.split(",")]
+
+    # Sin caché: cada solicitud debe pasar por todo el servicio. Sin control de
+    # admisión: todas las solicitudes vienen del mismo cliente y a la
+    # concurrencia más alta se rechazarían por el límite por cliente
+    os.environ["PREDICTION_CACHE_ENTRIES"] = "0"
+    os.environ["ADMISSION_MAX_IN_FLIGHT"] = "0"
+
+    print("Generando imágenes sintéticas...")
+    datasets = {}
+    for name in args.resolutions.split(","):
+        width, height = RESOLUTIONS[name]
+        datasets[name] = [
+            encode_jpeg(synthetic_pod(width, height, seed=args.seed + i)) for i in range(args.images)
+        ]
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "config": {
+            "resolutions": {name: RESOLUTIONS[name] for name in datasets},
+            "images_per_resolution": args.images,
+            "concurrency": concurrency_levels,
+            "requests": args.requests,
+            "seed": args.seed,
+            "env": {k: v for k, v in os.environ.items() if k.startswith(("INFERENCE_", "PREPROCESS_", "PREDICT_"))}
+        }
+    }
+
+    if "stages" in modes or "inprocess" in modes:
+        import main as service
+        if not service.load_model_and_classes():
+            raise SystemExit("No se pudo cargar el modelo")
+        results["engine"] = service.INFERENCE_ENGINE
+
+        if "stages" in modes:
+            print("Etapas (en proceso, una imagen a la vez):")
+            results["stages"] = {}
+            for name, images_bytes in datasets.items():
+                stages = benchmark_stages(service, images_bytes, service.PREPROCESS_MAX_SIDE)
+                results["stages"][name] = stages
+                print(f"  {name}: " + "  ".join(f"{s}={stages[s]['p50_ms']:.1f} ms" for s in STAGES))
+
+        if "inprocess" in modes:
+            print("/predict en proceso:")
+            results["inprocess"] = asyncio.run(
+                run_in_process(service, datasets, concurrency_levels, args.requests, args.timeout)
+            )
+
+    if "http" in modes:
+        print("/predict por HTTP:")
+        results["http"] = asyncio.run(
+            run_http(args.url, datasets, concurrency_levels, args.requests, args.timeout)
+        )
+
+    results["peak_rss_mb"] = peak_rss_mb()
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Resultados guardados en {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Verifica que el extractor por lotes coincida exactamente con el original.
+
+Compara `features.extract_features_batch` (NumPy/OpenCV) y
+`features.extract_features_tf` (grafo de TensorFlow) contra la
+implementación imagen por imagen original de `extract_features` (backend)
+y `extract_numerical_features_for_prediction` (app.py), incluida aquí como
+referencia. Termina con código 1 si algún valor difiere.
+
+Uso (desde la raíz del repositorio):
+
+    python backend/tools/check_batch_features.py --batch-size 32 --size 1024x768
+    python backend/tools/check_batch_features.py --images fotos/ --no-tf
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+import numpy as np
+
+from features import extract_features_batch, extract_features_tf
+from preprocessing import decode_image
+from synthetic import synthetic_pod
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+def reference_features(image_array, min_area=100):
+    """Implementación original, una imagen a la vez"""
+    img_bgr = cv2.cvtColor(image_array, cv2.COLOR_RGB2BGR)
+
+    gray = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY)
+    _, black_mask = cv2.threshold(gray, 30, 255, cv2.THRESH_BINARY_INV)
+    percentage_black = (np.sum(black_mask > 0) / np.prod(img_bgr.shape[:2])) * 100
+
+    num_labels, _, stats, _ = cv2.connectedComponentsWithStats(black_mask, 8, cv2.CV_32S)
+    large_black_spots = sum(1 for i in range(1, num_labels) if stats[i, cv2.CC_STAT_AREA] > min_area)
+
+    hsv = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2HSV)
+    green_mask = cv2.inRange(hsv, np.array([35, 40, 40]), np.array([85, 255, 255]))
+    mean_green = np.mean(hsv[:, :, 2][green_mask > 0]) if np.sum(green_mask > 0) > 0 else 0
+
+    scaled_black = percentage_black / 100.0
+    scaled_spots = min(large_black_spots / 20.0, 1.0)
+    scaled_green = mean_green / 255.0
+
+    return np.array([scaled_black, scaled_spots, scaled_green], dtype=np.float32)
+
+
+def load_batches(args):
+    """Lotes de imágenes del mismo tamaño con su escala de área"""
+    if args.images:
+        groups = {}
+        for root, _, files in os.walk(args.images):
+            for name in sorted(files):
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    with open(os.path.join(root, name), "rb") as f:
+                        image_array, area_scale = decode_image(f.read(), args.max_side)
+                    groups.setdefault(image_array.shape, []).append((image_array, area_scale))
+        for members in groups.values():
+            yield np.stack([m[0] for m in members]), np.array([m[1] for m in members])
+        return
+
+    width, height = (int(v) for v in args.size.split("x"))
+    rng = np.random.default_rng(0)
+    images = []
+    for seed in range(args.batch_size):
+        if seed % 4 == 3:
+            # Ruido puro: miles de componentes pequeñas cerca del umbral de área
+            images.append(rng.integers(0, 256, (height, width, 3), dtype=np.uint8))
+        else:
+            images.append(synthetic_pod(width, height, seed=seed, disease=seed % 3 / 2))
+    yield np.stack(images), rng.uniform(0.05, 1.0, len(images))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", help="Directorio con fotos reales (se agrupan por tamaño)")
+    parser.add_argument("--max-side", type=int, default=1024)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--size", default="1024x768", help="Tamaño de las imágenes sintéticas")
+    parser.add_argument("--no-tf", action="store_true", help="Omitir la variante de TensorFlow")
+    args = parser.parse_args()
+
+    failed = False
+    for images, area_scales in load_batches(args):
+        # Una pasada previa de cada versión para no medir la primera reserva de memoria
+        reference_features(images[0])
+        extract_features_batch(images, area_scales)
+
+        start = time.perf_counter()
+        expected = np.stack([reference_features(img, 100 * scale) for img, scale in zip(images, area_scales)])
+        reference_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        batched = extract_features_batch(images, area_scales)
+        batched_ms = (time.perf_counter() - start) * 1000
+
+        ok = np.array_equal(batched, expected)
+        failed |= not ok
+        print(f"lote {images.shape}: original {reference_ms:.1f} ms, por lotes {batched_ms:.1f} ms, "
+              f"{'idéntico' if ok else 'DIFIERE'}")
+
+        if not args.no_tf:
+            tf_features = extract_features_tf(images, area_scales).numpy()
+            ok = np.array_equal(tf_features, expected)
+            failed |= not ok
+            print(f"  variante TensorFlow: {'idéntica' if ok else 'DIFIERE'}")
+            if not ok:
+                print(f"  máx. diferencia: {np.abs(tf_features - expected).max(axis=0)}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
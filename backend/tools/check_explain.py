@@ -0,0 +1,95 @@
+"""Verifica que /explain funcione con la red base plana y con la anidada.
+
+Arma modelos pequeños con las mismas entradas que el clasificador (imagen
+224x224 y las tres características): uno con las capas convolucionales en
+el modelo exterior y otro con la red base como submodelo (`x = base(imagen)`,
+la forma habitual de transfer learning, como ResNet101V2). Para cada uno
+crea el Explainer, genera Grad-CAM y saliency y comprueba que las
+probabilidades coincidan con el motor de inferencia y que el mapa no sea
+vacío. Con `--model` se revisa además un modelo guardado. Termina con
+código 1 si algo falla.
+
+Uso (desde la raíz del repositorio):
+
+    python backend/tools/check_explain.py --model cacao_resnet101_classifier3.keras
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+import numpy as np
+import tensorflow as tf
+
+from explain import Explainer
+from inference import IMAGE_SIZE, NUM_FEATURES, CompiledModel
+from preprocessing import prepare_inputs
+from synthetic import synthetic_pod
+
+
+def conv_stack(inputs):
+    x = tf.keras.layers.Conv2D(8, 3, strides=4, activation="relu", name="conv_a")(inputs)
+    return tf.keras.layers.Conv2D(16, 3, strides=2, activation="relu", name="conv_b")(x)
+
+
+def build_model(nested, num_classes=4):
+    image = tf.keras.Input((IMAGE_SIZE, IMAGE_SIZE, 3), name="image")
+    features = tf.keras.Input((NUM_FEATURES,), name="features")
+    if nested:
+        base_input = tf.keras.Input((IMAGE_SIZE, IMAGE_SIZE, 3))
+        base = tf.keras.Model(base_input, conv_stack(base_input), name="base")
+        x = base(image)
+    else:
+        x = conv_stack(image)
+    x = tf.keras.layers.GlobalAveragePooling2D()(x)
+    x = tf.keras.layers.Concatenate()([x, features])
+    outputs = tf.keras.layers.Dense(num_classes, activation="softmax")(x)
+    return tf.keras.Model([image, features], outputs)
+
+
+def check(name, model, image_bytes):
+    engine = CompiledModel(model)
+    explainer = Explainer(engine)
+    explainer.warmup()
+
+    images, features = prepare_inputs(image_bytes)
+    expected = np.asarray(engine(images, features))[0]
+
+    ok = True
+    for mode in ("gradcam", "saliency"):
+        probabilities, overlay = explainer.explain(image_bytes, mode)
+        same = np.allclose(probabilities, expected, atol=1e-5)
+        drawn = cv2.imdecode(np.frombuffer(overlay, np.uint8), cv2.IMREAD_COLOR) is not None
+        ok &= same and drawn
+        print(f"{name} ({explainer.layer_name}) {mode}: "
+              f"{'correcto' if same and drawn else 'FALLA'}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", help="Modelo .keras a revisar además de los de prueba")
+    args = parser.parse_args()
+
+    ok, buffer = cv2.imencode(".jpg", cv2.cvtColor(synthetic_pod(640, 480, seed=0, disease=0.5), cv2.COLOR_RGB2BGR))
+    image_bytes = buffer.tobytes()
+
+    models = [("base plana", build_model(nested=False)), ("base anidada", build_model(nested=True))]
+    if args.model:
+        models.append((os.path.basename(args.model), tf.keras.models.load_model(args.model)))
+
+    failed = False
+    for name, model in models:
+        try:
+            failed |= not check(name, model, image_bytes)
+        except Exception as e:
+            print(f"{name}: FALLA ({str(e).splitlines()[0]})")
+            failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Verifica que el preprocesamiento a resolución acotada no altere las características.
+
+Compara, imagen por imagen, las características y el tensor de 224x224
+calculados a resolución original (comportamiento anterior) contra los
+obtenidos con la resolución de trabajo (`--max-side`, decodificación JPEG
+reducida). Termina con código 1 si alguna diferencia supera la tolerancia.
+
+El verde medio es el promedio del brillo de los píxeles dentro del rango
+verde; cuando casi no hay píxeles verdes (mazorcas maduras o enfermas) ese
+promedio depende de unos pocos píxeles de ruido y cambia con cualquier
+reescalado, así que solo se exige su tolerancia por encima de
+`--min-green-coverage`.
+
+Uso (desde la raíz del repositorio):
+
+    python backend/tools/check_features.py --images fotos/ --max-side 1024
+    python backend/tools/check_features.py --synthetic 20
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+import numpy as np
+
+from preprocessing import decode_image, prepare_inputs
+from synthetic import RESOLUTIONS, encode_jpeg, synthetic_pod
+
+FEATURE_NAMES = ("black_percentage", "large_spots", "mean_green")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+def green_coverage(contents):
+    """Fracción de píxeles en el rango verde a resolución original"""
+    image_array, _ = decode_image(contents, max_side=0)
+    hsv = cv2.cvtColor(cv2.cvtColor(image_array, cv2.COLOR_RGB2BGR), cv2.COLOR_BGR2HSV)
+    return float((cv2.inRange(hsv, np.array([35, 40, 40]), np.array([85, 255, 255])) > 0).mean())
+
+
+def load_samples(args):
+    if args.images:
+        for root, _, files in os.walk(args.images):
+            for name in sorted(files):
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    with open(os.path.join(root, name), "rb") as f:
+                        yield name, f.read()
+        return
+
+    width, height = RESOLUTIONS["12mp"]
+    for seed in range(args.synthetic):
+        yield f"sintetica_{seed}.jpg", encode_jpeg(synthetic_pod(width, height, seed=seed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", help="Directorio con fotos reales")
+    parser.add_argument("--synthetic", type=int, default=10, help="Fotos sintéticas de 12 MP si no hay --images")
+    parser.add_argument("--max-side", type=int, default=1024)
+    parser.add_argument("--tolerance", type=float, nargs=3, default=(0.01, 0.1, 0.02),
+                        metavar=("NEGRO", "MANCHAS", "VERDE"),
+                        help="Diferencia absoluta máxima por característica (escala 0-1)")
+    parser.add_argument("--min-green-coverage", type=float, default=0.01,
+                        help="Cobertura verde mínima para exigir la tolerancia del verde medio")
+    args = parser.parse_args()
+
+    diffs, tensor_diffs, full_times, bounded_times = [], [], [], []
+    for name, contents in load_samples(args):
+        start = time.perf_counter()
+        reference_tensor, reference = prepare_inputs(contents, max_side=0)
+        full_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        tensor, features = prepare_inputs(contents, max_side=args.max_side)
+        bounded_times.append(time.perf_counter() - start)
+
+        diff = np.abs(features[0] - reference[0])
+        coverage = green_coverage(contents)
+        if coverage < args.min_green_coverage:
+            diff[2] = np.nan
+        diffs.append(diff)
+        tensor_diffs.append(float(np.abs(tensor - reference_tensor).mean()))
+        print(f"{name:<28} " + "  ".join(f"{n}={d:.4f}" for n, d in zip(FEATURE_NAMES, diff))
+              + f"  cobertura_verde={coverage:.3f}")
+
+    if not diffs:
+        raise SystemExit("No hay imágenes para comparar")
+
+    diffs = np.array(diffs)
+    print(f"\nImágenes: {len(diffs)}  resolución de trabajo: {args.max_side}px")
+    print(f"Tiempo medio: original {np.mean(full_times) * 1000:.1f} ms, "
+          f"acotado {np.mean(bounded_times) * 1000:.1f} ms")
+    print(f"Diferencia media del tensor 224x224 (escala [-1, 1]): {np.mean(tensor_diffs):.4f}")
+
+    failed = False
+    for i, name in enumerate(FEATURE_NAMES):
+        column = diffs[:, i][~np.isnan(diffs[:, i])]
+        if not len(column):
+            print(f"{name:<18} sin imágenes con cobertura suficiente")
+            continue
+        worst = column.max()
+        ok = worst <= args.tolerance[i]
+        failed |= not ok
+        print(f"{name:<18} máx={worst:.4f} media={column.mean():.4f} n={len(column)} "
+              f"tolerancia={args.tolerance[i]} {'OK' if ok else 'FUERA DE TOLERANCIA'}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""Verifica el historial de predicciones (/history) del servicio.
+
+Arma un modelo pequeño con las mismas entradas que el clasificador y
+levanta el servicio en proceso (transporte ASGI) en dos configuraciones,
+cada una en un subproceso porque la configuración se lee al importar
+main.py:
+
+- `HISTORY_DB` sin `HISTORY_TOKEN`: el historial no se activa (no se crea
+  la base), las rutas de historial responden 404 y /predict sigue
+  funcionando.
+- Con token: sin cabecera o con un token incorrecto se responde 401, con
+  el correcto aparecen las predicciones con su miniatura, y armar la
+  miniatura (aquí demorada a propósito) no demora la respuesta de /predict.
+
+Termina con código 1 si algo falla. Uso (desde la raíz del repositorio):
+
+    python backend/tools/check_history.py
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# Demora artificial de cada miniatura (debe quedar fuera de la respuesta)
+THUMBNAIL_DELAY = 1.0
+
+
+def build_service_files(directory):
+    import tensorflow as tf
+    from check_explain import build_model
+
+    model_path = os.path.join(directory, "model.keras")
+    build_model(nested=False, num_classes=3).save(model_path)
+    class_names_path = os.path.join(directory, "class_names.json")
+    with open(class_names_path, "w") as f:
+        json.dump(["enferma", "madura", "verde"], f)
+    tf.keras.backend.clear_session()
+    return model_path, class_names_path
+
+
+def run_case(case, directory, model_path, class_names_path):
+    env = dict(
+        os.environ,
+        MODEL_PATH=model_path,
+        CLASS_NAMES_PATH=class_names_path,
+        MODEL_CACHE_DIR="",
+        INFERENCE_TUNING_PATH="",
+        PREDICTION_CACHE_ENTRIES="0",
+        HISTORY_DB=os.path.join(directory, f"{case}.sqlite3"),
+        HISTORY_TOKEN="secreto" if case == "token" else ""
+    )
+    result = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--case", case],
+        env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+    )
+    lines = [line for line in result.stdout.splitlines() if line.startswith(("correcto", "FALLA"))]
+    for line in lines:
+        print(f"{case}: {line}")
+    return result.returncode == 0 and bool(lines)
+
+
+async def check_case(case):
+    import httpx
+    import main
+    from synthetic import encode_jpeg, synthetic_pod
+
+    # Miniatura lenta: si /predict la esperara, se notaría en su duración
+    make_thumbnail = main.make_thumbnail
+
+    def slow_thumbnail(*args):
+        time.sleep(THUMBNAIL_DELAY)
+        return make_thumbnail(*args)
+
+    main.make_thumbnail = slow_thumbnail
+
+    results = []
+
+    def expect(name, ok):
+        results.append(ok)
+        print(f"{'correcto' if ok else 'FALLA'}: {name}")
+
+    image = encode_jpeg(synthetic_pod(640, 480, seed=0))
+    files = {"file": ("pod.jpg", image, "image/jpeg")}
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.app.router.lifespan_context(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://check", timeout=60) as client:
+            await client.post("/predict", files=files)  # calentamiento
+
+            start = time.perf_counter()
+            response = await client.post("/predict", files=files)
+            elapsed = time.perf_counter() - start
+            expect("/predict responde 200", response.status_code == 200)
+
+            routes = ("/history", "/history/stats", "/history/1/thumbnail")
+            if case == "tokenless":
+                expect("sin token el historial no se activa", main.history is None)
+                expect("no se crea la base", not os.path.exists(main.HISTORY_DB))
+                for route in routes:
+                    status = (await client.get(route)).status_code
+                    expect(f"{route} sin token configurado responde 404", status == 404)
+                    status = (await client.get(route, headers={"Authorization": "Bearer "})).status_code
+                    expect(f"{route} con token vacío responde 404", status == 404)
+                return all(results)
+
+            expect(f"/predict no espera la miniatura ({elapsed:.2f} s)", elapsed < THUMBNAIL_DELAY)
+            for route in routes:
+                expect(f"{route} sin cabecera responde 401", (await client.get(route)).status_code == 401)
+                status = (await client.get(route, headers={"Authorization": "Bearer otro"})).status_code
+                expect(f"{route} con otro token responde 401", status == 401)
+
+            headers = {"Authorization": "Bearer secreto"}
+            items = []
+            deadline = time.monotonic() + 10 * THUMBNAIL_DELAY
+            while len(items) < 2 and time.monotonic() < deadline:
+                await asyncio.sleep(0.2)
+                items = (await client.get("/history", headers=headers)).json()["items"]
+            expect("se guardan las dos predicciones", len(items) == 2)
+            thumbnail = await client.get(items[0]["imageUrl"], headers=headers) if items else None
+            expect("la miniatura es un JPEG",
+                   thumbnail is not None and thumbnail.status_code == 200 and thumbnail.content[:2] == b"\xff\xd8")
+    return all(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--case", choices=["tokenless", "token"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        sys.exit(0 if asyncio.run(check_case(args.case)) else 1)
+
+    with tempfile.TemporaryDirectory() as directory:
+        model_path, class_names_path = build_service_files(directory)
+        failed = False
+        for case in ("tokenless", "token"):
+            failed |= not run_case(case, directory, model_path, class_names_path)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
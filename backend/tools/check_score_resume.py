@@ -0,0 +1,104 @@
+"""Verifica la reanudación de score_folder.py con salida CSV.
+
+Escribe un CSV de resultados como lo hace score_folder.py, lo corta en cada
+byte de las últimas filas (una interrupción a mitad de escritura), reanuda
+con las fotos que `done_paths` no da por calificadas y comprueba que el CSV
+final tenga cada foto exactamente una vez y todas sus filas completas.
+Termina con código 1 si algo falla. No requiere el modelo.
+
+Uso (desde la raíz del repositorio):
+
+    python backend/tools/check_score_resume.py
+"""
+import csv
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from score_folder import CsvSink
+
+CLASS_NAMES = ("enferma", "madura", "verde")
+COLUMNS = ["path", "class_name", "confidence", "is_cacao"] + [f"prob_{c}" for c in CLASS_NAMES] + ["error"]
+
+
+def make_rows(count):
+    rows = []
+    for i in range(count):
+        path = f"fotos/lote, {i // 4}/mazorca_{i}.jpg"
+        if i % 5 == 4:
+            rows.append(dict.fromkeys(COLUMNS) | {"path": path, "error": "No se pudo decodificar, \"dañada\""})
+            continue
+        probs = [0.1, 0.2, 0.7] if i % 2 else [0.8, 0.15, 0.05]
+        rows.append(dict.fromkeys(COLUMNS) | {
+            "path": path,
+            "class_name": CLASS_NAMES[probs.index(max(probs))],
+            "confidence": max(probs) * 100,
+            "is_cacao": max(probs) >= 0.7,
+            "error": "",
+            **{f"prob_{c}": p for c, p in zip(CLASS_NAMES, probs)}
+        })
+    return rows
+
+
+def problems(path, rows):
+    """Lista de problemas del CSV reanudado (vacía si está correcto)"""
+    found = []
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f, restkey="_extra")
+        written = list(reader)
+    if reader.fieldnames != COLUMNS:
+        found.append("encabezado mal formado")
+    for row in written:
+        if "_extra" in row or any(row.get(c) is None for c in COLUMNS):
+            found.append(f"fila mal formada: {row.get('path')!r}")
+    paths = [row.get("path") for row in written]
+    expected = [row["path"] for row in rows]
+    if sorted(paths, key=str) != sorted(expected):
+        missing = set(expected) - set(paths)
+        repeated = {p for p in paths if paths.count(p) > 1}
+        found.append(f"faltan {len(missing)} y se repiten {len(repeated)} fotos")
+    return found
+
+
+def main():
+    rows = make_rows(12)
+    failures = 0
+    cuts = 0
+    with tempfile.TemporaryDirectory() as directory:
+        complete = os.path.join(directory, "completo.csv")
+        sink = CsvSink(complete, COLUMNS)
+        sink.write(rows[:8])
+        sink.write(rows[8:])
+        with open(complete, "rb") as f:
+            data = f.read()
+
+        # Desde el encabezado incompleto hasta el final de las últimas filas
+        last_rows = data.index(b"\n", len(data) - len(data) // 3) + 1
+        offsets = list(range(0, 40)) + list(range(last_rows, len(data)))
+        resumed = os.path.join(directory, "reanudado.csv")
+        for offset in offsets:
+            shutil.copy(complete, resumed)
+            with open(resumed, "r+b") as f:
+                f.truncate(offset)
+            try:
+                sink = CsvSink(resumed, COLUMNS)
+                done = sink.done_paths()
+                sink.write([row for row in rows if row["path"] not in done])
+                found = problems(resumed, rows)
+            except Exception as e:
+                found = [f"{type(e).__name__}: {e}"]
+            cuts += 1
+            if found:
+                failures += 1
+                if failures <= 5:
+                    print(f"corte en el byte {offset}: FALLA ({'; '.join(found)})")
+
+    print(f"{cuts} cortes, {failures} con fallas: {'correcto' if not failures else 'FALLA'}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
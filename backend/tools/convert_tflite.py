@@ -0,0 +1,153 @@
+"""Convierte el modelo Keras a TFLite y mide la deriva frente al motor Keras.
+
+El conjunto de evaluación es un directorio con una subcarpeta por clase de
+class_names.json (enferma/, madura/, verde/). Para int8 se calibra con
+`--calibration-dir` (cualquier carpeta de fotos; por defecto la de evaluación).
+
+Uso (desde la raíz del repositorio):
+
+    python backend/tools/convert_tflite.py --mode int8 --eval-dir datos/validacion
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import tensorflow as tf
+
+from inference import CompiledModel, TFLiteEngine, convert_to_tflite
+from preprocessing import ImageProcessingError, prepare_inputs
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+def list_images(directory):
+    paths = []
+    for root, _, files in os.walk(directory):
+        paths.extend(os.path.join(root, f) for f in sorted(files) if f.lower().endswith(IMAGE_EXTENSIONS))
+    return sorted(paths)
+
+
+def load_inputs(path):
+    with open(path, "rb") as f:
+        return prepare_inputs(f.read())
+
+
+def calibration_samples(paths, limit):
+    for path in paths[:limit]:
+        try:
+            yield load_inputs(path)
+        except ImageProcessingError as e:
+            print(f"Omitiendo {path}: {e.detail}")
+
+
+def evaluate(keras_engine, tflite_engine, eval_dir, class_names, batch_size):
+    """Compara ambos motores sobre el conjunto etiquetado"""
+    samples = []
+    for label, class_name in enumerate(class_names):
+        for path in list_images(os.path.join(eval_dir, class_name)):
+            samples.append((path, label))
+    if not samples:
+        raise SystemExit(f"No se encontraron imágenes en {eval_dir}/<clase>/")
+
+    labels, keras_probs, tflite_probs, skipped = [], [], [], []
+    for start in range(0, len(samples), batch_size):
+        inputs, chunk_labels = [], []
+        for path, label in samples[start:start + batch_size]:
+            try:
+                inputs.append(load_inputs(path))
+            except ImageProcessingError as e:
+                print(f"Omitiendo {path}: {e.detail}")
+                skipped.append({"path": path, "error": e.detail})
+                continue
+            chunk_labels.append(label)
+        if not inputs:
+            continue
+        images = np.concatenate([i[0] for i in inputs])
+        features = np.concatenate([i[1] for i in inputs])
+        keras_probs.append(keras_engine(images, features))
+        tflite_probs.append(tflite_engine(images, features))
+        labels.extend(chunk_labels)
+    if not labels:
+        raise SystemExit(f"Ninguna imagen de {eval_dir} se pudo procesar")
+
+    labels = np.array(labels)
+    keras_probs = np.concatenate(keras_probs)
+    tflite_probs = np.concatenate(tflite_probs)
+    keras_pred = keras_probs.argmax(axis=1)
+    tflite_pred = tflite_probs.argmax(axis=1)
+
+    per_class = {}
+    for label, class_name in enumerate(class_names):
+        mask = labels == label
+        if not mask.any():
+            continue
+        per_class[class_name] = {
+            "samples": int(mask.sum()),
+            "keras_accuracy": float((keras_pred[mask] == label).mean()),
+            "tflite_accuracy": float((tflite_pred[mask] == label).mean()),
+            "agreement": float((keras_pred[mask] == tflite_pred[mask]).mean()),
+            "max_abs_prob_diff": float(np.abs(keras_probs[mask] - tflite_probs[mask]).max())
+        }
+
+    return {
+        "samples": int(len(labels)),
+        "keras_accuracy": float((keras_pred == labels).mean()),
+        "tflite_accuracy": float((tflite_pred == labels).mean()),
+        "agreement": float((keras_pred == tflite_pred).mean()),
+        "mean_abs_prob_diff": float(np.abs(keras_probs - tflite_probs).mean()),
+        "per_class": per_class,
+        "skipped": skipped
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="cacao_resnet101_classifier3.keras")
+    parser.add_argument("--class-names", default="class_names.json")
+    parser.add_argument("--mode", choices=("float16", "int8"), default="float16")
+    parser.add_argument("--output", help="Ruta del .tflite (por defecto junto al modelo)")
+    parser.add_argument("--calibration-dir", help="Imágenes para calibrar int8")
+    parser.add_argument("--calibration-samples", type=int, default=200)
+    parser.add_argument("--eval-dir", help="Directorio con una subcarpeta por clase")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--report", help="Guardar el informe de deriva en JSON")
+    args = parser.parse_args()
+
+    output = args.output or os.path.splitext(args.model)[0] + ".tflite"
+    with open(args.class_names) as f:
+        class_names = json.load(f)
+
+    print(f"Cargando {args.model}...")
+    model = tf.keras.models.load_model(args.model)
+
+    representative_data = None
+    if args.mode == "int8":
+        calibration_dir = args.calibration_dir or args.eval_dir
+        if not calibration_dir:
+            raise SystemExit("int8 requiere --calibration-dir o --eval-dir")
+        paths = list_images(calibration_dir)
+        print(f"Calibrando con hasta {args.calibration_samples} de {len(paths)} imágenes...")
+        representative_data = list(calibration_samples(paths, args.calibration_samples))
+
+    print(f"Convirtiendo a TFLite ({args.mode})...")
+    tflite_model = convert_to_tflite(model, args.mode, representative_data)
+    with open(output, "wb") as f:
+        f.write(tflite_model)
+    print(f"Guardado {output}: {len(tflite_model) / 1e6:.1f} MB "
+          f"(original {os.path.getsize(args.model) / 1e6:.1f} MB)")
+
+    if args.eval_dir:
+        report = evaluate(CompiledModel(model), TFLiteEngine(output), args.eval_dir, class_names, args.batch_size)
+        report.update({"mode": args.mode, "tflite_path": output, "tflite_bytes": len(tflite_model)})
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        if args.report:
+            with open(args.report, "w") as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
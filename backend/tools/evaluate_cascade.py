@@ -0,0 +1,234 @@
+"""Entrena y evalúa la cascada (clasificador rápido + ResNet101).
+
+Con `--train-dir` entrena la primera etapa (backend/cascade.py) y la guarda
+en `--save`; las etiquetas salen de las subcarpetas por clase o, con
+`--distill`, de las predicciones del modelo completo (sirve cualquier carpeta
+de fotos sin etiquetar). La compuerta de "no es cacao" aprende la decisión
+`is_cacao` del modelo completo sobre esas fotos y las de `--non-cacao-dir`
+(fotos que no son mazorcas: hojas, suelo, personas).
+
+Luego recorre una lista de umbrales sobre `--eval-dir` (una subcarpeta por
+clase) e informa para cada uno la tasa de escalamiento, la exactitud, la
+concordancia con el modelo completo (clase y decisión `is_cacao`) y la
+latencia de inferencia por imagen (p50/p95, medida imagen por imagen). Con
+`--eval-non-cacao-dir` informa además, sobre fotos que no son de cacao,
+cuántas escala y con qué frecuencia coincide la decisión `is_cacao`.
+
+Uso (desde la raíz del repositorio):
+
+    python backend/tools/evaluate_cascade.py --train-dir datos/entrenamiento --save cascade.npz \\
+        --non-cacao-dir datos/no_cacao --eval-dir datos/validacion \\
+        --eval-non-cacao-dir datos/no_cacao_validacion --report cascada.json
+    CASCADE_MODEL_PATH=cascade.npz CASCADE_THRESHOLD=0.9 uvicorn backend.main:app
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from cascade import FeatureClassifier, cascade_inputs, first_stage_answers
+from inference import load_engine
+from preprocessing import ImageProcessingError, prepare_inputs
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+def list_images(directory):
+    paths = []
+    for root, _, files in os.walk(directory):
+        paths.extend(os.path.join(root, f) for f in sorted(files) if f.lower().endswith(IMAGE_EXTENSIONS))
+    return sorted(paths)
+
+
+def labelled_images(directory, class_names):
+    samples = []
+    for label, class_name in enumerate(class_names):
+        samples.extend((path, label) for path in list_images(os.path.join(directory, class_name)))
+    return samples
+
+
+def run_dataset(engine, samples):
+    """Entradas de ambas etapas, probabilidades del modelo completo y su latencia"""
+    rows = []
+    for path, label in samples:
+        try:
+            with open(path, "rb") as f:
+                images, features = prepare_inputs(f.read())
+        except ImageProcessingError as e:
+            print(f"Omitiendo {path}: {e.detail}")
+            continue
+        start = time.perf_counter()
+        probabilities = engine(images, features)[0]
+        rows.append({
+            "label": label,
+            "inputs": cascade_inputs(images, features)[0],
+            "full": np.asarray(probabilities),
+            "full_ms": (time.perf_counter() - start) * 1000
+        })
+    return rows
+
+
+def evaluate(first_stage, rows, thresholds, cacao_threshold, non_cacao_rows=()):
+    """Simula la cascada del servicio (`first_stage_answers`) para cada umbral.
+
+    `rows` son fotos de cacao etiquetadas y `non_cacao_rows` fotos que no son
+    de cacao; la decisión `is_cacao` se compara con la del modelo completo.
+    """
+    all_rows = list(rows) + list(non_cacao_rows)
+    count = len(rows)
+    inputs = np.stack([row["inputs"] for row in all_rows])
+    labels = np.array([row["label"] for row in rows])
+    full_probs = np.stack([row["full"] for row in all_rows])
+    full_pred = full_probs.argmax(axis=1)
+    full_is_cacao = full_probs.max(axis=1) >= cacao_threshold
+    full_ms = np.array([row["full_ms"] for row in all_rows])
+
+    # Latencia de la primera etapa con la compuerta, imagen por imagen como en el servicio
+    first_ms = []
+    first_probs = []
+    for x in inputs:
+        start = time.perf_counter()
+        probabilities = first_stage.predict_proba(x[np.newaxis])
+        first_stage_answers(first_stage, x[np.newaxis], probabilities, 1.0, cacao_threshold)
+        first_ms.append((time.perf_counter() - start) * 1000)
+        first_probs.append(probabilities[0])
+    first_probs = np.stack(first_probs)
+    first_ms = np.array(first_ms)
+    first_pred = first_probs.argmax(axis=1)
+
+    report = {
+        "images": count,
+        "non_cacao_images": len(non_cacao_rows),
+        "cacao_threshold": cacao_threshold,
+        "gate": first_stage.gate is not None,
+        "full_model": {
+            "accuracy": float(np.mean(full_pred[:count] == labels)),
+            "p50_ms": float(np.percentile(full_ms, 50)),
+            "p95_ms": float(np.percentile(full_ms, 95))
+        },
+        "first_stage": {
+            "accuracy": float(np.mean(first_pred[:count] == labels)),
+            "p50_ms": float(np.percentile(first_ms, 50)),
+            "p95_ms": float(np.percentile(first_ms, 95))
+        },
+        "thresholds": []
+    }
+    if non_cacao_rows:
+        report["full_model"]["non_cacao_rejected"] = float(np.mean(~full_is_cacao[count:]))
+
+    for threshold in thresholds:
+        escalated = ~first_stage_answers(first_stage, inputs, first_probs, threshold, cacao_threshold)
+        predictions = np.where(escalated, full_pred, first_pred)
+        is_cacao = np.where(escalated, full_is_cacao, first_probs.max(axis=1) >= cacao_threshold)
+        is_cacao_agrees = is_cacao == full_is_cacao
+        latency = (first_ms + np.where(escalated, full_ms, 0.0))[:count]
+        result = {
+            "threshold": threshold,
+            "escalation_rate": float(np.mean(escalated[:count])),
+            "accuracy": float(np.mean(predictions[:count] == labels)),
+            "agreement_with_full": float(np.mean(predictions[:count] == full_pred[:count])),
+            "is_cacao_agreement": float(np.mean(is_cacao_agrees[:count])),
+            "p50_ms": float(np.percentile(latency, 50)),
+            "p95_ms": float(np.percentile(latency, 95)),
+            "mean_ms": float(np.mean(latency))
+        }
+        line = (f"umbral={threshold:.2f}  escalamiento={result['escalation_rate']:6.1%}  "
+                f"exactitud={result['accuracy']:6.1%}  concordancia={result['agreement_with_full']:6.1%}  "
+                f"is_cacao={result['is_cacao_agreement']:6.1%}  media={result['mean_ms']:7.2f} ms")
+        if non_cacao_rows:
+            result["non_cacao"] = {
+                "escalation_rate": float(np.mean(escalated[count:])),
+                "is_cacao_agreement": float(np.mean(is_cacao_agrees[count:]))
+            }
+            line += (f"  no cacao: escalamiento={result['non_cacao']['escalation_rate']:6.1%} "
+                     f"is_cacao={result['non_cacao']['is_cacao_agreement']:6.1%}")
+        report["thresholds"].append(result)
+        print(line)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="cacao_resnet101_classifier3.keras")
+    parser.add_argument("--engine", default="keras", choices=["keras", "tflite"])
+    parser.add_argument("--class-names", default="class_names.json")
+    parser.add_argument("--train-dir", help="Fotos para entrenar la primera etapa")
+    parser.add_argument("--distill", action="store_true",
+                        help="Etiquetar --train-dir con el modelo completo en lugar de las subcarpetas")
+    parser.add_argument("--save", default="cascade.npz", help="Dónde guardar la primera etapa entrenada")
+    parser.add_argument("--cascade-model", help="Primera etapa ya entrenada (si no se usa --train-dir)")
+    parser.add_argument("--non-cacao-dir", help="Fotos que no son de cacao para entrenar la compuerta")
+    parser.add_argument("--eval-dir", required=True, help="Directorio con una subcarpeta por clase")
+    parser.add_argument("--eval-non-cacao-dir", help="Fotos que no son de cacao para la evaluación")
+    parser.add_argument("--cacao-threshold", type=float, default=70.0,
+                        help="Confianza (%%) bajo la cual el servicio responde \"no es cacao\" "
+                             "(UMBRAL_CONFIANZA_NO_CACAO de main.py)")
+    parser.add_argument("--thresholds", default="0.5,0.6,0.7,0.8,0.85,0.9,0.95,0.99")
+    parser.add_argument("--report", help="Guardar el informe en JSON")
+    args = parser.parse_args()
+
+    with open(args.class_names) as f:
+        class_names = json.load(f)
+    cacao_threshold = args.cacao_threshold / 100
+
+    print(f"Cargando {args.model} ({args.engine})...")
+    engine = load_engine(args.engine, args.model, tflite_path=os.path.splitext(args.model)[0] + ".tflite")
+    engine.warmup()
+
+    if args.train_dir:
+        if args.distill:
+            samples = [(path, None) for path in list_images(args.train_dir)]
+        else:
+            samples = labelled_images(args.train_dir, class_names)
+        if not samples:
+            raise SystemExit(f"No se encontraron imágenes en {args.train_dir}")
+        print(f"Entrenando la primera etapa con {len(samples)} imágenes...")
+        rows = run_dataset(engine, samples)
+        labels = [int(np.argmax(row["full"])) if args.distill else row["label"] for row in rows]
+        first_stage = FeatureClassifier.fit(
+            np.stack([row["inputs"] for row in rows]), labels, len(class_names), class_names
+        )
+
+        gate_rows = list(rows)
+        if args.non_cacao_dir:
+            gate_rows += run_dataset(engine, [(path, None) for path in list_images(args.non_cacao_dir)])
+        else:
+            print("Sin --non-cacao-dir la compuerta solo ve las fotos de cacao que el modelo completo rechaza")
+        first_stage.fit_gate(
+            np.stack([row["inputs"] for row in gate_rows]),
+            [row["full"].max() >= cacao_threshold for row in gate_rows]
+        )
+        first_stage.save(args.save)
+        print(f"Primera etapa guardada en {args.save}")
+    elif args.cascade_model:
+        first_stage = FeatureClassifier.load(args.cascade_model)
+    else:
+        raise SystemExit("Se requiere --train-dir o --cascade-model")
+
+    samples = labelled_images(args.eval_dir, class_names)
+    if not samples:
+        raise SystemExit(f"No se encontraron imágenes en {args.eval_dir}/<clase>/")
+    non_cacao_samples = [(path, None) for path in list_images(args.eval_non_cacao_dir)] \
+        if args.eval_non_cacao_dir else []
+    print(f"Evaluando con {len(samples)} imágenes de cacao y {len(non_cacao_samples)} de otras fotos...")
+    report = evaluate(
+        first_stage,
+        run_dataset(engine, samples),
+        [float(t) for t in args.thresholds.split(",")],
+        cacao_threshold,
+        run_dataset(engine, non_cacao_samples)
+    )
+    report["engine"] = args.engine
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
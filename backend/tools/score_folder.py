@@ -0,0 +1,214 @@
+"""Califica carpetas completas de fotos sin pasar por la API.
+
+Usa el mismo preprocesamiento, características y motor que el backend:
+
+- Procesos de trabajo (contexto "spawn") leen, decodifican y extraen
+  características por bloques; se mantienen varios bloques en vuelo, así el
+  siguiente lote ya está listo mientras el modelo evalúa el actual.
+- El modelo recibe lotes grandes (`--batch-size`).
+- Los resultados se escriben por lote en CSV (o en partes Parquet si la
+  salida termina en .parquet, requiere pyarrow). Al volver a ejecutar con
+  la misma salida se omiten las fotos ya calificadas (reanudación).
+
+Uso (desde la raíz del repositorio):
+
+    python backend/tools/score_folder.py fotos/campaña_2025 --output resultados.csv --batch-size 64
+"""
+import argparse
+import csv
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+# Sin TensorFlow a nivel de módulo: los procesos de trabajo importan este archivo
+from preprocessing import ImageProcessingError, WORKING_MAX_SIDE, prepare_batch_inputs
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+def list_images(directory):
+    paths = []
+    for root, _, files in os.walk(directory):
+        paths.extend(os.path.join(root, f) for f in sorted(files) if f.lower().endswith(IMAGE_EXTENSIONS))
+    return sorted(paths)
+
+
+def load_chunk(paths, max_side):
+    """Se ejecuta en un proceso de trabajo: lee y prepara un bloque de fotos"""
+    contents, readable, results = [], [], []
+    for path in paths:
+        try:
+            with open(path, "rb") as f:
+                contents.append(f.read())
+            readable.append(path)
+        except OSError as e:
+            results.append((path, ImageProcessingError(400, str(e))))
+    return results + list(zip(readable, prepare_batch_inputs(contents, max_side)))
+
+
+class CsvSink:
+    def __init__(self, path, columns):
+        self.path = path
+        self.columns = columns
+
+    def done_paths(self):
+        if not os.path.exists(self.path):
+            return set()
+        self._drop_partial_row()
+        with open(self.path, newline="", encoding="utf-8") as f:
+            return {row["path"] for row in csv.DictReader(f) if row.get("error") is not None}
+
+    def _drop_partial_row(self, block_size=1 << 16):
+        """Recorta la última fila si una interrupción la dejó sin terminar: esa
+        foto se vuelve a calificar y la fila siguiente no se pega a la cortada"""
+        with open(self.path, "rb+") as f:
+            size = f.seek(0, os.SEEK_END)
+            end = size
+            while end > 0:
+                start = max(0, end - block_size)
+                f.seek(start)
+                newline = f.read(end - start).rfind(b"\n")
+                if newline != -1:
+                    if start + newline + 1 < size:
+                        f.truncate(start + newline + 1)
+                    return
+                end = start
+            f.truncate(0)  # ni el encabezado llegó a escribirse completo
+
+    def write(self, rows):
+        new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        with open(self.path, "a", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=self.columns)
+            if new_file:
+                writer.writeheader()
+            writer.writerows(rows)
+
+
+class ParquetSink:
+    """Una parte Parquet por lote dentro del directorio de salida"""
+
+    def __init__(self, path, columns):
+        import pyarrow  # noqa: F401  (falla temprano si no está instalado)
+        self.path = path
+        self.columns = columns
+        os.makedirs(path, exist_ok=True)
+
+    def _parts(self):
+        return sorted(glob.glob(os.path.join(self.path, "part-*.parquet")))
+
+    def done_paths(self):
+        import pyarrow.parquet as pq
+        done = set()
+        for part in self._parts():
+            done.update(pq.read_table(part, columns=["path"]).column("path").to_pylist())
+        return done
+
+    def write(self, rows):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        # Esquema fijo: una parte con solo errores no debe cambiar los tipos
+        types = {"path": pa.string(), "class_name": pa.string(), "is_cacao": pa.bool_(), "error": pa.string()}
+        schema = pa.schema([(c, types.get(c, pa.float64())) for c in self.columns])
+        table = pa.Table.from_pylist(rows, schema=schema)
+        part = os.path.join(self.path, f"part-{len(self._parts()):06d}.parquet")
+        pq.write_table(table, part + ".tmp")
+        os.replace(part + ".tmp", part)  # una parte a medio escribir nunca queda visible
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="Carpeta con las fotos (se recorre recursivamente)")
+    parser.add_argument("--output", required=True, help="resultados.csv o resultados.parquet")
+    parser.add_argument("--model", default="cacao_resnet101_classifier3.keras")
+    parser.add_argument("--engine", default="keras", choices=["keras", "tflite"])
+    parser.add_argument("--tflite-model", help="Por defecto, el modelo con extensión .tflite")
+    parser.add_argument("--class-names", default="class_names.json")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=16, help="Fotos por tarea de un proceso")
+    parser.add_argument("--prefetch", type=int, default=2, help="Bloques en vuelo por proceso")
+    parser.add_argument("--max-side", type=int, default=WORKING_MAX_SIDE)
+    parser.add_argument("--no-cacao-threshold", type=float, default=70.0)
+    args = parser.parse_args()
+
+    with open(args.class_names) as f:
+        class_names = json.load(f)
+    columns = ["path", "class_name", "confidence", "is_cacao"] + [f"prob_{c}" for c in class_names] + ["error"]
+    sink = ParquetSink(args.output, columns) if args.output.endswith(".parquet") else CsvSink(args.output, columns)
+
+    paths = list_images(args.input)
+    done = sink.done_paths()
+    pending = [path for path in paths if path not in done]
+    print(f"{len(paths)} fotos, {len(done)} ya calificadas, {len(pending)} pendientes")
+    if not pending:
+        return
+
+    from inference import load_engine
+    print(f"Cargando {args.model} ({args.engine})...")
+    engine = load_engine(
+        args.engine,
+        args.model,
+        tflite_path=args.tflite_model or os.path.splitext(args.model)[0] + ".tflite"
+    )
+
+    def flush(images, features, batch_paths, errors):
+        rows = [dict.fromkeys(columns) | {"path": path, "error": error} for path, error in errors]
+        if images:
+            probabilities = np.asarray(engine(np.concatenate(images), np.concatenate(features)))
+            for path, probs in zip(batch_paths, probabilities):
+                idx = int(np.argmax(probs))
+                confidence = float(probs[idx] * 100)
+                row = dict.fromkeys(columns) | {
+                    "path": path,
+                    "class_name": class_names[idx],
+                    "confidence": confidence,
+                    "is_cacao": confidence >= args.no_cacao_threshold,
+                    "error": ""
+                }
+                row.update({f"prob_{c}": float(p) for c, p in zip(class_names, probs)})
+                rows.append(row)
+        sink.write(rows)
+        return len(rows)
+
+    chunks = [pending[i:i + args.chunk_size] for i in range(0, len(pending), args.chunk_size)]
+    max_in_flight = max(1, args.workers * args.prefetch)
+    images, features, batch_paths, errors = [], [], [], []
+    scored = 0
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor(args.workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        in_flight = deque()
+        next_chunk = 0
+        while in_flight or next_chunk < len(chunks):
+            while next_chunk < len(chunks) and len(in_flight) < max_in_flight:
+                in_flight.append(pool.submit(load_chunk, chunks[next_chunk], args.max_side))
+                next_chunk += 1
+
+            for path, result in in_flight.popleft().result():
+                if isinstance(result, ImageProcessingError):
+                    errors.append((path, result.detail))
+                else:
+                    images.append(result[0])
+                    features.append(result[1])
+                    batch_paths.append(path)
+
+            if len(images) >= args.batch_size or (not in_flight and next_chunk >= len(chunks)):
+                scored += flush(images, features, batch_paths, errors)
+                images, features, batch_paths, errors = [], [], [], []
+                elapsed = time.perf_counter() - start
+                print(f"{scored}/{len(pending)} fotos  {scored / elapsed:.1f} fotos/s")
+
+    print(f"Resultados en {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""Genera fotos sintéticas de mazorcas para pruebas de rendimiento y tolerancia."""
+import cv2
+import numpy as np
+
+# Resoluciones típicas de cámaras de campo (ancho, alto)
+RESOLUTIONS = {
+    "vga": (640, 480),
+    "hd": (1280, 960),
+    "5mp": (2592, 1944),
+    "12mp": (4000, 3000)
+}
+
+
+def synthetic_pod(width, height, seed=0, disease=0.3):
+    """Imagen RGB uint8: fondo con textura, mazorca verde/amarilla y manchas oscuras"""
+    rng = np.random.default_rng(seed)
+    image = rng.integers(60, 140, (height, width, 3), dtype=np.uint8)
+    image = cv2.GaussianBlur(image, (0, 0), sigmaX=max(1.0, width / 400))
+
+    center = (int(width * rng.uniform(0.4, 0.6)), int(height * rng.uniform(0.4, 0.6)))
+    axes = (int(width * rng.uniform(0.25, 0.35)), int(height * rng.uniform(0.2, 0.3)))
+    color = (int(rng.integers(40, 200)), int(rng.integers(120, 220)), int(rng.integers(20, 80)))
+    cv2.ellipse(image, center, axes, float(rng.uniform(-30, 30)), 0, 360, color, -1)
+
+    # Manchas de moniliasis de distintos tamaños (muchas por encima del umbral de área)
+    for _ in range(int(rng.integers(5, 40) * disease) + 1):
+        spot_center = (
+            int(center[0] + rng.uniform(-0.8, 0.8) * axes[0]),
+            int(center[1] + rng.uniform(-0.8, 0.8) * axes[1])
+        )
+        radius = int(rng.uniform(0.002, 0.04) * width) + 1
+        shade = int(rng.integers(0, 25))
+        cv2.circle(image, spot_center, radius, (shade, shade, shade), -1)
+
+    noise = rng.normal(0, 6, image.shape)
+    return np.clip(image + noise, 0, 255).astype(np.uint8)
+
+
+def encode_jpeg(image, quality=90):
+    """Codifica un arreglo RGB como JPEG"""
+    ok, buffer = cv2.imencode(".jpg", cv2.cvtColor(image, cv2.COLOR_RGB2BGR), [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise RuntimeError("No se pudo codificar la imagen")
+    return buffer.tobytes()
@@ -0,0 +1,62 @@
+"""Mide hilos y precisión de TensorFlow para el modelo y guarda el mejor ajuste.
+
+Es la misma medición que hace el backend al arrancar con INFERENCE_TUNE=1
+(ver backend/tuning.py), pero por separado: conviene ejecutarla una vez en
+la máquina de destino antes de levantar varios workers, que luego solo leen
+el archivo. Con varios workers, `--workers` reparte las CPUs entre ellos.
+Los valores por defecto de `--workers` (WEB_CONCURRENCY) y `--batch-size`
+(INFERENCE_TUNE_BATCH_SIZE o PREDICT_BATCH_SIZE) salen de las mismas
+variables que usa el servidor: la clave del ajuste incluye las CPUs por
+worker y el lote, y si no coinciden con las del servidor el ajuste no se
+aplica (el servidor lo avisa al arrancar).
+
+Uso (desde la raíz del repositorio):
+
+    python backend/tools/tune_inference.py --batch-size 8 --output inference_tuning.json
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tuning import cpu_budget, save_tuning, tune, tuning_key, web_workers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="cacao_resnet101_classifier3.keras")
+    parser.add_argument("--batch-size", type=int, default=int(os.getenv(
+        "INFERENCE_TUNE_BATCH_SIZE", os.getenv("PREDICT_BATCH_SIZE", "8")
+    )))
+    parser.add_argument("--workers", type=int, default=web_workers(),
+                        help="Workers de uvicorn que comparten la máquina (por defecto WEB_CONCURRENCY)")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--tolerance", type=float, default=0.02,
+                        help="Diferencia máxima de probabilidad aceptada para bfloat16")
+    parser.add_argument("--jit", action="store_true", help="Medir con XLA (INFERENCE_JIT=1)")
+    parser.add_argument("--output", default=os.getenv("INFERENCE_TUNING_PATH", "inference_tuning.json"))
+    args = parser.parse_args()
+
+    budget = cpu_budget(args.workers)
+    result = tune(
+        args.model,
+        args.batch_size,
+        budget,
+        iterations=args.iterations,
+        tolerance=args.tolerance,
+        jit_compile=args.jit
+    )
+    save_tuning(args.output, dict(result, key=tuning_key(args.model, args.batch_size, budget)))
+    print(json.dumps(result["config"]))
+    print(f"Ajuste guardado en {args.output}")
+    if args.workers != web_workers():
+        print(f"Advertencia: medido para {args.workers} workers pero WEB_CONCURRENCY={web_workers()}; "
+              f"el servidor solo aplica el ajuste si arranca con WEB_CONCURRENCY={args.workers}")
+    else:
+        print(f"Se aplica con WEB_CONCURRENCY={args.workers} e INFERENCE_TUNE_BATCH_SIZE={args.batch_size}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""Ajuste automático de hilos y precisión de TensorFlow para la inferencia en CPU.
+
+TensorFlow fija sus pools de hilos (intra-op e inter-op) al ejecutar la
+primera operación, así que cada configuración candidata se mide en un
+proceso nuevo ("spawn"): carga el modelo, lo precalienta y mide lotes del
+tamaño objetivo. Primero se recorre una grilla pequeña de hilos en float32
+y luego, si la CPU tiene instrucciones bfloat16 (AVX512_BF16 o AMX), se
+prueba la mejor con la reescritura bfloat16 de oneDNN; solo se acepta si
+las probabilidades no se alejan más de `tolerance` de las de float32.
+
+El resultado se guarda en JSON junto con una clave (modelo, tamaño de lote,
+CPUs, versión de TensorFlow); en los siguientes arranques se aplica sin
+volver a medir mientras la clave coincida.
+
+Sin TensorFlow a nivel de módulo: se importa dentro de las funciones.
+"""
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+PRECISIONS = ("float32", "bfloat16")
+
+
+def web_workers():
+    """Workers de uvicorn que comparten la máquina (WEB_CONCURRENCY, como Render)"""
+    return int(os.getenv("WEB_CONCURRENCY", "1") or 1)
+
+
+def cpu_budget(workers=None):
+    """CPUs disponibles para este proceso, repartidas entre los workers de
+    uvicorn (WEB_CONCURRENCY) para que no compitan por los mismos núcleos"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    workers = workers or web_workers()
+    return max(1, cpus // max(1, workers))
+
+
+def supports_bfloat16():
+    """True si la CPU tiene instrucciones bfloat16 (AVX512_BF16 o AMX)"""
+    try:
+        with open("/proc/cpuinfo") as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return "avx512_bf16" in flags or "amx_bf16" in flags
+
+
+def thread_grid(budget):
+    """Configuraciones float32 a medir: algunos valores de intra-op con un
+    solo hilo inter-op (ResNet101 es casi secuencial) y el máximo con dos"""
+    intra = sorted({n for n in (1, 2, 4, budget // 2, budget) if 1 <= n <= budget})
+    grid = [{"intra_op_threads": n, "inter_op_threads": 1, "precision": "float32"} for n in intra]
+    if budget > 1:
+        grid.append({"intra_op_threads": budget, "inter_op_threads": 2, "precision": "float32"})
+    return grid
+
+
+def apply_config(config):
+    """Aplica la configuración al runtime de TensorFlow de este proceso.
+
+    Debe llamarse antes de la primera operación (antes de cargar el modelo);
+    después TensorFlow lanza RuntimeError.
+    """
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(config["intra_op_threads"])
+    tf.config.threading.set_inter_op_parallelism_threads(config["inter_op_threads"])
+    if config["precision"] == "bfloat16":
+        # oneDNN reescribe el grafo de tf.function: convoluciones y matmul en
+        # bfloat16, pesos y salidas en float32 (el modelo guardado no cambia)
+        tf.config.optimizer.set_experimental_options({"auto_mixed_precision_onednn_bfloat16": True})
+
+
+def _benchmark(config, model_path, batch_size, iterations, warmup, jit_compile):
+    """Se ejecuta en un proceso nuevo por configuración"""
+    apply_config(config)
+    from inference import IMAGE_SIZE, NUM_FEATURES, load_engine
+
+    engine = load_engine("keras", model_path, jit_compile=jit_compile, batch_buckets=(batch_size,))
+    rng = np.random.default_rng(0)
+    images = rng.uniform(-1, 1, (batch_size, IMAGE_SIZE, IMAGE_SIZE, 3)).astype(np.float32)
+    features = rng.uniform(0, 1, (batch_size, NUM_FEATURES)).astype(np.float32)
+
+    for _ in range(warmup):
+        engine(images, features)
+    times = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        probabilities = engine(images, features)
+        times.append((time.perf_counter() - start) * 1000)
+    return {
+        "p50_ms": float(np.percentile(times, 50)),
+        "p95_ms": float(np.percentile(times, 95)),
+        "probabilities": np.asarray(probabilities)
+    }
+
+
+def tune(model_path, batch_size=8, budget=None, iterations=10, warmup=3, tolerance=0.02,
+         jit_compile=False):
+    """Mide la grilla y devuelve la mejor configuración con el detalle de cada candidata"""
+    budget = budget or cpu_budget()
+    context = multiprocessing.get_context("spawn")
+
+    def measure(config):
+        with ProcessPoolExecutor(1, mp_context=context) as pool:
+            result = pool.submit(
+                _benchmark, config, model_path, batch_size, iterations, warmup, jit_compile
+            ).result()
+        print(f"  intra={config['intra_op_threads']} inter={config['inter_op_threads']} "
+              f"{config['precision']}: p50 {result['p50_ms']:.1f} ms")
+        return result
+
+    print(f"Ajustando la inferencia: lote {batch_size}, {budget} CPU(s)")
+    results = [(config, measure(config)) for config in thread_grid(budget)]
+    best_config, best = min(results, key=lambda item: item[1]["p50_ms"])
+
+    if supports_bfloat16():
+        config = dict(best_config, precision="bfloat16")
+        result = measure(config)
+        result["max_drift"] = float(np.max(np.abs(result["probabilities"] - best["probabilities"])))
+        results.append((config, result))
+        if result["max_drift"] <= tolerance and result["p50_ms"] < best["p50_ms"]:
+            best_config, best = config, result
+
+    return {
+        "config": best_config,
+        "batch_size": batch_size,
+        "p50_ms": best["p50_ms"],
+        "tuned_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "candidates": [
+            dict(config, p50_ms=result["p50_ms"], p95_ms=result["p95_ms"], max_drift=result.get("max_drift"))
+            for config, result in results
+        ]
+    }
+
+
+def tuning_key(model_path, batch_size, budget):
+    """Lo que invalida un ajuste guardado: otro modelo, lote, CPUs o TensorFlow"""
+    import tensorflow as tf
+    stat = os.stat(model_path)
+    return {
+        "model": os.path.basename(model_path),
+        "model_size": stat.st_size,
+        "model_mtime": int(stat.st_mtime),
+        "batch_size": batch_size,
+        "cpus": budget,
+        "tensorflow": tf.__version__
+    }
+
+
+def load_tuning(path, key):
+    """Ajuste guardado en `path` si su clave coincide con `key`. Si el archivo
+    existe pero no coincide se avisa qué cambió: de otro modo el servidor
+    usaría en silencio los valores por defecto de TensorFlow"""
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        print(f"Advertencia: no se pudo leer el ajuste de inferencia {path}: {str(e)}")
+        return None
+    saved = data.get("key") or {}
+    if saved != key:
+        differences = ", ".join(
+            f"{name} {saved.get(name)!r} en el archivo y {value!r} aquí"
+            for name, value in key.items() if saved.get(name) != value
+        )
+        print(f"Advertencia: el ajuste de inferencia {path} no corresponde a este proceso "
+              f"({differences}); se usan los valores por defecto de TensorFlow")
+        return None
+    return data
+
+
+def save_tuning(path, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def configure(model_path, path, batch_size=8, tune_if_missing=False, jit_compile=False):
+    """Aplica el ajuste guardado en `path` o, con `tune_if_missing`, mide y lo
+    guarda. Devuelve lo aplicado (para /health) o None si se usan los valores
+    por defecto de TensorFlow."""
+    budget = cpu_budget()
+    key = tuning_key(model_path, batch_size, budget)
+    data = load_tuning(path, key)
+    source = "file"
+    if data is None:
+        if not tune_if_missing:
+            return None
+        data = dict(tune(model_path, batch_size, budget, jit_compile=jit_compile), key=key)
+        save_tuning(path, data)
+        source = "tuned"
+
+    try:
+        apply_config(data["config"])
+    except RuntimeError as e:
+        # El runtime ya estaba inicializado (recarga del modelo en el mismo proceso)
+        print(f"No se pudo aplicar el ajuste de inferencia: {str(e)}")
+        return None
+    print(f"Ajuste de inferencia ({source}): {data['config']}")
+    return {
+        "source": source,
+        "path": path,
+        "config": data["config"],
+        "batch_size": data["batch_size"],
+        "p50_ms": data["p50_ms"],
+        "tuned_at": data["tuned_at"]
+    }
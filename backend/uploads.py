@@ -0,0 +1,53 @@
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+
+
+def format_size(size):
+    """Tamaño legible con un decimal (10 MB, 1.5 MB, 512 KB, 300 bytes)"""
+    for unit, scale in (("MB", 1024 * 1024), ("KB", 1024)):
+        if size >= scale:
+            return f"{size / scale:.1f}".removesuffix(".0") + f" {unit}"
+    return f"{size} bytes"
+
+
+def too_large_detail(limit):
+    return f"El archivo supera el límite de {format_size(limit)}"
+
+
+class UploadLimitMiddleware:
+    """Middleware ASGI que limita los bytes del cuerpo según la ruta.
+
+    Si Content-Length ya supera el límite se responde 413 sin leer el
+    cuerpo; si no se conoce (transferencia chunked) o miente, la subida se
+    corta con 413 en cuanto lo recibido pasa el límite, antes de que el
+    parser multipart termine de guardarla.
+    """
+
+    def __init__(self, app, limits):
+        self.app = app
+        self.limits = dict(limits)
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope.get("path")) if scope["type"] == "http" else None
+        if not limit:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope["headers"]).get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > limit:
+            response = JSONResponse({"detail": too_large_detail(limit)}, status_code=413)
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise HTTPException(status_code=413, detail=too_large_detail(limit))
+            return message
+
+        await self.app(scope, limited_receive, send)
@@ -0,0 +1,92 @@
+import asyncio
+import ctypes
+import gc
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+
+class WorkerPool:
+    """Ejecuta trabajo bloqueante fuera del event loop con concurrencia acotada.
+
+    Con `use_processes=True` se usa un pool de procesos (contexto "spawn",
+    seguro junto a TensorFlow); las funciones enviadas deben ser de nivel de
+    módulo y sus argumentos y resultados serializables con pickle.
+    """
+
+    def __init__(self, name, workers, max_concurrency=None, use_processes=False):
+        self.name = name
+        self.workers = max(1, int(workers))
+        self.max_concurrency = max(1, int(max_concurrency or self.workers))
+        self.use_processes = use_processes
+
+        if use_processes:
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        else:
+            self.executor = ThreadPoolExecutor(
+                max_workers=self.workers,
+                thread_name_prefix=name
+            )
+
+        self._semaphore = None
+        self.in_flight = 0
+
+    async def run(self, fn, *args):
+        """Ejecuta fn(*args) en el pool sin bloquear el event loop"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async with self._semaphore:
+            self.in_flight += 1
+            try:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self.executor, fn, *args)
+            finally:
+                self.in_flight -= 1
+
+    def status(self):
+        return {
+            "kind": "process" if self.use_processes else "thread",
+            "workers": self.workers,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight
+        }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def process_memory():
+    """Memoria residente (RSS) actual y máxima del proceso, en bytes.
+
+    Se lee de /proc/self/status (Linux); en otros sistemas solo se conoce
+    el máximo a través de `resource`.
+    """
+    memory = {"pid": os.getpid(), "rss_bytes": None, "peak_rss_bytes": None}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    memory["rss_bytes"] = int(line.split()[1]) * 1024
+                elif line.startswith("VmHWM:"):
+                    memory["peak_rss_bytes"] = int(line.split()[1]) * 1024
+    except OSError:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss está en KB en Linux y en bytes en macOS
+        memory["peak_rss_bytes"] = peak if sys.platform == "darwin" else peak * 1024
+    return memory
+
+
+def release_memory():
+    """Recolecta la basura y devuelve al sistema operativo la memoria libre
+    del heap de glibc (malloc_trim); en otros sistemas solo recolecta"""
+    gc.collect()
+    try:
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass